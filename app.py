@@ -1,36 +1,122 @@
+import os
+import queue
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
-import time
-from llm_core.agent_builder import build_agent  # Import the agent builder function
+from llama_index.core import Settings
+from llm_core.agent_builder import add_pdf_tool, agent_tools, answer_deltas, build_agent  # Import the agent builder function
+from llm_core.folder_watcher import WATCH_FOLDERS, FolderWatcher
+from llm_core.conversation_memory import ConversationMemory
+from llm_core.llm_setup import groq_llm
 
-# Initialize history as a list of dictionaries
-history = []
+# Keep the conversation within a token budget per turn
+memory = ConversationMemory(llm=groq_llm, embed_model=Settings.embed_model)
 
+# Tk widgets may only be used from the main thread. Worker threads post
+# (event, args) messages here, and the main loop applies them every few ms.
+ui_queue = queue.Queue()
+UI_POLL_MS = 30
 
-def add_to_history(prompt, response):
-    history.append({"prompt": prompt, "response": response})
-    if len(history) > 5:
-        history.pop(0)
+# Agent turns run one at a time on a single worker thread
+agent_tasks = queue.Queue()
+agent = None
 
 
-def get_relevant_history():
-    return "\n".join(
-        [
-            f"Prompt: {entry['prompt']}\nResponse: {entry['response']}"
-            for entry in history
-        ]
-    )
+def post(event, *args):
+    """Sends an update to the UI from any thread."""
+    ui_queue.put((event, args))
+
+
+def process_ui_queue():
+    try:
+        while True:
+            event, args = ui_queue.get_nowait()
+            UI_HANDLERS[event](*args)
+    except queue.Empty:
+        pass
+    root.after(UI_POLL_MS, process_ui_queue)
+
+
+def agent_worker():
+    while True:
+        task = agent_tasks.get()
+        task()
 
 
-def show_loading_bar():
-    loading_label.config(text="Loading, please wait...")
+def show_busy(text):
+    loading_label.config(text=text)
+    progress_bar.config(mode="indeterminate")
     progress_bar.start(10)
-    root.update_idletasks()
-    time.sleep(2)
+
+
+def show_progress(text, done, total):
+    loading_label.config(text=text)
+    progress_bar.stop()
+    progress_bar.config(mode="determinate", maximum=max(total, 1), value=done)
+
+
+def show_idle():
     progress_bar.stop()
+    progress_bar.config(mode="determinate", value=0)
     loading_label.config(text="")
-    progress_bar.pack_forget()
+
+
+def on_agent_ready():
+    show_idle()
+    enable_interface()
+
+
+def on_bot_start():
+    chat_text.insert(tk.END, "Bot: ", "bot")
+
+
+def on_token(delta):
+    chat_text.insert(tk.END, delta, "bot")
+    chat_text.see(tk.END)
+
+
+def on_turn_done():
+    chat_text.insert(tk.END, "\n", "bot")
+    chat_text.see(tk.END)
+    submit_button.config(state=tk.NORMAL)
+
+
+def on_error(message):
+    chat_text.insert(tk.END, f"{message}\n", "error")
+    chat_text.see(tk.END)
+
+
+def on_pdf_added(file_name, tool_name):
+    show_idle()
+    add_pdf_button.config(state=tk.NORMAL)
+    chat_text.insert(tk.END, f"Added {file_name} as {tool_name}.\n", "info")
+
+
+def on_notice(message):
+    chat_text.insert(tk.END, f"{message}\n", "info")
+    chat_text.see(tk.END)
+
+
+def on_pdf_failed(message):
+    show_idle()
+    add_pdf_button.config(state=tk.NORMAL)
+    messagebox.showerror("PDF not added", message)
+
+
+def index_pdf(file_path):
+    file_name = os.path.basename(file_path)
+    post("busy", f"Parsing {file_name}...")
+    try:
+        tool = add_pdf_tool(
+            agent,
+            file_path,
+            progress=lambda done, total: post(
+                "progress", f"Indexing {file_name}: {done}/{total}", done, total
+            ),
+        )
+        post("pdf_added", file_name, tool.metadata.name)
+    except Exception as e:
+        post("pdf_failed", f"Could not add {file_name}: {e}")
 
 
 def add_pdf():
@@ -38,24 +124,43 @@ def add_pdf():
         filetypes=[("PDF files", "*.pdf")], title="Select a PDF file"
     )
     if file_path:
-        messagebox.showinfo("PDF Added", f"Added PDF: {file_path}")
-
-
-def submit_prompt():
+        # Index in the background; chatting continues meanwhile
+        add_pdf_button.config(state=tk.DISABLED)
+        threading.Thread(target=index_pdf, args=(file_path,), daemon=True).start()
+
+
+def run_turn(prompt):
+    try:
+        # The prompt carries the history, so the agent starts each turn empty
+        agent.reset()
+        response = agent.stream_chat(memory.build_prompt(prompt))
+        post("bot_start")
+        text = ""
+        for delta in answer_deltas(iter(response.response_gen)):
+            text += delta
+            post("token", delta)
+        memory.add(prompt, text)
+    except Exception as e:
+        post("error", f"An error occurred while answering: {e}")
+    finally:
+        post("turn_done")
+
+
+def submit_prompt(event=None):
     prompt = prompt_entry.get()
-    if prompt.strip():
+    if prompt.strip() and str(submit_button["state"]) == tk.NORMAL:
         chat_text.insert(tk.END, f"User: {prompt}\n", "user")
-        relevant_history = get_relevant_history()
-        result = agent.query(
-            f"Here is the relevant history:\n{relevant_history}\n\nNew prompt: {prompt}"
-        )
-        add_to_history(prompt, result)
-        chat_text.insert(tk.END, f"Bot: {result}\n", "bot")
         prompt_entry.delete(0, tk.END)
+        submit_button.config(state=tk.DISABLED)
+        agent_tasks.put(lambda: run_turn(prompt))
 
 
 def clear_chat():
     chat_text.delete(1.0, tk.END)
+    memory.clear()
+    if agent is not None:
+        # On the agent thread, so a running turn is not cut short
+        agent_tasks.put(agent.reset)
 
 
 def on_hover(event, widget, color):
@@ -80,12 +185,34 @@ def enable_interface():
     submit_button.config(state=tk.NORMAL)
 
 
-def build_agent_thread():
+def load_agent():
     global agent
-    disable_interface()
-    show_loading_bar()
-    agent = build_agent()  # Build the agent
-    enable_interface()
+    post("busy", "Loading, please wait...")
+    try:
+        agent = build_agent()  # Build the agent
+    except Exception as e:
+        post("error", f"An error occurred while setting up the agent: {e}")
+        post("idle")
+        return
+    if WATCH_FOLDERS:
+        # Files dropped into the data folders are added without a restart
+        FolderWatcher(agent_tools(agent), on_change=lambda message: post("notice", message)).start()
+    post("agent_ready")
+
+
+UI_HANDLERS = {
+    "busy": show_busy,
+    "progress": show_progress,
+    "idle": show_idle,
+    "agent_ready": on_agent_ready,
+    "bot_start": on_bot_start,
+    "token": on_token,
+    "turn_done": on_turn_done,
+    "error": on_error,
+    "pdf_added": on_pdf_added,
+    "pdf_failed": on_pdf_failed,
+    "notice": on_notice,
+}
 
 
 def create_main_window():
@@ -119,11 +246,14 @@ def create_main_window():
     chat_text.pack(expand=True, fill=tk.BOTH)
     chat_text.tag_config("user", foreground="#7289da")
     chat_text.tag_config("bot", foreground="#43b581")
+    chat_text.tag_config("info", foreground="#99aab5")
+    chat_text.tag_config("error", foreground="#f04747")
 
     prompt_entry = tk.Entry(
         root, width=50, bg="#40444b", fg="#ffffff", insertbackground="#ffffff", bd=0
     )
     prompt_entry.pack(fill=tk.X, padx=10, pady=5)
+    prompt_entry.bind("<Return>", submit_prompt)
 
     button_frame = tk.Frame(root, bg="#2c2f33")
     button_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -154,8 +284,11 @@ def create_main_window():
     submit_button.bind("<Enter>", lambda e: on_hover(e, submit_button, "#5b6eae"))
     submit_button.bind("<Leave>", lambda e: on_leave(e, submit_button, "#7289da"))
 
-    # Start the agent building process in a separate thread
-    threading.Thread(target=build_agent_thread).start()
+    # Build the agent on the worker thread, which then runs the turns
+    disable_interface()
+    threading.Thread(target=agent_worker, daemon=True).start()
+    agent_tasks.put(load_agent)
+    root.after(UI_POLL_MS, process_ui_queue)
 
     root.mainloop()
 
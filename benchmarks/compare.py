@@ -0,0 +1,101 @@
+"""
+Compares two benchmark result files and flags regressions.
+
+Usage:
+    python -m benchmarks.compare baseline.json results.json [--threshold 0.2]
+
+Exits with status 1 if any metric got worse by more than the threshold.
+"""
+
+import argparse
+import json
+import sys
+
+
+def flatten(results, prefix=""):
+    """
+    Flattens nested results into dotted metric names. Lists of measurements are
+    keyed by their size field (nodes, rows), so runs with the same sizes line up.
+    """
+    metrics = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            if key == "meta":
+                continue
+            metrics.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(results, list):
+        for i, item in enumerate(results):
+            size = next(
+                (f"{k}={item[k]}" for k in ("nodes", "rows") if k in item), str(i)
+            )
+            metrics.update(flatten(item, f"{prefix}{size}."))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        metrics[prefix.rstrip(".")] = results
+    return metrics
+
+
+def higher_is_better(name):
+    return name.endswith("_per_s")
+
+
+def is_timing(name):
+    return name.endswith(("_ms", "_s"))
+
+
+def compare(baseline, current, threshold):
+    """
+    Returns one row per timing metric present in both runs, with the relative
+    change and whether it is a regression beyond the threshold.
+    """
+    base = flatten(baseline)
+    new = flatten(current)
+    rows = []
+    for name in sorted(set(base) & set(new)):
+        if not is_timing(name) or not base[name]:
+            continue
+        change = (new[name] - base[name]) / base[name]
+        worse = -change if higher_is_better(name) else change
+        rows.append(
+            {
+                "metric": name,
+                "baseline": base[name],
+                "current": new[name],
+                "change": change,
+                "regression": worse > threshold,
+            }
+        )
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="Allowed relative slowdown."
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    width = max([len(row["metric"]) for row in rows] + [6])
+    print(f"{'metric':<{width}}  {'baseline':>12}  {'current':>12}  {'change':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['metric']:<{width}}  {row['baseline']:>12.4f}  "
+            f"{row['current']:>12.4f}  {row['change']:>+7.1%}{flag}"
+        )
+
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import os
+import random
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+
+WORDS = (
+    "population economy climate province river forest mining energy export "
+    "census policy health education transport railway harbour winter summer "
+    "agriculture wheat fishery language culture history treaty parliament "
+    "election budget tax trade border coast mountain lake city village"
+).split()
+
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    """Returns a sentence-like text of random vocabulary words."""
+    text = []
+    for i in range(words):
+        text.append(rng.choice(WORDS))
+        if i % 12 == 11:
+            text[-1] += "."
+    return " ".join(text)
+
+
+def _pdf_string(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: List[str]):
+    """
+    Writes a minimal PDF with one line of Helvetica text per page. Enough for
+    the PDF readers to extract the text, without a PDF library.
+    """
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))), len(pages)
+        ),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 10 Tf 36 750 Td ({_pdf_string(text)}) Tj ET"
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(data))
+        data += f"{i + 1} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        data += f"{offset:010d} 00000 n \n".encode()
+    data += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n"
+    ).encode()
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def write_pdf_corpus(folder: str, files: int, pages: int, seed: int = 0) -> List[str]:
+    """Writes files synthetic PDFs of the given page count and returns their paths."""
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        path = os.path.join(folder, f"doc_{i:04d}.pdf")
+        write_pdf(path, [synthetic_text(rng, 120) for _ in range(pages)])
+        paths.append(path)
+    return paths
+
+
+def synthetic_dataframe(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Returns a population-style table with numeric and categorical columns."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "country": rng.choice([f"country_{i}" for i in range(200)], rows),
+            "region": rng.choice(["Africa", "Asia", "Europe", "Americas", "Oceania"], rows),
+            "year": rng.integers(1950, 2024, rows),
+            "population": rng.integers(10_000, 1_500_000_000, rows),
+            "growth_rate": rng.normal(1.0, 0.8, rows).round(3),
+            "density": rng.gamma(2.0, 80.0, rows).round(1),
+        }
+    )
+
+
+def write_csv_corpus(folder: str, files: int, rows: int, seed: int = 0) -> List[str]:
+    """Writes files synthetic CSV tables and returns their paths."""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(files):
+        path = os.path.join(folder, f"table_{i:02d}.csv")
+        synthetic_dataframe(rows, seed + i).to_csv(path, index=False)
+        paths.append(path)
+    return paths
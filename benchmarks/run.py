@@ -0,0 +1,280 @@
+"""
+Offline benchmarks for ingestion, retrieval, CSV queries and agent turns.
+
+Runs without network access: the LLM is a deterministic stand-in and the
+embedder is a hashed bag of words, so the numbers measure this code rather than
+the Groq API or the embedding model. Everything is written under a temporary
+working directory.
+
+Usage:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.compare baseline.json results.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+
+def configure_environment(workdir: str):
+    """Points every cache at the working directory and disables the real models."""
+    os.environ["MODEL_SETUP"] = "none"
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.sqlite")
+    os.environ["DESCRIPTION_CACHE_PATH"] = os.path.join(workdir, "description_cache.sqlite")
+    os.environ["LLM_CACHE_PATH"] = ""
+
+
+def summarize(samples_ms):
+    """Returns the percentiles of a list of latencies in milliseconds."""
+    ordered = sorted(samples_ms)
+
+    def percentile(p):
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    """Calls fn with its output silenced and returns (result, elapsed seconds)."""
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def bench_ingestion(workdir, files, pages, workers):
+    from benchmarks.corpus import write_pdf_corpus
+    from engines_factory.index_manifest import IndexManifest
+    from engines_factory.pdf_ingestion import build_pdf_indexes
+
+    folder = os.path.join(workdir, "ingestion")
+    pdf_paths = write_pdf_corpus(folder, files, pages, seed=1)
+    index_names = [os.path.join(folder, f"index_{i:04d}") for i in range(files)]
+    # Kept in the working directory, away from the manifest of the real indexes
+    manifest_path = os.path.join(workdir, "index_manifest.json")
+    _, cold = timed(
+        build_pdf_indexes, pdf_paths, index_names, workers=workers,
+        manifest=IndexManifest(manifest_path),
+    )
+    _, warm = timed(
+        build_pdf_indexes, pdf_paths, index_names, workers=workers,
+        manifest=IndexManifest.load(manifest_path),
+    )
+    return {
+        "files": files,
+        "pages_per_file": pages,
+        "workers": workers,
+        "cold_s": cold,
+        "cold_files_per_s": files / cold,
+        "cold_pages_per_s": files * pages / cold,
+        "warm_s": warm,
+    }
+
+
+def bench_retrieval(workdir, sizes, queries, top_k, ann_nlist=None, nprobe_values=None):
+    from llama_index.core import Settings, VectorStoreIndex
+    from llama_index.core.schema import TextNode
+
+    import random
+    import numpy as np
+    from benchmarks.corpus import synthetic_text
+    from engines_factory.ivf_index import ann_recall_report, default_nlist
+    from engines_factory.mmap_vector_store import MmapVectorStore, new_storage_context
+    from engines_factory.pdf_ingestion import load_index
+
+    rng = random.Random(2)
+    questions = [synthetic_text(rng, 8) for _ in range(queries)]
+    results = []
+    for size in sizes:
+        texts = [synthetic_text(rng, 60) for _ in range(size)]
+        embeddings = Settings.embed_model.get_text_embedding_batch(texts)
+        nodes = [
+            TextNode(text=text, embedding=embedding)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        persist_dir = os.path.join(workdir, f"retrieval_{size}")
+        index = VectorStoreIndex(nodes=nodes, storage_context=new_storage_context())
+        _, persist = timed(index.storage_context.persist, persist_dir=persist_dir)
+        index, load = timed(load_index, persist_dir)
+
+        retriever = index.as_retriever(similarity_top_k=top_k)
+        retriever.retrieve(questions[0])
+        samples = []
+        for question in questions:
+            started = time.perf_counter()
+            retriever.retrieve(question)
+            samples.append((time.perf_counter() - started) * 1000)
+
+        # Recall and latency of the approximate search for each nprobe, to
+        # choose ANN_NLIST and ANN_NPROBE with data
+        nlist = ann_nlist or default_nlist(size)
+        ann_store = MmapVectorStore(ann_nlist=nlist)
+        ann_store.add(nodes)
+        ann_store.persist(
+            os.path.join(workdir, f"ann_{size}", "default__vector_store.json")
+        )
+        query_vectors = np.asarray(
+            [Settings.embed_model.get_query_embedding(q) for q in questions]
+        )
+        ann = ann_recall_report(
+            ann_store,
+            queries=query_vectors,
+            top_k=top_k,
+            nprobe_values=nprobe_values or [n for n in (1, 2, 4, 8, 16, 32) if n <= nlist],
+        )
+        results.append(
+            {
+                "nodes": size,
+                "persist_s": persist,
+                "load_s": load,
+                **summarize(samples),
+                "ann_nlist": nlist,
+                "ann": ann,
+            }
+        )
+    return results
+
+
+def bench_csv(row_counts, queries):
+    from llama_index.experimental.query_engine import PandasQueryEngine
+
+    from benchmarks.corpus import synthetic_dataframe
+    from llm_core.prompts_setup import new_prompt
+
+    results = []
+    for rows in row_counts:
+        df = synthetic_dataframe(rows)
+        query_engine, build = timed(PandasQueryEngine, df=df)
+        query_engine.update_prompts({"pandas_prompt": new_prompt})
+        samples = []
+        for _ in range(queries):
+            _, elapsed = timed(query_engine.query, "Describe the population column.")
+            samples.append(elapsed * 1000)
+        results.append({"rows": rows, "build_s": build, **summarize(samples)})
+    return results
+
+
+def bench_agent(workdir, pdf_files, pages, csv_files, csv_rows, turns):
+    from benchmarks.corpus import write_csv_corpus, write_pdf_corpus
+    from llm_core.agent_builder import build_agent
+
+    data_folder = os.path.join(workdir, "agent_data")
+    write_pdf_corpus(os.path.join(data_folder, "pdf"), pdf_files, pages, seed=3)
+    write_csv_corpus(os.path.join(data_folder, "csv"), csv_files, csv_rows, seed=3)
+
+    # Indexes are persisted relative to the working directory
+    os.makedirs(os.path.join(workdir, "agent_indexes"), exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(os.path.join(workdir, "agent_indexes"))
+    try:
+        _, cold = timed(build_agent, data_folder=data_folder)
+        agent, warm = timed(build_agent, data_folder=data_folder)
+
+        samples = []
+        for _ in range(turns):
+            agent.reset()
+            _, elapsed = timed(agent.query, "What are the key points of the documents?")
+            samples.append(elapsed * 1000)
+    finally:
+        os.chdir(cwd)
+    return {
+        "pdf_files": pdf_files,
+        "csv_files": csv_files,
+        "build_agent_cold_s": cold,
+        "build_agent_warm_s": warm,
+        "turns": summarize(samples),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(",") if size]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--pdf-files", type=int, default=20)
+    parser.add_argument("--pdf-pages", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--retrieval-sizes", type=parse_sizes, default=[1000, 10000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--ann-nlist", type=int, default=None)
+    parser.add_argument("--ann-nprobe", type=parse_sizes, default=None)
+    parser.add_argument("--csv-rows", type=parse_sizes, default=[1000, 100000])
+    parser.add_argument("--agent-turns", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--keep-workdir", action="store_true")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    configure_environment(workdir)
+
+    from benchmarks.stubs import HashEmbedding, StubLLM
+    from llm_core.embedding_cache import CachedEmbedding
+    from llm_core.llm_setup import use_models
+
+    use_models(
+        StubLLM(latency_ms=args.llm_latency_ms),
+        CachedEmbedding(embed_model=HashEmbedding()),
+    )
+
+    output = os.path.abspath(args.output)
+    try:
+        results = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "commit": git_commit(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "args": {k: v for k, v in vars(args).items() if k != "output"},
+            },
+            "ingestion": bench_ingestion(
+                workdir, args.pdf_files, args.pdf_pages, args.workers
+            ),
+            "retrieval": bench_retrieval(
+                workdir, args.retrieval_sizes, args.queries, args.top_k,
+                args.ann_nlist, args.ann_nprobe,
+            ),
+            "csv": bench_csv(args.csv_rows, max(1, args.queries // 10)),
+            "agent": bench_agent(
+                workdir, args.pdf_files, args.pdf_pages, 2, 1000, args.agent_turns
+            ),
+        }
+    finally:
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Benchmark results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
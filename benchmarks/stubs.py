@@ -0,0 +1,101 @@
+import hashlib
+import json
+import re
+import time
+from typing import Any, Iterator, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+
+TOOL_NAME_PATTERN = re.compile(r"> Tool Name: (\S+)")
+
+
+class StubLLM(CustomLLM):
+    """
+    A deterministic stand-in for GroqLLM. It recognises the prompts the agent
+    sends and answers in the expected format: the ReAct agent calls one tool
+    and then answers, the pandas engine gets a cheap expression, and every
+    other prompt gets a short fixed reply. latency_ms simulates a network call.
+    """
+
+    context_window: int = 32768
+    num_output: int = 4096
+    model_name: str = "stub"
+    latency_ms: float = 0.0
+    preferred_tool_prefix: str = "pdf_data"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.num_output,
+            model_name=self.model_name,
+        )
+
+    def _answer(self, prompt: str) -> str:
+        if "You have access to the following tools" in prompt:
+            # The system header shows the format once; more means a tool has run
+            if prompt.count("Observation:") > 1:
+                return (
+                    "Thought: I can answer without using any more tools.\n"
+                    "Answer: The documents cover the requested topic."
+                )
+            tool_names = TOOL_NAME_PATTERN.findall(prompt)
+            preferred = [n for n in tool_names if n.startswith(self.preferred_tool_prefix)]
+            tool_name = (preferred or tool_names or ["unknown"])[0]
+            return (
+                "Thought: I need to use a tool to help me answer the question.\n"
+                f"Action: {tool_name}\n"
+                f"Action Input: {json.dumps({'input': 'key points'})}"
+            )
+        if "pandas dataframe" in prompt:
+            return "df.describe()"
+        return "A short summary of the document."
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, **kwargs: Any) -> CompletionResponse:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return CompletionResponse(text=self._answer(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, **kwargs: Any) -> Iterator[CompletionResponse]:
+        text = self.complete(prompt).text
+        yield CompletionResponse(text=text, delta=text)
+
+
+class HashEmbedding(BaseEmbedding):
+    """
+    A small deterministic embedder: a hashed bag of words, normalized to unit
+    length. Texts sharing words get similar vectors, so retrieval behaves
+    plausibly without a model download.
+    """
+
+    dim: int = 256
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
@@ -0,0 +1,220 @@
+import logging
+import math
+import os
+import re
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import MetadataMode
+
+
+logger = logging.getLogger(__name__)
+BM25_FILE_NAME = "bm25_index.npz"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Identifiers such as "s.12", "ON-3" or "table_4/b" are kept whole as well as split
+TOKEN_PATTERN = re.compile(r"\w+(?:[./\-]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases a text and splits it into word tokens. A compound identifier
+    yields the whole identifier followed by its parts, so a query for "s.12"
+    matches it exactly while "12" still matches it loosely.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[./\-]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def bm25_index_path(persist_dir: str) -> str:
+    """Returns the path of the BM25 index stored next to an index's vector store."""
+    return os.path.join(persist_dir, BM25_FILE_NAME)
+
+
+def _pack_strings(strings: Sequence[str]) -> np.ndarray:
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack_strings(packed: np.ndarray) -> List[str]:
+    text = packed.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+class BM25Index:
+    """
+    A compact inverted index over the chunks of an index, scored with Okapi
+    BM25. The postings of all terms are stored in two flat arrays, addressed
+    through a per-term offset array, so the index loads as a handful of numpy
+    arrays rather than one object per posting.
+    """
+
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        node_ids: List[str],
+    ):
+        self.terms = terms
+        self.term_ids: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.node_ids = node_ids
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @property
+    def count(self) -> int:
+        """The number of chunks in the index."""
+        return len(self.node_ids)
+
+    @classmethod
+    def build(cls, node_ids: Sequence[str], texts: Sequence[str]) -> "BM25Index":
+        """
+        Builds the index from the texts of the chunks.
+
+        Args:
+            node_ids (Sequence[str]): The node id of each chunk.
+            texts (Sequence[str]): The text of each chunk.
+
+        Returns:
+            BM25Index: The built index.
+        """
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for doc_id, text in enumerate(texts):
+            counts: Dict[str, int] = {}
+            for token in tokenize(text):
+                counts[token] = counts.get(token, 0) + 1
+            doc_lengths[doc_id] = sum(counts.values())
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((doc_id, count))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        term_freqs = np.empty(offsets[-1], dtype=np.int32)
+        for i, term in enumerate(terms):
+            entries = np.asarray(postings[term], dtype=np.int32)
+            doc_ids[offsets[i] : offsets[i + 1]] = entries[:, 0]
+            term_freqs[offsets[i] : offsets[i + 1]] = entries[:, 1]
+        return cls(terms, offsets, doc_ids, term_freqs, doc_lengths, list(node_ids))
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Returns the best matching chunks for a query.
+
+        Args:
+            query (str): The query text.
+            top_k (int): The number of chunks to return.
+
+        Returns:
+            List[Tuple[str, float]]: The node id and BM25 score of each match,
+                best first. Chunks sharing no term with the query are left out.
+        """
+        if not self.count:
+            return []
+        scores = np.zeros(self.count, dtype=np.float32)
+        length_norm = BM25_K1 * (
+            1 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_length, 1e-9)
+        )
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            doc_ids = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end]
+            idf = math.log(1 + (self.count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            scores[doc_ids] += idf * freqs * (BM25_K1 + 1) / (freqs + length_norm[doc_ids])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.node_ids[i], float(scores[i])) for i in matched]
+
+    def save(self, path: str):
+        """Writes the index to a .npz file."""
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                terms=_pack_strings(self.terms),
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                term_freqs=self.term_freqs,
+                doc_lengths=self.doc_lengths,
+                node_ids=_pack_strings(self.node_ids),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Reads an index written by save."""
+        with np.load(path) as data:
+            return cls(
+                _unpack_strings(data["terms"]),
+                data["offsets"],
+                data["doc_ids"],
+                data["term_freqs"],
+                data["doc_lengths"],
+                _unpack_strings(data["node_ids"]),
+            )
+
+
+def _index_node_ids(index: VectorStoreIndex) -> List[str]:
+    return list(index.index_struct.nodes_dict.values())
+
+
+def build_bm25_index(index: VectorStoreIndex, persist_dir: str) -> BM25Index:
+    """
+    Builds the BM25 index of a vector index's chunks from its docstore and
+    persists it next to the vector store.
+
+    Args:
+        index (VectorStoreIndex): The vector index.
+        persist_dir (str): The directory the vector index is persisted to.
+
+    Returns:
+        BM25Index: The built index.
+    """
+    node_ids = _index_node_ids(index)
+    nodes = index.docstore.get_nodes(node_ids)
+    bm25_index = BM25Index.build(
+        node_ids, [node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes]
+    )
+    bm25_index.save(bm25_index_path(persist_dir))
+    return bm25_index
+
+
+def load_bm25_index(index: VectorStoreIndex, persist_dir: str) -> BM25Index:
+    """
+    Loads the BM25 index persisted next to a vector index. Indexes persisted
+    before BM25 was added, or whose chunks no longer match, are rebuilt once.
+
+    Args:
+        index (VectorStoreIndex): The vector index.
+        persist_dir (str): The directory the vector index is persisted to.
+
+    Returns:
+        BM25Index: The loaded index.
+    """
+    path = bm25_index_path(persist_dir)
+    if os.path.exists(path):
+        try:
+            bm25_index = BM25Index.load(path)
+            if set(bm25_index.node_ids) == set(_index_node_ids(index)):
+                return bm25_index
+        except Exception as e:
+            logger.error(f"Failed to load BM25 index {path}. Error was {e}")
+    logger.info(f"Building BM25 index for {persist_dir}")
+    return build_bm25_index(index, persist_dir)
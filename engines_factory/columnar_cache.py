@@ -0,0 +1,328 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from engines_factory.index_manifest import IndexManifest
+
+
+logger = logging.getLogger(__name__)
+CSV_CACHE_DIR = "csv_cache"
+# Version 2 checks integer chunks of columns promoted to float for float32 precision
+CSV_CACHE_VERSION = 2
+CHUNK_ROWS = 1_000_000
+META_FILE = "meta.json"
+
+# Column kinds, from the most to the least specific; a column takes the least
+# specific kind seen in any chunk
+KINDS = ["bool", "int", "float", "category"]
+
+
+def _chunk_kind(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series):
+        return "bool"
+    if pd.api.types.is_integer_dtype(series):
+        return "int"
+    if pd.api.types.is_float_dtype(series):
+        return "float"
+    return "category"
+
+
+def _smallest_int(low: int, high: int) -> np.dtype:
+    """Returns the smallest signed integer type holding every value in [low, high]."""
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _float32_lossless(values: np.ndarray) -> bool:
+    if values.dtype.kind in "iu":
+        # Integers above 2**24 lose digits in float32
+        return np.array_equal(values.astype(np.float32).astype(values.dtype), values)
+    return np.array_equal(
+        values.astype(np.float32).astype(np.float64), values, equal_nan=True
+    )
+
+
+def column_values(values: np.ndarray, column: Dict) -> np.ndarray:
+    """
+    Widens the stored values of a column to the dtype pandas reads the CSV
+    with: int64, float64, or object for text. The narrow types only save disk
+    space and page reads; arithmetic on them in generated code would overflow
+    or lose precision, and categoricals would show up in printed answers.
+
+    Args:
+        values (np.ndarray): The stored values or codes of the column.
+        column (Dict): The column entry of the cache metadata.
+
+    Returns:
+        np.ndarray: The values as pandas would read them.
+    """
+    kind = column["kind"]
+    if kind == "category":
+        # Missing values have code -1, which picks the trailing NaN
+        categories = np.array(column["categories"] + [np.nan], dtype=object)
+        return categories[np.asarray(values)]
+    if kind == "int":
+        return np.asarray(values, dtype=np.int64)
+    if kind == "float":
+        return np.asarray(values, dtype=np.float64)
+    return np.asarray(values)
+
+
+def _scan(csv_path: str, chunk_rows: int) -> Dict:
+    """
+    First pass over a CSV: infers the kind, value range and float precision of
+    every column chunk by chunk, so the whole file is never in memory.
+    """
+    columns = {}
+    rows = 0
+    memory = 0
+    started = time.perf_counter()
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        rows += len(chunk)
+        memory += int(chunk.memory_usage(deep=True).sum())
+        for name in chunk.columns:
+            series = chunk[name]
+            stats = columns.setdefault(
+                name, {"kind": "bool", "min": 0, "max": 0, "float32": True}
+            )
+            kind = _chunk_kind(series)
+            if KINDS.index(kind) > KINDS.index(stats["kind"]):
+                stats["kind"] = kind
+            if kind == "int" and len(series):
+                stats["min"] = min(stats["min"], int(series.min()))
+                stats["max"] = max(stats["max"], int(series.max()))
+                # Checked too, in case another chunk promotes the column to float
+                stats["float32"] = stats["float32"] and _float32_lossless(
+                    series.to_numpy(dtype=np.int64)
+                )
+            elif kind == "float":
+                stats["float32"] = stats["float32"] and _float32_lossless(
+                    series.to_numpy(dtype=np.float64)
+                )
+    return {
+        "columns": columns,
+        "rows": rows,
+        "csv_load_s": time.perf_counter() - started,
+        "csv_memory_bytes": memory,
+    }
+
+
+def _target_dtype(stats: Dict) -> np.dtype:
+    kind = stats["kind"]
+    if kind == "bool":
+        return np.dtype(bool)
+    if kind == "int":
+        return _smallest_int(stats["min"], stats["max"])
+    if kind == "float":
+        return np.dtype(np.float32 if stats["float32"] else np.float64)
+    # Category codes are written as int32 and narrowed once the categories are known
+    return np.dtype(np.int32)
+
+
+def convert_csv(csv_path: str, target_dir: str, chunk_rows: int = CHUNK_ROWS) -> Dict:
+    """
+    Converts a CSV file into one .npy file per column, with integer and float
+    columns downcast to the smallest lossless type and text columns stored as
+    category codes. The narrow types are only used on disk; see column_values.
+    The file is read twice in chunks, never as a whole.
+
+    Args:
+        csv_path (str): The CSV file to convert.
+        target_dir (str): The directory the columns are written to.
+        chunk_rows (int): The number of rows read at a time.
+
+    Returns:
+        Dict: The metadata written next to the columns.
+    """
+    scan = _scan(csv_path, chunk_rows)
+    rows = scan["rows"]
+    names = list(scan["columns"])
+    dtypes = {name: _target_dtype(scan["columns"][name]) for name in names}
+    category_columns = [n for n in names if scan["columns"][n]["kind"] == "category"]
+
+    tmp_dir = f"{target_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    arrays = {
+        name: np.lib.format.open_memmap(
+            os.path.join(tmp_dir, f"{i}.npy"), mode="w+", dtype=dtypes[name], shape=(rows,)
+        )
+        for i, name in enumerate(names)
+    }
+
+    # Codes are assigned in order of first appearance, so no pass needs every value
+    categories = {name: {} for name in category_columns}
+    offset = 0
+    reader = pd.read_csv(
+        csv_path, chunksize=chunk_rows, dtype={name: str for name in category_columns}
+    )
+    for chunk in reader:
+        end = offset + len(chunk)
+        for name in names:
+            series = chunk[name]
+            if name in categories:
+                codes_of = categories[name]
+                chunk_codes, uniques = pd.factorize(series)
+                # Missing values have code -1, which picks the trailing -1
+                mapping = np.array(
+                    [codes_of.setdefault(value, len(codes_of)) for value in uniques]
+                    + [-1],
+                    dtype=np.int32,
+                )
+                arrays[name][offset:end] = mapping[chunk_codes]
+            else:
+                arrays[name][offset:end] = series.to_numpy(dtype=dtypes[name])
+        offset = end
+
+    columns = []
+    for i, name in enumerate(names):
+        arrays[name].flush()
+        column = {"name": name, "file": f"{i}.npy", "kind": scan["columns"][name]["kind"]}
+        if name in categories:
+            # Sort the categories, so sorting the column still sorts by value,
+            # and narrow the codes to the smallest type that fits
+            values = list(categories[name])
+            order = sorted(range(len(values)), key=values.__getitem__)
+            remap = np.empty(len(values) + 1, dtype=np.int64)
+            remap[order] = np.arange(len(values))
+            remap[-1] = -1
+            narrow = _smallest_int(-1, len(values))
+            path = os.path.join(tmp_dir, column["file"])
+            codes = np.load(path, mmap_mode="r")
+            sorted_codes = remap[codes].astype(narrow)
+            del codes
+            np.save(path, sorted_codes)
+            column["categories"] = [values[i] for i in order]
+        columns.append(column)
+    del arrays
+
+    meta = {
+        "version": CSV_CACHE_VERSION,
+        "source": csv_path,
+        "rows": rows,
+        "columns": columns,
+        "csv_load_s": scan["csv_load_s"],
+        "csv_memory_bytes": scan["csv_memory_bytes"],
+    }
+    with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    shutil.rmtree(target_dir, ignore_errors=True)
+    os.replace(tmp_dir, target_dir)
+    return meta
+
+
+def load_columnar(target_dir: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Loads a converted CSV as a DataFrame with the dtypes pd.read_csv gives it.
+    Columns stored as int64 or float64 are memory mapped copy-on-write, so
+    only the pages that are read are loaded and writes never reach the cache;
+    narrower columns are widened in memory.
+
+    Args:
+        target_dir (str): The directory written by convert_csv.
+        columns (List[str], optional): The columns to load. Defaults to all.
+
+    Returns:
+        pd.DataFrame: The table.
+    """
+    with open(os.path.join(target_dir, META_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    data = {}
+    for column in meta["columns"]:
+        if columns is not None and column["name"] not in columns:
+            continue
+        values = np.load(os.path.join(target_dir, column["file"]), mmap_mode="c")
+        data[column["name"]] = column_values(values, column)
+    return pd.DataFrame(data, copy=False)
+
+
+class CsvColumnarCache:
+    """
+    A cache of CSV files converted to columnar binary form, keyed by the content
+    hash of each file. The first load of a file converts it; later loads map the
+    columns from disk. The manifest reuses a file's hash while its size and
+    modification time are unchanged, so a warm start does not re-read the CSV.
+    """
+
+    def __init__(self, cache_dir: str = CSV_CACHE_DIR, chunk_rows: int = CHUNK_ROWS):
+        self.cache_dir = cache_dir
+        self.chunk_rows = chunk_rows
+        self.manifest = IndexManifest.load(os.path.join(cache_dir, "manifest.json"))
+        self.reports: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def convert(self, csv_path: str) -> Tuple[str, bool]:
+        """
+        Converts a CSV file unless it is already cached and unchanged.
+
+        Args:
+            csv_path (str): The CSV file.
+
+        Returns:
+            Tuple[str, bool]: The directory holding the columns, and whether the
+            file was converted by this call.
+        """
+        entry_name = os.path.abspath(csv_path)
+        settings = {"csv_cache_version": CSV_CACHE_VERSION}
+        # Lazy tools may load several files at once; the manifest is shared
+        with self._lock:
+            source_hash = self.manifest.source_hash(entry_name, csv_path)
+            target_dir = os.path.join(self.cache_dir, source_hash)
+            if self.manifest.is_current(entry_name, source_hash, settings, target_dir):
+                return target_dir, False
+            logger.info(f"Converting {csv_path} to the columnar cache")
+            previous = self.manifest.entries.get(entry_name)
+            convert_csv(csv_path, target_dir, self.chunk_rows)
+            if previous and previous.get("sha256") != source_hash:
+                shutil.rmtree(
+                    os.path.join(self.cache_dir, previous["sha256"]),
+                    ignore_errors=True,
+                )
+            self.manifest.record(entry_name, csv_path, source_hash, settings)
+            self.manifest.save()
+            return target_dir, True
+
+    def load(self, csv_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Returns the table of a CSV file, converting it first if it is not cached
+        or has changed.
+
+        Args:
+            csv_path (str): The CSV file.
+            columns (List[str], optional): The columns to load. Defaults to all.
+
+        Returns:
+            pd.DataFrame: The table.
+        """
+        target_dir, converted = self.convert(csv_path)
+        started = time.perf_counter()
+        df = load_columnar(target_dir, columns)
+        load_s = time.perf_counter() - started
+        self.reports.append(self._report(csv_path, target_dir, df, load_s, converted))
+        return df
+
+    def _report(self, csv_path, target_dir, df, load_s, converted) -> Dict:
+        with open(os.path.join(target_dir, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        memory = int(df.memory_usage(deep=True).sum())
+        csv_memory = meta["csv_memory_bytes"]
+        return {
+            "file": csv_path,
+            "rows": meta["rows"],
+            "converted": converted,
+            "csv_load_s": meta["csv_load_s"],
+            "cache_load_s": load_s,
+            "csv_memory_bytes": csv_memory,
+            "cache_memory_bytes": memory,
+            "memory_saved": 1 - memory / csv_memory if csv_memory else 0.0,
+        }
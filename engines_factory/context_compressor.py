@@ -0,0 +1,185 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from llm_core.rate_limiter import estimate_tokens
+
+
+logger = logging.getLogger(__name__)
+# Opt in: over budget it trims the retrieved context and embeds every sentence
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "false").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+# Lines up to this length that repeat are taken for page headers and footers
+HEADER_MAX_CHARS = 120
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _normalize(text).split()
+    return {tuple(words[i : i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+class ContextCompressor(BaseNodePostprocessor):
+    """
+    Shrinks the retrieved chunks before they are sent to the LLM. Chunks that
+    mostly repeat a better ranked one are dropped, repeated lines such as page
+    headers and footers and the overlap between neighbouring chunks are kept
+    once, and when the rest exceeds the token budget only the sentences most
+    similar to the query are kept, in their original order.
+
+    The tokens saved are logged per query and summed in stats().
+
+    Args:
+        embed_model (BaseEmbedding, optional): Scores the sentences. Defaults
+            to Settings.embed_model.
+        token_budget (int): The most context tokens passed on.
+        duplicate_threshold (float): The share of a chunk's word trigrams found
+            in a kept chunk above which it is dropped.
+    """
+
+    embed_model: Optional[BaseEmbedding] = Field(default=None, exclude=True)
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+    duplicate_threshold: float = CONTEXT_DUPLICATE_THRESHOLD
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: Dict[str, int] = PrivateAttr(
+        default_factory=lambda: {"queries": 0, "tokens_in": 0, "tokens_out": 0}
+    )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextCompressor"
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the queries compressed and the context tokens before and after."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["tokens_saved"] = stats["tokens_in"] - stats["tokens_out"]
+        return stats
+
+    def _drop_duplicate_chunks(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        kept, kept_shingles = [], []
+        for node in nodes:
+            shingles = _shingles(node.node.get_content())
+            if any(
+                len(shingles & other) / len(shingles) >= self.duplicate_threshold
+                for other in kept_shingles
+            ):
+                continue
+            kept.append(node)
+            kept_shingles.append(shingles)
+        return kept
+
+    def _split_sentences(self, nodes: List[NodeWithScore]) -> List[List[str]]:
+        """Splits each chunk into sentences, skipping the lines and sentences seen before."""
+        seen_lines = set()
+        seen_sentences = set()
+        sentences = []
+        for node in nodes:
+            lines = []
+            for line in node.node.get_content().splitlines():
+                key = _normalize(line)
+                if not key:
+                    continue
+                if len(line) <= HEADER_MAX_CHARS:
+                    if key in seen_lines:
+                        continue
+                    seen_lines.add(key)
+                lines.append(line.strip())
+
+            node_sentences = []
+            for j, sentence in enumerate(SENTENCE_BREAK.split(" ".join(lines))):
+                key = _normalize(sentence)
+                if not key or key in seen_sentences:
+                    continue
+                # A chunk overlapping the one before may start mid-sentence, with
+                # the end of a sentence already kept
+                if j == 0 and any(f" {seen}".endswith(f" {key}") for seen in seen_sentences):
+                    continue
+                seen_sentences.add(key)
+                node_sentences.append(sentence.strip())
+            sentences.append(node_sentences)
+        return sentences
+
+    def _select(self, sentences: List[List[str]], query_bundle: QueryBundle) -> set:
+        """Returns the (chunk, sentence) positions that fit the budget, most relevant first."""
+        positions = [(i, j) for i, chunk in enumerate(sentences) for j in range(len(chunk))]
+        embed_model = self.embed_model or Settings.embed_model
+        query_embedding = query_bundle.embedding or embed_model.get_query_embedding(
+            query_bundle.query_str
+        )
+        vectors = np.asarray(
+            embed_model.get_text_embedding_batch([sentences[i][j] for i, j in positions]),
+            dtype=np.float32,
+        )
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+        scores = vectors @ query_vector / np.where(norms == 0, 1.0, norms)
+
+        selected = set()
+        remaining = self.token_budget
+        for position in np.argsort(-scores, kind="stable"):
+            i, j = positions[position]
+            tokens = estimate_tokens(sentences[i][j])
+            if tokens <= remaining:
+                selected.add((i, j))
+                remaining -= tokens
+        return selected
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if not nodes:
+            return nodes
+        tokens_in = sum(estimate_tokens(node.node.get_content()) for node in nodes)
+
+        nodes = self._drop_duplicate_chunks(nodes)
+        sentences = self._split_sentences(nodes)
+        total = sum(estimate_tokens(sentence) for chunk in sentences for sentence in chunk)
+        if total > self.token_budget and query_bundle is not None:
+            selected = self._select(sentences, query_bundle)
+        else:
+            selected = {(i, j) for i, chunk in enumerate(sentences) for j in range(len(chunk))}
+
+        compressed = []
+        for i, node in enumerate(nodes):
+            kept = [j for j in range(len(sentences[i])) if (i, j) in selected]
+            if not kept:
+                continue
+            # Gaps between kept sentences are marked, so they are not read as one passage
+            text = sentences[i][kept[0]]
+            for previous, j in zip(kept, kept[1:]):
+                text += (" " if j == previous + 1 else " ... ") + sentences[i][j]
+            new_node = node.node.model_copy()
+            new_node.set_content(text)
+            compressed.append(NodeWithScore(node=new_node, score=node.score))
+
+        tokens_out = sum(estimate_tokens(node.node.get_content()) for node in compressed)
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["tokens_in"] += tokens_in
+            self._stats["tokens_out"] += tokens_out
+        logger.info(
+            f"Compressed the context from {tokens_in} to {tokens_out} tokens "
+            f"({tokens_in - tokens_out} saved)"
+        )
+        return compressed
+
+
+# Shared by the PDF query engines, so stats() covers all PDF tools
+pdf_context_compressor = ContextCompressor()
@@ -0,0 +1,193 @@
+import logging
+import os
+from typing import Callable, List, Optional
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters
+
+from engines_factory.index_manifest import IndexManifest, current_index_settings
+from engines_factory.mmap_vector_store import ANN_NLIST, new_storage_context
+from engines_factory.pdf_ingestion import (
+    EMBED_BATCH_SIZE,
+    embed_nodes_batched,
+    index_lock,
+    iter_parsed_pdfs,
+    load_index,
+)
+
+
+logger = logging.getLogger(__name__)
+CORPUS_INDEX_NAME = "pdf_corpus"
+HIDDEN_METADATA_KEYS = ["file_hash"]
+
+
+def corpus_entry_name(index_name: str, file_name: str) -> str:
+    """Returns the manifest key of a file stored in a corpus index."""
+    return f"{index_name}/{file_name}"
+
+
+def tag_corpus_nodes(nodes: List, file_name: str, file_hash: str):
+    """
+    Tags nodes with the source file, page and file hash used for filtering. The
+    hash is kept out of the embedded and LLM-visible text.
+
+    Args:
+        nodes (List[BaseNode]): The nodes of one file.
+        file_name (str): The name of the source file.
+        file_hash (str): The content hash of the source file.
+    """
+    for node in nodes:
+        node.metadata["file_name"] = file_name
+        node.metadata.setdefault("page_label", None)
+        node.metadata["file_hash"] = file_hash
+        for key in HIDDEN_METADATA_KEYS:
+            if key not in node.excluded_embed_metadata_keys:
+                node.excluded_embed_metadata_keys.append(key)
+            if key not in node.excluded_llm_metadata_keys:
+                node.excluded_llm_metadata_keys.append(key)
+
+
+def delete_corpus_file(index: VectorStoreIndex, file_name: str):
+    """
+    Deletes all nodes of a source file from a corpus index.
+
+    Args:
+        index (VectorStoreIndex): The corpus index.
+        file_name (str): The name of the source file to remove.
+    """
+    for ref_doc_id, ref_doc_info in list(index.ref_doc_info.items()):
+        if ref_doc_info.metadata.get("file_name") == file_name:
+            index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+
+
+def build_corpus_index(
+    pdf_paths: List[str],
+    index_name: str = CORPUS_INDEX_NAME,
+    workers: int = 1,
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    manifest: Optional[IndexManifest] = None,
+    ann_nlist: Optional[int] = ANN_NLIST,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> VectorStoreIndex:
+    """
+    Loads or builds a single index shared by all PDFs. Every node is tagged with
+    its source file, page and file hash. The index is updated incrementally:
+    only new or changed files are parsed and embedded, and the nodes of changed
+    or removed files are deleted.
+
+    Args:
+        pdf_paths (List[str]): The PDF files the corpus should contain.
+        index_name (str): The directory the corpus index is persisted to.
+        workers (int): The number of processes used to parse the PDFs.
+        embed_batch_size (int): The number of chunks embedded per batch.
+        manifest (IndexManifest, optional): The manifest to check and update.
+            Loaded from disk when not given.
+        ann_nlist (int, optional): The approximate nearest-neighbour setting of
+            the corpus; see MmapVectorStore. Defaults to ANN_NLIST. None keeps
+            the stored setting, or uses the automatic one for a new corpus.
+        progress (Callable[[int, int], None], optional): Called after each
+            embedding batch with the chunks of the file embedded so far and
+            their total.
+
+    Returns:
+        VectorStoreIndex: The corpus index.
+    """
+    # The folder watcher and the app may both update the corpus
+    with index_lock(index_name):
+        return _build_corpus_index(
+            pdf_paths, index_name, workers, embed_batch_size, manifest, ann_nlist, progress
+        )
+
+
+def _build_corpus_index(
+    pdf_paths, index_name, workers, embed_batch_size, manifest, ann_nlist, progress
+):
+    manifest = manifest or IndexManifest.load()
+    settings = current_index_settings()
+    prefix = corpus_entry_name(index_name, "")
+    recorded = {
+        key[len(prefix) :]: entry
+        for key, entry in manifest.entries.items()
+        if key.startswith(prefix)
+    }
+
+    # The stored corpus is only reusable if it was built with the same settings
+    index = None
+    if os.path.isdir(index_name) and all(
+        entry.get("settings") == settings for entry in recorded.values()
+    ):
+        try:
+            index = load_index(index_name)
+        except Exception as e:
+            logger.error(f"Failed to load corpus index {index_name}. Error was {e}")
+    if index is None:
+        for file_name in recorded:
+            manifest.forget(corpus_entry_name(index_name, file_name))
+        recorded = {}
+        index = VectorStoreIndex(
+            nodes=[], storage_context=new_storage_context(ann_nlist=ann_nlist)
+        )
+    ann_changed = ann_nlist is not None and index.vector_store.ann_nlist != ann_nlist
+    if ann_changed:
+        index.vector_store.configure_ann(ann_nlist)
+
+    stale = []
+    file_names = set()
+    for pdf_path in pdf_paths:
+        file_name = os.path.basename(pdf_path)
+        file_names.add(file_name)
+        entry_name = corpus_entry_name(index_name, file_name)
+        source_hash = manifest.source_hash(entry_name, pdf_path)
+        if not manifest.is_current(entry_name, source_hash, settings, index_name):
+            stale.append((pdf_path, file_name, source_hash))
+
+    removed = [file_name for file_name in recorded if file_name not in file_names]
+    if not stale and not removed and not ann_changed:
+        return index
+
+    for file_name in removed:
+        logger.info(f"Removing {file_name} from corpus index {index_name}")
+        delete_corpus_file(index, file_name)
+        manifest.forget(corpus_entry_name(index_name, file_name))
+
+    parsed = iter_parsed_pdfs([pdf_path for pdf_path, _, _ in stale], workers=workers)
+    for (pdf_path, file_name, source_hash), (_, nodes) in zip(stale, parsed):
+        if nodes is None:
+            continue
+        try:
+            logger.info(f"Adding {file_name} to corpus index {index_name}")
+            tag_corpus_nodes(nodes, file_name, source_hash)
+            embed_nodes_batched(nodes, embed_batch_size, progress)
+            delete_corpus_file(index, file_name)
+            index.insert_nodes(nodes)
+            manifest.record(
+                corpus_entry_name(index_name, file_name), pdf_path, source_hash, settings
+            )
+        except Exception as e:
+            logger.error(f"Failed to add {pdf_path} to the corpus. Error was {e}")
+
+    index.storage_context.persist(persist_dir=index_name)
+    manifest.save()
+    return index
+
+
+def get_corpus_query_engine(
+    index: VectorStoreIndex, file_name: Optional[str] = None, **kwargs
+):
+    """
+    Returns a query engine over the corpus index, optionally restricted to the
+    nodes of a single source file.
+
+    Args:
+        index (VectorStoreIndex): The corpus index.
+        file_name (str, optional): The source file to restrict retrieval to.
+        **kwargs: Extra arguments passed to index.as_query_engine.
+
+    Returns:
+        BaseQueryEngine: The query engine.
+    """
+    if file_name:
+        kwargs["filters"] = MetadataFilters(
+            filters=[ExactMatchFilter(key="file_name", value=file_name)]
+        )
+    return index.as_query_engine(**kwargs)
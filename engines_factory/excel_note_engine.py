@@ -1,13 +1,155 @@
+import atexit
 from datetime import datetime
+import json
 import logging
 import os
+import threading
 
+from filelock import FileLock
 from llama_index.core.tools import FunctionTool
 import openpyxl
 
 
 logger = logging.getLogger()
 excel_note_file = os.path.join("data", "notes.xlsx")
+NOTE_FLUSH_INTERVAL = float(os.getenv("NOTE_FLUSH_INTERVAL", "5"))
+NOTE_FLUSH_ROWS = int(os.getenv("NOTE_FLUSH_ROWS", "100"))
+
+
+class ExcelNoteSink:
+    """
+    Appends notes to an Excel workbook without rewriting it for every note.
+    Each note is first appended to a write-ahead log next to the workbook and
+    synced to disk, so it survives a crash. A background thread then moves the
+    logged notes into the workbook in one save, every flush_interval seconds or
+    as soon as flush_rows notes are waiting. A file lock serializes writers
+    across processes, so concurrent sessions never overwrite each other's rows.
+
+    Args:
+        excel_note_file (str): The workbook the notes end up in.
+        flush_interval (float): The longest time a note waits in the log.
+        flush_rows (int): The number of waiting notes that triggers a flush.
+    """
+
+    def __init__(
+        self,
+        excel_note_file=excel_note_file,
+        flush_interval=NOTE_FLUSH_INTERVAL,
+        flush_rows=NOTE_FLUSH_ROWS,
+    ):
+        self.excel_note_file = excel_note_file
+        self.log_file = f"{excel_note_file}.wal"
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+
+        # The file lock is held by one thread at a time, the thread lock orders threads
+        directory = os.path.dirname(excel_note_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file_lock = FileLock(f"{excel_note_file}.lock")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, note_text):
+        """Logs a note durably; it reaches the workbook on the next flush."""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        line = json.dumps([timestamp, note_text]) + "\n"
+        with self._lock, self._file_lock:
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending += 1
+            if self._pending >= self.flush_rows:
+                self._wake.set()
+
+    def _read_log(self):
+        if not os.path.exists(self.log_file):
+            return []
+        rows = []
+        with open(self.log_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A write cut short by a crash; the note was never acknowledged
+                    logger.warning(f"Skipping a partial note in {self.log_file}")
+        return rows
+
+    def flush(self):
+        """
+        Moves every logged note, including those of other processes, into the
+        workbook in a single save.
+
+        Returns:
+            int: The number of notes written to the workbook.
+        """
+        with self._lock, self._file_lock:
+            rows = self._read_log()
+            if rows:
+                if os.path.exists(self.excel_note_file):
+                    wb = openpyxl.load_workbook(self.excel_note_file)
+                    ws = wb["Notes"]
+                else:
+                    wb = openpyxl.Workbook()
+                    ws = wb.active
+                    ws.title = "Notes"
+                for row in rows:
+                    ws.append(row)
+
+                # Save next to the workbook and swap it in, so a crash never
+                # leaves a half-written workbook; the log is only cleared after
+                temp_file = f"{self.excel_note_file}.tmp.xlsx"
+                wb.save(temp_file)
+                os.replace(temp_file, self.excel_note_file)
+            if os.path.exists(self.log_file):
+                os.remove(self.log_file)
+            self._pending = 0
+            self._wake.clear()
+        if rows:
+            logger.info(f"Flushed {len(rows)} notes to {self.excel_note_file}")
+        return len(rows)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            if self._stopped.is_set():
+                break
+            try:
+                # Other processes may have logged notes, so check the log itself
+                if self._pending or os.path.exists(self.log_file):
+                    self.flush()
+            except Exception:
+                logger.exception(f"Failed to flush notes to {self.excel_note_file}")
+
+    def close(self):
+        """Stops the background thread and flushes the remaining notes."""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join()
+        if self._pending or os.path.exists(self.log_file):
+            self.flush()
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_note_sink(excel_note_file=excel_note_file):
+    """Returns the note sink of a workbook, starting it on first use."""
+    path = os.path.abspath(excel_note_file)
+    with _sinks_lock:
+        if path not in _sinks:
+            _sinks[path] = ExcelNoteSink(excel_note_file)
+        return _sinks[path]
+
 
 def save_excel_note(note, excel_note_file=excel_note_file):
     print("Saving note to Excel:", note)
@@ -20,34 +162,8 @@ def save_excel_note(note, excel_note_file=excel_note_file):
         else:
             note_text = note
 
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(excel_note_file), exist_ok=True)
-
-        # Make sure the Excel file exists
-        if not os.path.exists(excel_note_file):
-            # Create a new Excel file if it does not exist
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Notes"
-            wb.save(excel_note_file)
-
-        # Load the workbook and worksheet
-        wb = openpyxl.load_workbook(excel_note_file)
-        ws = wb["Notes"]
-
-        # Get the current date and time
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        # Create a new row with the timestamp and note
-        new_row = [timestamp, note_text]
-        row_num = ws.max_row + 1
-
-        # Add the note to the Excel file
-        for i, cell_value in enumerate(new_row, start=1):
-            ws.cell(row=row_num, column=i).value = cell_value
-
-        # Save the changes
-        wb.save(excel_note_file)
+        # Log the note; it is added to the workbook in the background
+        get_note_sink(excel_note_file).append(note_text)
 
         print("Successfully saved the note to", excel_note_file)
         return "note saved"
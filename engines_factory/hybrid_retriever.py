@@ -0,0 +1,118 @@
+import logging
+import os
+from typing import Dict, List, Sequence
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from engines_factory.bm25_index import BM25Index, load_bm25_index
+from engines_factory.context_compressor import CONTEXT_COMPRESSION, pdf_context_compressor
+
+
+logger = logging.getLogger(__name__)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+# The chunks passed to the LLM per query, and the candidates each side contributes
+HYBRID_TOP_K = int(os.getenv("HYBRID_TOP_K", "2"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> Dict[str, float]:
+    """
+    Fuses ranked lists of node ids by reciprocal rank: each list adds
+    1 / (k + rank) to the score of every id it contains. Ranks are used rather
+    than scores, so BM25 and cosine scores need no common scale.
+
+    Args:
+        rankings (Sequence[Sequence[str]]): The node ids of each ranking, best first.
+        k (int): Damps the weight of the top ranks; 60 is the usual value.
+
+    Returns:
+        Dict[str, float]: The fused score of each node id.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, start=1):
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves chunks by both dense-vector similarity and BM25 keyword scores,
+    and fuses the two rankings by reciprocal rank. Exact identifiers that the
+    embedding blurs, such as statute numbers or codes, are found by BM25, so
+    fewer chunks are needed to cover a query.
+
+    Args:
+        index (VectorStoreIndex): The vector index to retrieve from.
+        bm25_index (BM25Index): The BM25 index over the same chunks.
+        similarity_top_k (int): The number of fused chunks returned.
+        candidates (int): The number of chunks each ranking contributes.
+    """
+
+    def __init__(
+        self,
+        index: VectorStoreIndex,
+        bm25_index: BM25Index,
+        similarity_top_k: int = HYBRID_TOP_K,
+        candidates: int = HYBRID_CANDIDATES,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._index = index
+        self._bm25_index = bm25_index
+        self._similarity_top_k = similarity_top_k
+        self._vector_retriever = index.as_retriever(
+            similarity_top_k=max(candidates, similarity_top_k)
+        )
+        self._candidates = max(candidates, similarity_top_k)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        vector_results = self._vector_retriever.retrieve(query_bundle)
+        keyword_results = self._bm25_index.search(query_bundle.query_str, self._candidates)
+
+        fused = reciprocal_rank_fusion(
+            [
+                [result.node.node_id for result in vector_results],
+                [node_id for node_id, _ in keyword_results],
+            ]
+        )
+        best = sorted(fused, key=lambda node_id: -fused[node_id])[: self._similarity_top_k]
+
+        nodes = {result.node.node_id: result.node for result in vector_results}
+        missing = [node_id for node_id in best if node_id not in nodes]
+        if missing:
+            for node in self._index.docstore.get_nodes(missing):
+                nodes[node.node_id] = node
+        return [NodeWithScore(node=nodes[node_id], score=fused[node_id]) for node_id in best]
+
+
+def create_pdf_query_engine(index: VectorStoreIndex, persist_dir: str, **kwargs):
+    """
+    Returns the query engine of a persisted PDF index. With HYBRID_SEARCH it
+    retrieves through a HybridRetriever over the BM25 index stored next to the
+    vector store; otherwise it is index.as_query_engine(). With
+    CONTEXT_COMPRESSION the retrieved chunks pass through the shared
+    ContextCompressor before synthesis.
+
+    Args:
+        index (VectorStoreIndex): The PDF index.
+        persist_dir (str): The directory the index is persisted to.
+        **kwargs: Passed on to the query engine.
+
+    Returns:
+        BaseQueryEngine: The query engine.
+    """
+    if CONTEXT_COMPRESSION:
+        kwargs.setdefault("node_postprocessors", [pdf_context_compressor])
+    if not HYBRID_SEARCH:
+        return index.as_query_engine(**kwargs)
+    try:
+        retriever = HybridRetriever(index, load_bm25_index(index, persist_dir))
+    except Exception as e:
+        logger.error(f"Falling back to vector search for {persist_dir}. Error was {e}")
+        return index.as_query_engine(**kwargs)
+    return RetrieverQueryEngine.from_args(retriever, **kwargs)
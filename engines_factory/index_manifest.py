@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+from llama_index.core import Settings
+
+
+logger = logging.getLogger(__name__)
+MANIFEST_FILE = "index_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Computes the SHA-256 hex digest of a file, reading it in chunks.
+
+    Args:
+        file_path (str): The path to the file to hash.
+        chunk_size (int): The number of bytes read per chunk.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def current_index_settings() -> Dict:
+    """
+    Returns the parser and embedding settings that an index built now would use.
+    Two indexes built from the same file are only interchangeable when these match.
+
+    Returns:
+        Dict: A JSON-serializable description of the active settings.
+    """
+    node_parser = Settings.node_parser
+    embed_model = Settings.embed_model
+    return {
+        "manifest_version": MANIFEST_VERSION,
+        "node_parser": type(node_parser).__name__,
+        "chunk_size": getattr(node_parser, "chunk_size", None),
+        "chunk_overlap": getattr(node_parser, "chunk_overlap", None),
+        "embed_model": getattr(embed_model, "model_name", type(embed_model).__name__),
+    }
+
+
+class IndexManifest:
+    """
+    A persisted record of which source file, content hash and settings each
+    index directory was built from. It lets callers reuse a stored index without
+    parsing its source, and detect when a source file has changed.
+    """
+
+    def __init__(self, path: str = MANIFEST_FILE, entries: Optional[Dict] = None):
+        self.path = path
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, path: str = MANIFEST_FILE) -> "IndexManifest":
+        """
+        Loads the manifest from disk. A missing or unreadable manifest yields an
+        empty one, which simply makes every index look stale.
+        """
+        if not os.path.exists(path):
+            return cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable index manifest {path}. Error was {e}")
+            entries = {}
+        return cls(path, entries)
+
+    def save(self):
+        """Writes the manifest atomically so a crash never leaves it half written."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def source_hash(self, index_name: str, source_file: str) -> str:
+        """
+        Returns the content hash of a source file. When the file size and
+        modification time match the recorded entry, the recorded hash is reused
+        instead of reading the file again.
+        """
+        stat = os.stat(source_file)
+        entry = self.entries.get(index_name)
+        if (
+            entry
+            and entry.get("size") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns
+        ):
+            return entry["sha256"]
+        return file_sha256(source_file)
+
+    def is_current(
+        self,
+        index_name: str,
+        source_hash: str,
+        settings: Dict,
+        persist_dir: Optional[str] = None,
+    ) -> bool:
+        """
+        Checks whether the stored index was built from a file with the given hash
+        using the given settings, and that its directory still exists. The
+        directory defaults to the index name; entries that share one directory,
+        like the files of a corpus index, pass it explicitly.
+        """
+        entry = self.entries.get(index_name)
+        return (
+            entry is not None
+            and entry.get("sha256") == source_hash
+            and entry.get("settings") == settings
+            and os.path.isdir(persist_dir or index_name)
+        )
+
+    def record(
+        self, index_name: str, source_file: str, source_hash: str, settings: Dict
+    ):
+        """Records that an index has been built from the given source file."""
+        stat = os.stat(source_file)
+        self.entries[index_name] = {
+            "source": source_file,
+            "sha256": source_hash,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "settings": settings,
+        }
+
+    def forget(self, index_name: str):
+        """Removes the entry of an index, if any."""
+        self.entries.pop(index_name, None)
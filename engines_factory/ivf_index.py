@@ -0,0 +1,213 @@
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+DEFAULT_NPROBE = 8
+TRAINING_POINTS_PER_LIST = 256
+ASSIGN_CHUNK_ROWS = 65536
+
+
+def default_nlist(count: int) -> int:
+    """Returns the usual number of inverted lists for a corpus size, about 4*sqrt(n)."""
+    return max(1, int(4 * np.sqrt(count)))
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Returns the nearest centroid of each row, computed in bounded chunks."""
+    assignments = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), ASSIGN_CHUNK_ROWS):
+        chunk = np.asarray(matrix[start : start + ASSIGN_CHUNK_ROWS])
+        assignments[start : start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """
+    An inverted-file approximate nearest-neighbour index over unit-length
+    vectors. Rows are clustered with spherical k-means; a query only scores the
+    rows in the nprobe lists whose centroids are closest to it. Raising nprobe
+    trades speed for recall.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        order: np.ndarray,
+        offsets: np.ndarray,
+        trained_count: Optional[int] = None,
+    ):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.trained_count = len(order) if trained_count is None else trained_count
+
+    @property
+    def count(self) -> int:
+        """The number of rows the index covers."""
+        return len(self.order)
+
+    @classmethod
+    def _from_assignments(
+        cls, centroids: np.ndarray, assignments: np.ndarray, trained_count: int
+    ) -> "IVFIndex":
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        offsets = np.searchsorted(
+            assignments[order], np.arange(len(centroids) + 1)
+        ).astype(np.int64)
+        return cls(centroids, order, offsets, trained_count)
+
+    def assignments(self) -> np.ndarray:
+        """Returns the list of each row."""
+        assignments = np.empty(self.count, dtype=np.int32)
+        assignments[self.order] = np.repeat(
+            np.arange(len(self.centroids), dtype=np.int32), np.diff(self.offsets)
+        )
+        return assignments
+
+    @classmethod
+    def build(
+        cls,
+        matrix: np.ndarray,
+        nlist: Optional[int] = None,
+        iterations: int = 10,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """
+        Clusters the rows of a unit-length matrix into inverted lists.
+
+        Args:
+            matrix (np.ndarray): The (n, d) matrix of unit-length vectors.
+            nlist (int, optional): The number of lists. Defaults to default_nlist(n).
+            iterations (int): The number of k-means iterations.
+            seed (int): The random seed, so builds are reproducible.
+
+        Returns:
+            IVFIndex: The built index.
+        """
+        count = len(matrix)
+        nlist = min(nlist or default_nlist(count), count)
+        rng = np.random.default_rng(seed)
+
+        # Train on a sample; assigning every row happens once at the end
+        sample_size = min(count, nlist * TRAINING_POINTS_PER_LIST)
+        sample = np.asarray(matrix[np.sort(rng.choice(count, sample_size, replace=False))])
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            centroids[~empty] = sums[~empty] / norms[~empty]
+
+        centroids = centroids.astype(np.float32)
+        return cls._from_assignments(centroids, _assign(matrix, centroids), count)
+
+    def updated(self, kept: np.ndarray, added: np.ndarray) -> "IVFIndex":
+        """
+        Returns the index after rows were deleted and others appended, without
+        training again: the kept rows stay in their lists and the appended rows
+        join the list of their closest centroid.
+
+        Args:
+            kept (np.ndarray): A boolean mask over the rows of this index.
+            added (np.ndarray): The (m, d) unit-length rows appended after the
+                kept ones.
+
+        Returns:
+            IVFIndex: The index over the kept rows followed by the added ones.
+        """
+        assignments = np.concatenate(
+            [self.assignments()[kept], _assign(added, self.centroids)]
+        )
+        return self._from_assignments(self.centroids, assignments, self.trained_count)
+
+    def needs_training(self, count: int, growth: float) -> bool:
+        """
+        Checks whether the centroids should be trained again for a row count,
+        because it moved by more than a growth fraction of the rows they were
+        trained on.
+        """
+        return abs(count - self.trained_count) > growth * self.trained_count
+
+    def candidates(self, query_vector: np.ndarray, nprobe: int = DEFAULT_NPROBE) -> np.ndarray:
+        """Returns the rows in the nprobe lists closest to a unit-length query."""
+        nprobe = min(nprobe, len(self.centroids))
+        closest = np.argpartition(-(self.centroids @ query_vector), nprobe - 1)[:nprobe]
+        return np.concatenate(
+            [self.order[self.offsets[i] : self.offsets[i + 1]] for i in closest]
+        )
+
+    def save(self, path: str):
+        """Writes the index to a .npz file."""
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                order=self.order,
+                offsets=self.offsets,
+                trained_count=self.trained_count,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        """Reads an index written by save."""
+        with np.load(path) as data:
+            # Indexes saved before updates were kept have no trained count
+            trained_count = (
+                int(data["trained_count"]) if "trained_count" in data.files else None
+            )
+            return cls(data["centroids"], data["order"], data["offsets"], trained_count)
+
+
+def ann_recall_report(
+    store,
+    queries: Optional[np.ndarray] = None,
+    top_k: int = 10,
+    nprobe_values: List[int] = (1, 2, 4, 8, 16, 32),
+    sample_size: int = 100,
+    seed: int = 0,
+) -> List[Dict]:
+    """
+    Measures recall and latency of a store's approximate search against exact
+    search, for several nprobe values, so a setting can be chosen with data.
+
+    Args:
+        store (MmapVectorStore): A store with an ANN index.
+        queries (np.ndarray, optional): The query vectors. Defaults to a sample of
+            stored vectors with a little noise added.
+        top_k (int): The number of neighbours compared.
+        nprobe_values (List[int]): The nprobe settings to measure.
+        sample_size (int): The number of sampled queries when none are given.
+        seed (int): The random seed of the sampled queries.
+
+    Returns:
+        List[Dict]: One row per setting, plus the exact baseline, with recall@k
+            and the mean query latency in milliseconds.
+    """
+    matrix = store.vectors()
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(matrix), min(sample_size, len(matrix)), replace=False)
+        queries = np.asarray(matrix[rows]) + rng.normal(0, 0.05, (len(rows), matrix.shape[1]))
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+    def run(nprobe):
+        started = time.perf_counter()
+        results = [store.search_rows(q, top_k, nprobe=nprobe)[0] for q in queries]
+        return results, (time.perf_counter() - started) * 1000 / len(queries)
+
+    exact, exact_ms = run(0)
+    report = [{"nprobe": "exact", "recall": 1.0, "latency_ms": exact_ms}]
+    for nprobe in nprobe_values:
+        approximate, latency_ms = run(nprobe)
+        hits = sum(
+            len(set(a.tolist()) & set(e.tolist())) for a, e in zip(approximate, exact)
+        )
+        total = sum(len(e) for e in exact)
+        report.append(
+            {"nprobe": nprobe, "recall": hits / total if total else 1.0, "latency_ms": latency_ms}
+        )
+    return report
@@ -0,0 +1,159 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.schema import QueryBundle
+
+
+logger = logging.getLogger(__name__)
+
+
+def dataframe_engine_bytes(engine) -> int:
+    """Returns the in-memory size of the DataFrame behind a PandasQueryEngine."""
+    return int(engine._df.memory_usage(deep=True).sum())
+
+
+def directory_bytes(path: str) -> int:
+    """Returns the total size of the files in a directory, e.g. a persisted index."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            total += os.path.getsize(os.path.join(root, file_name))
+    return total
+
+
+class EngineCache:
+    """
+    Tracks the loaded lazy engines and unloads the least recently used ones once
+    their estimated memory exceeds max_bytes. The engine in use is never
+    unloaded, so a single engine larger than the budget still works.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self._sizes: "OrderedDict[LazyQueryEngine, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def touch(self, engine: "LazyQueryEngine", size: Optional[int] = None) -> List:
+        """
+        Marks an engine as most recently used, recording its size when it was
+        just loaded.
+
+        Args:
+            engine (LazyQueryEngine): The engine that is being used.
+            size (int, optional): The estimated size in bytes of a newly loaded engine.
+
+        Returns:
+            List[LazyQueryEngine]: The engines to unload to get back within budget.
+        """
+        with self._lock:
+            if size is not None:
+                self._sizes[engine] = size
+                self.loads += 1
+            elif engine not in self._sizes:
+                return []
+            self._sizes.move_to_end(engine)
+            if self.max_bytes is None:
+                return []
+
+            victims = []
+            total = sum(self._sizes.values())
+            for other in list(self._sizes):
+                if total <= self.max_bytes or other is engine:
+                    break
+                total -= self._sizes.pop(other)
+                victims.append(other)
+            self.evictions += len(victims)
+            return victims
+
+    def discard(self, engine: "LazyQueryEngine"):
+        """Forgets an engine that was unloaded."""
+        with self._lock:
+            self._sizes.pop(engine, None)
+
+    def stats(self) -> Dict:
+        """Returns the loaded engine count and size, and the load and eviction counters."""
+        with self._lock:
+            return {
+                "loaded": len(self._sizes),
+                "bytes": sum(self._sizes.values()),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+class LazyQueryEngine(BaseQueryEngine):
+    """
+    A query engine that is only built the first time it is queried. The agent
+    can register a tool for it up front, while the DataFrame or index behind it
+    stays on disk until the tool is called. When a cache is given, the engine
+    may be unloaded again and is rebuilt on its next query.
+
+    Args:
+        name (str): A name for logging, e.g. the source file.
+        loader (Callable[[], BaseQueryEngine]): Builds the real query engine.
+        cache (EngineCache, optional): The cache enforcing the memory budget.
+        size_fn (Callable[[BaseQueryEngine], int], optional): Estimates the
+            memory used by the built engine. Defaults to zero.
+        callback_manager (CallbackManager, optional): The callback manager.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[], BaseQueryEngine],
+        cache: Optional[EngineCache] = None,
+        size_fn: Optional[Callable[[BaseQueryEngine], int]] = None,
+        callback_manager: Optional[CallbackManager] = None,
+    ):
+        super().__init__(callback_manager=callback_manager)
+        self.name = name
+        self._loader = loader
+        self._cache = cache
+        self._size_fn = size_fn
+        self._engine: Optional[BaseQueryEngine] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._engine is not None
+
+    def get(self) -> BaseQueryEngine:
+        """Returns the real query engine, building it if it is not loaded."""
+        size = None
+        with self._lock:
+            if self._engine is None:
+                logger.info(f"Loading query engine for {self.name}")
+                self._engine = self._loader()
+                size = self._size_fn(self._engine) if self._size_fn else 0
+            engine = self._engine
+
+        # Unload outside this engine's lock, so two loading engines cannot deadlock
+        if self._cache is not None:
+            for victim in self._cache.touch(self, size):
+                victim.unload()
+        return engine
+
+    def unload(self):
+        """Drops the real query engine; queries already running keep their reference."""
+        with self._lock:
+            if self._engine is not None:
+                logger.info(f"Unloading query engine for {self.name}")
+            self._engine = None
+            if self._cache is not None:
+                self._cache.discard(self)
+
+    def _get_prompt_modules(self) -> Dict:
+        return {}
+
+    def _query(self, query_bundle: QueryBundle):
+        return self.get().query(query_bundle)
+
+    async def _aquery(self, query_bundle: QueryBundle):
+        return await self.get().aquery(query_bundle)
@@ -0,0 +1,657 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core import StorageContext
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+from engines_factory.ivf_index import DEFAULT_NPROBE, IVFIndex
+
+
+logger = logging.getLogger(__name__)
+DEFAULT_NAMESPACE = "default"
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+VECTOR_FILE_SUFFIXES = {
+    "float32": "__vector_store.f32",
+    "float16": "__vector_store.f16",
+    "int8": "__vector_store.i8",
+}
+SCALES_FILE_SUFFIX = "__vector_store.scales.f32"
+ID_TABLE_SUFFIX = "__vector_store.ids.json"
+LEGACY_FILE_SUFFIX = "__vector_store.json"
+LEGACY_BACKUP_SUFFIX = ".bak"
+ANN_FILE_SUFFIX = "__vector_store.ivf.npz"
+ANN_MIN_ROWS = 20000
+# The ANN setting of new indexes, see MmapVectorStore: empty for automatic
+ANN_NLIST = int(os.environ["ANN_NLIST"]) if os.getenv("ANN_NLIST") else None
+# The IVF lists scanned per query, 0 for exact search; empty keeps the value
+# stored with each index. python -m benchmarks.run measures recall and latency
+ANN_NPROBE = int(os.environ["ANN_NPROBE"]) if os.getenv("ANN_NPROBE") else None
+# The fraction of rows that may be added or deleted before the ANN lists are
+# trained again; until then new rows join the list of their closest centroid
+ANN_REBUILD_GROWTH = float(os.getenv("ANN_REBUILD_GROWTH", "0.2"))
+SCORE_CHUNK_ROWS = 65536
+
+
+def vector_store_paths(
+    persist_dir: str, namespace: str = DEFAULT_NAMESPACE, dtype: str = "float32"
+):
+    """Returns the vector file and id table paths of a namespace in a directory."""
+    return (
+        os.path.join(persist_dir, f"{namespace}{VECTOR_FILE_SUFFIXES[dtype]}"),
+        os.path.join(persist_dir, f"{namespace}{ID_TABLE_SUFFIX}"),
+    )
+
+
+def ann_index_path(persist_dir: str, namespace: str = DEFAULT_NAMESPACE) -> str:
+    """Returns the path of the approximate nearest-neighbour index of a namespace."""
+    return os.path.join(persist_dir, f"{namespace}{ANN_FILE_SUFFIX}")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scales rows to unit length so a dot product is a cosine similarity."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(matrix: np.ndarray, dtype: str):
+    """
+    Converts a float32 matrix of unit-length rows to the storage dtype.
+
+    Args:
+        matrix (np.ndarray): The float32 matrix.
+        dtype (str): "float32", "float16" or "int8". int8 uses one symmetric
+            scale per row.
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: The stored matrix and, for int8,
+            the per-row scales.
+    """
+    if dtype == "float32":
+        return np.ascontiguousarray(matrix, dtype=np.float32), None
+    if dtype == "float16":
+        return np.ascontiguousarray(matrix, dtype=np.float16), None
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.zeros(0)
+        scales[scales == 0] = 1.0
+        quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    raise ValueError(f"Unsupported vector dtype {dtype}")
+
+
+def dequantize(matrix: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    """Converts a stored matrix back to float32."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if scales is not None:
+        matrix = matrix * scales[:, None]
+    return matrix
+
+
+def _flat_metadata(node: BaseNode) -> Dict:
+    """Keeps the scalar metadata of a node, which is what filters can match."""
+    return {
+        key: value
+        for key, value in node.metadata.items()
+        if value is None or isinstance(value, (str, int, float, bool))
+    }
+
+
+def _match_filter(metadata: Dict, metadata_filter) -> bool:
+    value = metadata.get(metadata_filter.key)
+    expected = metadata_filter.value
+    operator = metadata_filter.operator
+    if operator == FilterOperator.EQ:
+        return value == expected
+    if operator == FilterOperator.NE:
+        return value != expected
+    if operator == FilterOperator.IN:
+        return value in expected
+    if operator == FilterOperator.NIN:
+        return value not in expected
+    if operator == FilterOperator.IS_EMPTY:
+        return value is None or value == ""
+    if value is None:
+        return False
+    if operator == FilterOperator.GT:
+        return value > expected
+    if operator == FilterOperator.GTE:
+        return value >= expected
+    if operator == FilterOperator.LT:
+        return value < expected
+    if operator == FilterOperator.LTE:
+        return value <= expected
+    if operator == FilterOperator.TEXT_MATCH:
+        return str(expected) in str(value)
+    raise ValueError(f"Unsupported filter operator {operator}")
+
+
+def match_filters(metadata: Dict, filters: MetadataFilters) -> bool:
+    """
+    Checks whether a metadata dict satisfies a set of (possibly nested) filters.
+
+    Args:
+        metadata (Dict): The metadata of a node.
+        filters (MetadataFilters): The filters to check.
+
+    Returns:
+        bool: Whether the metadata matches.
+    """
+    results = (
+        match_filters(metadata, f)
+        if isinstance(f, MetadataFilters)
+        else _match_filter(metadata, f)
+        for f in filters.filters
+    )
+    if filters.condition == FilterCondition.OR:
+        return any(results)
+    return all(results)
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    A vector store that keeps embeddings in a contiguous float32 file, opened
+    with memory mapping, next to a small JSON id table. Loading only maps the
+    file, so it is near-instant, and processes that load the same index share
+    the same physical pages. Queries are a single matrix-vector product over
+    unit-length vectors.
+
+    An optional IVF index (see engines_factory.ivf_index) is built when the store
+    is persisted and saved next to it. ann_nlist selects it per index: None
+    builds one once the store holds ANN_MIN_ROWS rows, 0 never does, and a
+    positive value always builds one with that many lists. ann_nprobe sets how
+    many lists a query scans, and ANN_NPROBE overrides it when set; rows added
+    since the last persist are always scored exactly. Later persists keep the
+    trained lists and assign new rows to them, until the row count moves by
+    more than ANN_REBUILD_GROWTH.
+
+    vector_dtype sets how vectors are stored on disk: float32, float16 (half the
+    size) or int8 with a per-row scale (a quarter of the size). Quantized
+    matrices are scored in chunks so they are never expanded in full.
+
+    Node text lives in the docstore, as with any store that does not keep text.
+    """
+
+    stores_text: bool = False
+    ann_nlist: Optional[int] = None
+    ann_nprobe: int = DEFAULT_NPROBE if ANN_NPROBE is None else ANN_NPROBE
+    vector_dtype: str = VECTOR_DTYPE
+
+    _matrix: np.ndarray = PrivateAttr()
+    _pending: List[np.ndarray] = PrivateAttr()
+    _ids: List[str] = PrivateAttr()
+    _ref_doc_ids: List[str] = PrivateAttr()
+    _metadata: List[Dict] = PrivateAttr()
+    _alive: np.ndarray = PrivateAttr()
+    _dirty: bool = PrivateAttr()
+    _ivf: Optional[IVFIndex] = PrivateAttr()
+    _scales: Optional[np.ndarray] = PrivateAttr()
+
+    def __init__(
+        self,
+        matrix: Optional[np.ndarray] = None,
+        ids: Optional[List[str]] = None,
+        ref_doc_ids: Optional[List[str]] = None,
+        metadata: Optional[List[Dict]] = None,
+        ivf: Optional[IVFIndex] = None,
+        scales: Optional[np.ndarray] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self._ivf = ivf
+        self._scales = scales
+        self._matrix = (
+            matrix if matrix is not None else np.zeros((0, 0), dtype=np.float32)
+        )
+        self._pending = []
+        self._ids = ids or []
+        self._ref_doc_ids = ref_doc_ids or []
+        self._metadata = metadata or []
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._dirty = matrix is None or not isinstance(matrix, np.memmap)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @classmethod
+    def exists(cls, persist_dir: str, namespace: str = DEFAULT_NAMESPACE) -> bool:
+        """Checks whether a directory holds a persisted store of this type."""
+        return os.path.exists(vector_store_paths(persist_dir, namespace)[1])
+
+    @classmethod
+    def from_persist_dir(
+        cls, persist_dir: str, namespace: str = DEFAULT_NAMESPACE
+    ) -> "MmapVectorStore":
+        """
+        Opens a persisted store. The vectors are memory mapped read-only; they are
+        only copied into memory if nodes are added later.
+
+        Args:
+            persist_dir (str): The index directory.
+            namespace (str): The vector store namespace.
+
+        Returns:
+            MmapVectorStore: The opened store.
+        """
+        _, id_table_path = vector_store_paths(persist_dir, namespace)
+        with open(id_table_path, "r", encoding="utf-8") as f:
+            id_table = json.load(f)
+        dtype = id_table.get("dtype", "float32")
+        vector_path, _ = vector_store_paths(persist_dir, namespace, dtype)
+        count, dim = len(id_table["ids"]), id_table["dim"]
+        if count == 0:
+            matrix = np.zeros((0, dim), dtype=dtype)
+        else:
+            matrix = np.memmap(vector_path, dtype=dtype, mode="r", shape=(count, dim))
+        scales = None
+        if dtype == "int8":
+            scales_path = os.path.join(persist_dir, f"{namespace}{SCALES_FILE_SUFFIX}")
+            scales = np.fromfile(scales_path, dtype=np.float32)
+
+        ivf = None
+        ivf_path = ann_index_path(persist_dir, namespace)
+        if os.path.exists(ivf_path):
+            ivf = IVFIndex.load(ivf_path)
+            if ivf.count != count:
+                logger.warning(f"Ignoring {ivf_path}, it does not match the stored vectors")
+                ivf = None
+        return cls(
+            matrix=matrix,
+            ids=id_table["ids"],
+            ref_doc_ids=id_table["ref_doc_ids"],
+            metadata=id_table["metadata"],
+            ivf=ivf,
+            scales=scales,
+            ann_nlist=id_table.get("ann_nlist"),
+            ann_nprobe=(
+                id_table.get("ann_nprobe", DEFAULT_NPROBE) if ANN_NPROBE is None else ANN_NPROBE
+            ),
+            vector_dtype=dtype,
+        )
+
+    @classmethod
+    def from_simple_vector_store(cls, store: SimpleVectorStore) -> "MmapVectorStore":
+        """Converts a JSON-backed SimpleVectorStore, keeping its ids and metadata."""
+        data = store.data
+        ids = list(data.embedding_dict)
+        matrix = np.asarray([data.embedding_dict[i] for i in ids], dtype=np.float32)
+        return cls(
+            matrix=_normalize(matrix) if len(ids) else matrix,
+            ids=ids,
+            ref_doc_ids=[data.text_id_to_ref_doc_id.get(i, "None") for i in ids],
+            metadata=[
+                {
+                    key: value
+                    for key, value in data.metadata_dict.get(i, {}).items()
+                    if not key.startswith("_")
+                    and (value is None or isinstance(value, (str, int, float, bool)))
+                }
+                for i in ids
+            ],
+        )
+
+    def _consolidate(self) -> np.ndarray:
+        """
+        Merges vectors added since the last query into the matrix. A quantized
+        matrix is expanded to float32 first; it is quantized again on persist.
+        """
+        if self._pending:
+            parts = [self._float_matrix()] if len(self._matrix) else []
+            self._matrix = np.ascontiguousarray(
+                np.vstack(parts + self._pending), dtype=np.float32
+            )
+            self._scales = None
+            self._pending = []
+        return self._matrix
+
+    def _float_matrix(self) -> np.ndarray:
+        if self._matrix.dtype == np.float32:
+            return self._matrix
+        return dequantize(self._matrix, self._scales)
+
+    def _scores(self, query_vector: np.ndarray, rows: Optional[np.ndarray] = None):
+        """Scores all rows, or the given rows, against a unit-length query."""
+        matrix = self._consolidate()
+        if rows is not None:
+            scores = np.asarray(matrix[rows], dtype=np.float32) @ query_vector
+            return scores * self._scales[rows] if self._scales is not None else scores
+        if matrix.dtype == np.float32:
+            return matrix @ query_vector
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_CHUNK_ROWS):
+            block = np.asarray(matrix[start : start + SCORE_CHUNK_ROWS], dtype=np.float32)
+            scores[start : start + len(block)] = block @ query_vector
+        return scores * self._scales if self._scales is not None else scores
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        """Adds nodes with their embeddings to the store."""
+        if not nodes:
+            return []
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        self._pending.append(_normalize(vectors))
+        for node in nodes:
+            self._ids.append(node.node_id)
+            self._ref_doc_ids.append(node.ref_doc_id or "None")
+            self._metadata.append(_flat_metadata(node))
+        self._alive = np.concatenate([self._alive, np.ones(len(nodes), dtype=bool)])
+        self._dirty = True
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Deletes the nodes of a document. The rows are dropped on next persist."""
+        for row, row_ref_doc_id in enumerate(self._ref_doc_ids):
+            if row_ref_doc_id == ref_doc_id:
+                self._alive[row] = False
+                self._dirty = True
+
+    def _candidate_mask(self, query: VectorStoreQuery) -> np.ndarray:
+        """Returns the rows a query may return, after node id and metadata filters."""
+        mask = self._alive.copy()
+        if query.node_ids is not None:
+            allowed = set(query.node_ids)
+            mask &= np.fromiter((i in allowed for i in self._ids), bool, len(self._ids))
+        if query.doc_ids is not None:
+            allowed = set(query.doc_ids)
+            mask &= np.fromiter(
+                (i in allowed for i in self._ref_doc_ids), bool, len(self._ids)
+            )
+        if query.filters is not None:
+            mask &= np.fromiter(
+                (match_filters(m, query.filters) for m in self._metadata),
+                bool,
+                len(self._ids),
+            )
+        return mask
+
+    def vectors(self) -> np.ndarray:
+        """Returns the (n, d) float32 matrix of vectors, including deleted rows."""
+        self._consolidate()
+        return self._float_matrix()
+
+    def search_rows(
+        self,
+        query_vector: np.ndarray,
+        top_k: int,
+        nprobe: Optional[int] = None,
+        mask: Optional[np.ndarray] = None,
+    ):
+        """
+        Returns the rows most similar to a unit-length query vector and their
+        scores, best first.
+
+        Args:
+            query_vector (np.ndarray): The unit-length query vector.
+            top_k (int): The number of rows to return.
+            nprobe (int, optional): The number of IVF lists to scan. Defaults to
+                ann_nprobe; 0 forces an exact search.
+            mask (np.ndarray, optional): The rows that may be returned.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The rows and their scores.
+        """
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        matrix = self._consolidate()
+        nprobe = self.ann_nprobe if nprobe is None else nprobe
+        if self._ivf is not None and nprobe > 0:
+            rows = self._ivf.candidates(query_vector, nprobe)
+            if len(matrix) > self._ivf.count:
+                rows = np.concatenate([rows, np.arange(self._ivf.count, len(matrix))])
+            if mask is not None:
+                rows = rows[mask[rows]]
+            # Too few candidates left after filtering; an exact search is cheap then
+            if len(rows) >= top_k:
+                rows = np.sort(rows)
+                scores = self._scores(query_vector, rows)
+                top = np.argpartition(-scores, top_k - 1)[:top_k]
+                top = top[np.argsort(-scores[top])]
+                return rows[top], scores[top]
+
+        scores = self._scores(query_vector)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            top_k = min(top_k, int(mask.sum()))
+        if top_k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Returns the most similar rows by cosine similarity."""
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"MmapVectorStore does not support query mode {query.mode}")
+        if len(self._ids) == 0 or query.query_embedding is None:
+            return VectorStoreQueryResult(ids=[], similarities=[])
+
+        query_vector = _normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        mask = self._candidate_mask(query)
+        rows, scores = self.search_rows(
+            query_vector,
+            min(query.similarity_top_k, len(self._ids)),
+            mask=None if mask.all() else mask,
+        )
+        return VectorStoreQueryResult(
+            ids=[self._ids[row] for row in rows],
+            similarities=[float(score) for score in scores],
+        )
+
+    def configure_dtype(self, dtype: str):
+        """Changes the storage dtype; it takes effect when the store is next persisted."""
+        if dtype not in VECTOR_FILE_SUFFIXES:
+            raise ValueError(f"Unsupported vector dtype {dtype}")
+        if dtype != self.vector_dtype:
+            self.vector_dtype = dtype
+            self._dirty = True
+
+    def configure_ann(self, nlist: Optional[int], nprobe: Optional[int] = None):
+        """
+        Changes the ANN setting of the store. A changed nlist takes effect when
+        the store is next persisted; nprobe takes effect immediately.
+        """
+        if nlist != self.ann_nlist:
+            self.ann_nlist = nlist
+            self._ivf = None
+            self._dirty = True
+        if nprobe is not None:
+            self.ann_nprobe = nprobe
+
+    def _wants_ann(self, count: int) -> bool:
+        if self.ann_nlist is None:
+            return count >= ANN_MIN_ROWS
+        return self.ann_nlist > 0 and count > 0
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """
+        Writes the live vectors and the id table next to persist_path, which is
+        the JSON path the storage context would use for this namespace. A store
+        opened from that directory and left unchanged is not rewritten.
+        """
+        persist_dir = os.path.dirname(persist_path)
+        namespace = os.path.basename(persist_path)[: -len(LEGACY_FILE_SUFFIX)]
+        vector_path, id_table_path = vector_store_paths(
+            persist_dir, namespace, self.vector_dtype
+        )
+        scales_path = os.path.join(persist_dir, f"{namespace}{SCALES_FILE_SUFFIX}")
+        if not self._dirty and self.exists(persist_dir, namespace):
+            return
+        os.makedirs(persist_dir, exist_ok=True)
+
+        self._consolidate()
+        matrix = self._float_matrix()
+        kept = self._alive.copy()
+        alive = np.flatnonzero(self._alive)
+        if len(alive) < len(self._ids):
+            matrix = np.ascontiguousarray(matrix[alive])
+            self._ids = [self._ids[row] for row in alive]
+            self._ref_doc_ids = [self._ref_doc_ids[row] for row in alive]
+            self._metadata = [self._metadata[row] for row in alive]
+            self._alive = np.ones(len(alive), dtype=bool)
+        self._matrix, self._scales = quantize(matrix, self.vector_dtype)
+
+        # Write to temporary files first, since the old vector file may be mapped
+        self._matrix.tofile(f"{vector_path}.tmp")
+        if self._scales is not None:
+            self._scales.tofile(f"{scales_path}.tmp")
+        with open(f"{id_table_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+                    "dtype": self.vector_dtype,
+                    "ids": self._ids,
+                    "ref_doc_ids": self._ref_doc_ids,
+                    "metadata": self._metadata,
+                    "ann_nlist": self.ann_nlist,
+                    "ann_nprobe": self.ann_nprobe,
+                },
+                f,
+            )
+        os.replace(f"{vector_path}.tmp", vector_path)
+        if self._scales is not None:
+            os.replace(f"{scales_path}.tmp", scales_path)
+        os.replace(f"{id_table_path}.tmp", id_table_path)
+        self._dirty = False
+
+        # Drop the files of a previous storage dtype
+        for dtype in VECTOR_FILE_SUFFIXES:
+            old_path = vector_store_paths(persist_dir, namespace, dtype)[0]
+            if dtype != self.vector_dtype and os.path.exists(old_path):
+                os.remove(old_path)
+        if self._scales is None and os.path.exists(scales_path):
+            os.remove(scales_path)
+
+        # Deleted rows shift the positions of the rows after them, so the ANN
+        # index is updated to the new matrix, or trained again once it has
+        # drifted too far from the rows it was trained on
+        ivf_path = ann_index_path(persist_dir, namespace)
+        previous, self._ivf = self._ivf, None
+        if self._wants_ann(len(matrix)):
+            if previous is None or previous.needs_training(len(matrix), ANN_REBUILD_GROWTH):
+                logger.info(f"Building ANN index {ivf_path} over {len(matrix)} vectors")
+                self._ivf = IVFIndex.build(matrix, nlist=self.ann_nlist or None)
+            else:
+                kept = kept[: previous.count]
+                self._ivf = previous.updated(kept, matrix[int(kept.sum()) :])
+            self._ivf.save(ivf_path)
+        elif os.path.exists(ivf_path):
+            os.remove(ivf_path)
+
+
+def quantization_recall_report(
+    matrix: np.ndarray,
+    queries: Optional[np.ndarray] = None,
+    top_k: int = 10,
+    dtypes: Sequence[str] = ("float16", "int8"),
+    sample_size: int = 100,
+    seed: int = 0,
+) -> List[Dict]:
+    """
+    Measures how well exact search over quantized vectors matches float32
+    search, and how much smaller each storage dtype is.
+
+    Args:
+        matrix (np.ndarray): The float32 matrix of unit-length vectors, e.g.
+            MmapVectorStore.vectors() of an index stored as float32.
+        queries (np.ndarray, optional): The query vectors. Defaults to a sample of
+            rows with a little noise added.
+        top_k (int): The number of neighbours compared.
+        dtypes (Sequence[str]): The storage dtypes to measure.
+        sample_size (int): The number of sampled queries when none are given.
+        seed (int): The random seed of the sampled queries.
+
+    Returns:
+        List[Dict]: One row per dtype with recall@k, bytes per vector and the
+            mean query latency in milliseconds.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(matrix), min(sample_size, len(matrix)), replace=False)
+        queries = matrix[rows] + rng.normal(0, 0.05, (len(rows), matrix.shape[1]))
+    queries = _normalize(np.asarray(queries, dtype=np.float32))
+    top_k = min(top_k, len(matrix))
+
+    def top_rows(scores):
+        return set(np.argpartition(-scores, top_k - 1)[:top_k].tolist())
+
+    exact = [top_rows(matrix @ q) for q in queries]
+    report = []
+    for dtype in ("float32",) + tuple(dtypes):
+        stored, scales = quantize(matrix, dtype)
+        store = MmapVectorStore(matrix=stored, ids=[str(i) for i in range(len(matrix))],
+                                scales=scales, vector_dtype=dtype, ann_nlist=0)
+        started = time.perf_counter()
+        results = [top_rows(store._scores(q)) for q in queries]
+        latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        hits = sum(len(r & e) for r, e in zip(results, exact))
+        report.append(
+            {
+                "dtype": dtype,
+                "recall": hits / (top_k * len(queries)),
+                "bytes_per_vector": stored.itemsize * matrix.shape[1]
+                + (4 if scales is not None else 0),
+                "latency_ms": latency_ms,
+            }
+        )
+    return report
+
+
+def new_storage_context(ann_nlist: Optional[int] = None) -> StorageContext:
+    """
+    Returns a storage context for a new index backed by a MmapVectorStore.
+
+    Args:
+        ann_nlist (int, optional): The ANN setting of the index; see MmapVectorStore.
+    """
+    return StorageContext.from_defaults(vector_store=MmapVectorStore(ann_nlist=ann_nlist))
+
+
+def load_storage_context(persist_dir: str) -> StorageContext:
+    """
+    Loads the storage context of a persisted index with its MmapVectorStore. An
+    index persisted with the JSON vector store is converted once; the JSON file
+    is kept with a .bak suffix, so an older checkout or a failed conversion can
+    get it back by renaming it. Stored vectors are converted once when
+    VECTOR_DTYPE changes.
+
+    Args:
+        persist_dir (str): The index directory.
+
+    Returns:
+        StorageContext: The loaded storage context.
+    """
+    if MmapVectorStore.exists(persist_dir):
+        vector_store = MmapVectorStore.from_persist_dir(persist_dir)
+        if vector_store.vector_dtype != VECTOR_DTYPE:
+            logger.info(f"Converting {persist_dir} vectors to {VECTOR_DTYPE}")
+            vector_store.configure_dtype(VECTOR_DTYPE)
+            vector_store.persist(
+                os.path.join(persist_dir, f"{DEFAULT_NAMESPACE}{LEGACY_FILE_SUFFIX}")
+            )
+    else:
+        legacy_path = os.path.join(persist_dir, f"{DEFAULT_NAMESPACE}{LEGACY_FILE_SUFFIX}")
+        logger.info(f"Converting {legacy_path} to a memory-mapped vector store")
+        vector_store = MmapVectorStore.from_simple_vector_store(
+            SimpleVectorStore.from_persist_path(legacy_path)
+        )
+        vector_store.persist(legacy_path)
+        os.replace(legacy_path, f"{legacy_path}{LEGACY_BACKUP_SUFFIX}")
+    return StorageContext.from_defaults(persist_dir=persist_dir, vector_store=vector_store)
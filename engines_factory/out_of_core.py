@@ -0,0 +1,932 @@
+import ast
+import json
+import logging
+import operator
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from llama_index.core.output_parsers.utils import parse_code_markdown
+from llama_index.experimental.exec_utils import safe_eval, safe_exec
+from llama_index.experimental.query_engine import PandasQueryEngine
+from llama_index.experimental.query_engine.pandas import PandasInstructionParser
+
+from engines_factory.columnar_cache import CHUNK_ROWS, META_FILE, column_values
+from engines_factory.pandas_cache import CachedPandasQueryEngine
+
+
+logger = logging.getLogger(__name__)
+IN_MEMORY_MAX_BYTES = 256 * 2**20
+DISPLAY_ROWS = 20
+
+# Series methods that work row by row, so they can run on each chunk on its own
+ELEMENTWISE_METHODS = {
+    "abs", "apply", "astype", "between", "clip", "fillna", "isin", "isna",
+    "isnull", "map", "notna", "notnull", "round",
+}
+# String methods that combine rows, which cannot run on each chunk on its own
+AGGREGATING_STR_METHODS = {"cat", "get_dummies"}
+
+
+class UnsupportedOperation(Exception):
+    """Raised for a pandas operation that cannot run over the table in chunks."""
+
+
+class ColumnarTable:
+    """
+    A table in the columnar CSV cache, read in chunks of rows from the memory
+    mapped column files. Only the columns an expression uses are read, and each
+    chunk is widened to the dtypes pd.read_csv gives, see column_values.
+
+    Args:
+        target_dir (str): The directory written by convert_csv.
+        chunk_rows (int): The number of rows per chunk.
+    """
+
+    def __init__(self, target_dir: str, chunk_rows: int = CHUNK_ROWS):
+        self.target_dir = target_dir
+        self.chunk_rows = chunk_rows
+        with open(os.path.join(target_dir, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.num_rows = meta["rows"]
+        self._columns = {column["name"]: column for column in meta["columns"]}
+        self.columns = list(self._columns)
+
+    def column_bytes(self, columns: Optional[Sequence[str]] = None) -> int:
+        """Returns the on-disk size of some columns, close to their size in memory."""
+        names = self.columns if columns is None else columns
+        return sum(
+            os.path.getsize(os.path.join(self.target_dir, self._columns[name]["file"]))
+            for name in names
+        )
+
+    def iter_chunks(self, columns: Sequence[str]) -> Iterator[pd.DataFrame]:
+        """Yields the given columns in chunks, indexed by their row numbers."""
+        arrays = {
+            name: np.load(
+                os.path.join(self.target_dir, self._columns[name]["file"]), mmap_mode="r"
+            )
+            for name in columns
+        }
+        for start in range(0, max(self.num_rows, 1), self.chunk_rows):
+            stop = min(start + self.chunk_rows, self.num_rows)
+            yield pd.DataFrame(
+                {
+                    name: column_values(arrays[name][start:stop], self._columns[name])
+                    for name in columns
+                },
+                index=pd.RangeIndex(start, stop),
+            )
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        return next(ColumnarTable(self.target_dir, max(n, 1)).iter_chunks(self.columns)).head(n)
+
+    def to_pandas(self, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        names = self.columns if columns is None else list(columns)
+        return pd.concat(self.iter_chunks(names)) if names else pd.DataFrame()
+
+
+class CsvTable:
+    """
+    A CSV file read in chunks of rows, for when the columnar cache is off.
+    Every scan parses the file again, so the columnar table is much faster.
+
+    Args:
+        csv_path (str): The CSV file.
+        chunk_rows (int): The number of rows per chunk.
+    """
+
+    def __init__(self, csv_path: str, chunk_rows: int = CHUNK_ROWS):
+        self.csv_path = csv_path
+        self.chunk_rows = chunk_rows
+        self.columns = list(pd.read_csv(csv_path, nrows=0).columns)
+
+    def column_bytes(self, columns: Optional[Sequence[str]] = None) -> int:
+        """Estimates the size of some columns as their share of the file size."""
+        size = os.path.getsize(self.csv_path)
+        if columns is None or not self.columns:
+            return size
+        return size * len(columns) // len(self.columns)
+
+    def iter_chunks(self, columns: Sequence[str]) -> Iterator[pd.DataFrame]:
+        """Yields the given columns in chunks, indexed by their row numbers."""
+        reader = pd.read_csv(self.csv_path, usecols=list(columns), chunksize=self.chunk_rows)
+        empty = True
+        for chunk in reader:
+            empty = False
+            yield chunk[list(columns)]
+        if empty:
+            yield pd.read_csv(self.csv_path, usecols=list(columns))[list(columns)]
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        return pd.read_csv(self.csv_path, nrows=n)
+
+    def to_pandas(self, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        return pd.read_csv(self.csv_path, usecols=None if columns is None else list(columns))
+
+
+def _combine(parts: List, combine: Callable):
+    """Combines per-chunk partial results that are indexed by value or group."""
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return None
+    merged = pd.concat(parts)
+    levels = list(range(merged.index.nlevels))
+    return combine(merged.groupby(level=levels, observed=True, sort=False))
+
+
+def _top(running, chunk_result, keep: Callable):
+    if running is None:
+        return keep(chunk_result)
+    return keep(pd.concat([running, chunk_result]))
+
+
+class LazyFrame:
+    """
+    Stands in for the DataFrame in pandas expressions written for a table that
+    does not fit in memory. Selecting columns and filtering rows only records
+    what to read; reductions, group-bys and top-N queries then scan the table
+    chunk by chunk and return ordinary pandas objects.
+    """
+
+    def __init__(self, table, masks: tuple = (), columns: Optional[List[str]] = None):
+        self._table = table
+        self._masks = masks
+        self._selected = list(table.columns) if columns is None else list(columns)
+
+    # Reading
+
+    def _chunks(self, columns: Sequence[str]) -> Iterator[pd.DataFrame]:
+        needed = list(dict.fromkeys(list(columns) + self._mask_columns()))
+        if not needed:
+            needed = self._table.columns[:1]
+        for chunk in self._table.iter_chunks(needed):
+            for mask in self._masks:
+                values = mask._fn(chunk)
+                # Missing values do not match, as with SQL filters
+                keep = values.notna().to_numpy()
+                keep[keep] = values.to_numpy()[keep].astype(bool)
+                chunk = chunk[keep]
+            yield chunk[list(columns)]
+
+    def _mask_columns(self) -> List[str]:
+        return [name for mask in self._masks for name in mask._columns]
+
+    def _sample(self) -> pd.DataFrame:
+        return self._table.head(DISPLAY_ROWS)[self._selected]
+
+    def _read_for_sort(self, by) -> Iterator[pd.DataFrame]:
+        return self._chunks(self._selected)
+
+    def _project_sorted(self, rows: pd.DataFrame) -> pd.DataFrame:
+        return rows[self._selected]
+
+    # Selection
+
+    @property
+    def columns(self) -> pd.Index:
+        return pd.Index(self._selected)
+
+    @property
+    def dtypes(self) -> pd.Series:
+        return self._sample().dtypes
+
+    def __getitem__(self, key):
+        if isinstance(key, LazySeries):
+            return LazyFrame(self._table, self._masks + (key,), self._selected)
+        if isinstance(key, str):
+            if key not in self._selected:
+                raise KeyError(key)
+            return LazySeries(self, [key], operator.itemgetter(key), name=key)
+        if isinstance(key, (list, pd.Index)):
+            missing = [name for name in key if name not in self._selected]
+            if missing:
+                raise KeyError(missing)
+            return LazyFrame(self._table, self._masks, list(key))
+        raise UnsupportedOperation(f"indexing the table with {type(key).__name__}")
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._selected:
+            return self[name]
+        raise UnsupportedOperation(f"DataFrame.{name}")
+
+    @property
+    def loc(self) -> "_LazyLoc":
+        return _LazyLoc(self)
+
+    def query(self, expr: str) -> "LazyFrame":
+        return self[LazySeries(self, self._selected, lambda chunk: chunk.eval(expr))]
+
+    # Reductions
+
+    def __len__(self) -> int:
+        return sum(len(chunk) for chunk in self._chunks([]))
+
+    @property
+    def shape(self):
+        return (len(self), len(self._selected))
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        parts, remaining = [], n
+        for chunk in self._chunks(self._selected):
+            parts.append(chunk.head(remaining))
+            remaining -= len(parts[-1])
+            if remaining <= 0:
+                break
+        return pd.concat(parts) if parts else self._sample().head(0)
+
+    def _numeric(self) -> List[str]:
+        sample = self._sample()
+        return [
+            name
+            for name in self._selected
+            if pd.api.types.is_numeric_dtype(sample[name])
+            and not pd.api.types.is_bool_dtype(sample[name])
+        ]
+
+    def _per_column(self, method: str, columns: List[str]) -> pd.Series:
+        return pd.Series({name: getattr(self[name], method)() for name in columns})
+
+    def count(self) -> pd.Series:
+        return self._per_column("count", self._selected)
+
+    def nunique(self) -> pd.Series:
+        return self._per_column("nunique", self._selected)
+
+    def sum(self, numeric_only: bool = True) -> pd.Series:
+        return self._per_column("sum", self._numeric())
+
+    def mean(self, numeric_only: bool = True) -> pd.Series:
+        return self._per_column("mean", self._numeric())
+
+    def min(self, numeric_only: bool = True) -> pd.Series:
+        return self._per_column("min", self._numeric())
+
+    def max(self, numeric_only: bool = True) -> pd.Series:
+        return self._per_column("max", self._numeric())
+
+    def std(self, numeric_only: bool = True) -> pd.Series:
+        return self._per_column("std", self._numeric())
+
+    def var(self, numeric_only: bool = True) -> pd.Series:
+        return self._per_column("var", self._numeric())
+
+    def describe(self) -> pd.DataFrame:
+        """Summarizes the numeric columns; percentiles would need a sort, so they are left out."""
+        return pd.DataFrame({name: self[name].describe() for name in self._numeric()})
+
+    # Top N
+
+    def nlargest(self, n: int, columns, keep: str = "first") -> pd.DataFrame:
+        return self.sort_values(columns, ascending=False).head(n)
+
+    def nsmallest(self, n: int, columns, keep: str = "first") -> pd.DataFrame:
+        return self.sort_values(columns, ascending=True).head(n)
+
+    def sort_values(self, by, ascending=True) -> "LazySorted":
+        return LazySorted(self, [by] if isinstance(by, str) else list(by), ascending)
+
+    def groupby(self, by, dropna: bool = True, **kwargs) -> "LazyGroupBy":
+        return LazyGroupBy(self, [by] if isinstance(by, str) else list(by), dropna=dropna)
+
+    def __str__(self):
+        return f"{self.head(DISPLAY_ROWS)}\n\n[{len(self)} rows x {len(self._selected)} columns]"
+
+    __repr__ = __str__
+
+
+class _LazyLoc:
+    def __init__(self, frame: LazyFrame):
+        self._frame = frame
+
+    def __getitem__(self, key):
+        rows, columns = key if isinstance(key, tuple) else (key, None)
+        frame = self._frame
+        if isinstance(rows, LazySeries):
+            frame = frame[rows]
+        elif rows != slice(None):
+            raise UnsupportedOperation("selecting rows by label")
+        return frame if columns is None else frame[columns]
+
+
+class LazySorted:
+    """A sorted table or column, of which only the first or last rows can be read."""
+
+    def __init__(self, source, by: Optional[List[str]], ascending=True):
+        self._source = source
+        self._by = by
+        self._ascending = ascending
+
+    def _sort(self, data):
+        if self._by is None:
+            return data.sort_values(ascending=self._ascending, kind="stable")
+        return data.sort_values(self._by, ascending=self._ascending, kind="stable")
+
+    def head(self, n: int = 5):
+        # Keeps only the best n rows seen so far, so memory stays bounded
+        running = None
+        for chunk in self._source._read_for_sort(self._by):
+            running = _top(running, self._sort(chunk).head(n), lambda d: self._sort(d).head(n))
+        if running is None:
+            return self._source._sample().head(0)
+        return self._source._project_sorted(running)
+
+    def tail(self, n: int = 5):
+        if isinstance(self._ascending, bool):
+            reverse = not self._ascending
+        else:
+            reverse = [not a for a in self._ascending]
+        return LazySorted(self._source, self._by, reverse).head(n).iloc[::-1]
+
+    def __getitem__(self, key):
+        if isinstance(self._source, LazyFrame):
+            keep = [key] if isinstance(key, str) else list(key)
+            columns = list(dict.fromkeys(keep + self._by))
+            sorted_frame = LazySorted(self._source[columns], self._by, self._ascending)
+            return _LazyProjection(sorted_frame, key)
+        raise UnsupportedOperation("indexing a sorted column")
+
+    @property
+    def iloc(self):
+        return _LazySortedILoc(self)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        raise UnsupportedOperation(f"{name} on a sorted table; use head(n) or tail(n)")
+
+
+class _LazyProjection:
+    """Columns selected from a sorted table, e.g. df.sort_values("a")["b"].head(3)."""
+
+    def __init__(self, sorted_frame: LazySorted, key):
+        self._sorted = sorted_frame
+        self._key = key
+
+    def head(self, n: int = 5):
+        return self._sorted.head(n)[self._key]
+
+    def tail(self, n: int = 5):
+        return self._sorted.tail(n)[self._key]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        raise UnsupportedOperation(f"{name} on a sorted table; use head(n) or tail(n)")
+
+
+class _LazySortedILoc:
+    def __init__(self, sorted_frame: LazySorted):
+        self._sorted = sorted_frame
+
+    def __getitem__(self, key):
+        if isinstance(key, int) and key >= 0:
+            return self._sorted.head(key + 1).iloc[key]
+        if isinstance(key, int):
+            return self._sorted.tail(-key).iloc[0]
+        if isinstance(key, slice) and key.start in (None, 0) and key.stop is not None:
+            return self._sorted.head(key.stop).iloc[key]
+        raise UnsupportedOperation("iloc on a sorted table beyond the first rows")
+
+
+class LazyStringMethods:
+    """The .str accessor of a LazySeries; every method runs row by row."""
+
+    def __init__(self, series: "LazySeries"):
+        self._series = series
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in AGGREGATING_STR_METHODS:
+            raise UnsupportedOperation(f"Series.str.{name}")
+
+        def method(*args, **kwargs):
+            return self._series._map(lambda s: getattr(s.str, name)(*args, **kwargs))
+
+        return method
+
+
+class LazySeries:
+    """
+    A column, or an expression over columns, of a LazyFrame. Arithmetic and
+    comparisons build new expressions; reductions scan the table.
+    """
+
+    __hash__ = None
+
+    def __init__(self, frame: LazyFrame, columns: List[str], fn: Callable, name=None):
+        self._frame = frame
+        self._columns = columns
+        self._fn = fn
+        self.name = name
+
+    def _map(self, fn: Callable, name="same") -> "LazySeries":
+        source = self._fn
+        return LazySeries(
+            self._frame,
+            self._columns,
+            lambda chunk: fn(source(chunk)),
+            self.name if name == "same" else name,
+        )
+
+    def _binary(self, other, op: Callable, reverse: bool = False) -> "LazySeries":
+        left = self._fn
+        if isinstance(other, LazySeries):
+            if len(other._frame._masks) != len(self._frame._masks) or any(
+                a is not b for a, b in zip(other._frame._masks, self._frame._masks)
+            ):
+                raise UnsupportedOperation("combining columns filtered differently")
+            right = other._fn
+            columns = list(dict.fromkeys(self._columns + other._columns))
+        else:
+            right = lambda chunk: other  # noqa: E731
+            columns = self._columns
+        if reverse:
+            left, right = right, left
+        name = self.name if not isinstance(other, LazySeries) else None
+        return LazySeries(
+            self._frame, columns, lambda chunk: op(left(chunk), right(chunk)), name
+        )
+
+    def __eq__(self, other):
+        return self._binary(other, operator.eq)
+
+    def __ne__(self, other):
+        return self._binary(other, operator.ne)
+
+    def __lt__(self, other):
+        return self._binary(other, operator.lt)
+
+    def __le__(self, other):
+        return self._binary(other, operator.le)
+
+    def __gt__(self, other):
+        return self._binary(other, operator.gt)
+
+    def __ge__(self, other):
+        return self._binary(other, operator.ge)
+
+    def __add__(self, other):
+        return self._binary(other, operator.add)
+
+    def __radd__(self, other):
+        return self._binary(other, operator.add, reverse=True)
+
+    def __sub__(self, other):
+        return self._binary(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self._binary(other, operator.sub, reverse=True)
+
+    def __mul__(self, other):
+        return self._binary(other, operator.mul)
+
+    def __rmul__(self, other):
+        return self._binary(other, operator.mul, reverse=True)
+
+    def __truediv__(self, other):
+        return self._binary(other, operator.truediv)
+
+    def __rtruediv__(self, other):
+        return self._binary(other, operator.truediv, reverse=True)
+
+    def __floordiv__(self, other):
+        return self._binary(other, operator.floordiv)
+
+    def __mod__(self, other):
+        return self._binary(other, operator.mod)
+
+    def __pow__(self, other):
+        return self._binary(other, operator.pow)
+
+    def __and__(self, other):
+        return self._binary(other, operator.and_)
+
+    def __rand__(self, other):
+        return self._binary(other, operator.and_, reverse=True)
+
+    def __or__(self, other):
+        return self._binary(other, operator.or_)
+
+    def __ror__(self, other):
+        return self._binary(other, operator.or_, reverse=True)
+
+    def __invert__(self):
+        return self._map(operator.invert)
+
+    def __neg__(self):
+        return self._map(operator.neg)
+
+    def __abs__(self):
+        return self._map(operator.abs)
+
+    def __bool__(self):
+        raise ValueError("The truth value of a Series is ambiguous.")
+
+    @property
+    def str(self) -> LazyStringMethods:
+        return LazyStringMethods(self)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in ELEMENTWISE_METHODS:
+            return lambda *args, **kwargs: self._map(
+                lambda s: getattr(s, name)(*args, **kwargs)
+            )
+        raise UnsupportedOperation(f"Series.{name}")
+
+    # Reading
+
+    def _values(self) -> Iterator[pd.Series]:
+        for chunk in self._frame._chunks(self._columns):
+            values = self._fn(chunk)
+            if not isinstance(values, pd.Series):
+                values = pd.Series(values, index=chunk.index)
+            yield values.rename(self.name)
+
+    def _read_for_sort(self, by) -> Iterator[pd.Series]:
+        return self._values()
+
+    def _project_sorted(self, values):
+        return values
+
+    def _sample(self) -> pd.Series:
+        return self._fn(self._frame._table.head(DISPLAY_ROWS)).rename(self.name)
+
+    # Reductions
+
+    def __len__(self) -> int:
+        return sum(len(values) for values in self._values())
+
+    @property
+    def size(self) -> int:
+        return len(self)
+
+    @property
+    def shape(self):
+        return (len(self),)
+
+    @property
+    def dtype(self):
+        return self._sample().dtype
+
+    def head(self, n: int = 5) -> pd.Series:
+        parts, remaining = [], n
+        for values in self._values():
+            parts.append(values.head(remaining))
+            remaining -= len(parts[-1])
+            if remaining <= 0:
+                break
+        return pd.concat(parts) if parts else self._sample().head(0)
+
+    def count(self) -> int:
+        return int(sum(values.count() for values in self._values()))
+
+    def sum(self):
+        return sum((values.sum() for values in self._values()), 0)
+
+    def _moments(self):
+        # Chan et al.'s parallel update of the count, mean and squared deviations
+        n, mean, m2 = 0, 0.0, 0.0
+        for values in self._values():
+            values = values.dropna().astype(np.float64)
+            if not len(values):
+                continue
+            n_b, mean_b = len(values), float(values.mean())
+            m2_b = float(((values - mean_b) ** 2).sum())
+            delta = mean_b - mean
+            total = n + n_b
+            mean += delta * n_b / total
+            m2 += m2_b + delta**2 * n * n_b / total
+            n = total
+        return n, mean, m2
+
+    def mean(self):
+        n, mean, _ = self._moments()
+        return mean if n else np.nan
+
+    def var(self, ddof: int = 1):
+        n, _, m2 = self._moments()
+        return m2 / (n - ddof) if n > ddof else np.nan
+
+    def std(self, ddof: int = 1):
+        return float(np.sqrt(self.var(ddof)))
+
+    def describe(self) -> pd.Series:
+        """Returns the count, mean, std, min and max, without the percentiles."""
+        n, mean, m2 = self._moments()
+        return pd.Series(
+            {
+                "count": float(n),
+                "mean": mean if n else np.nan,
+                "std": float(np.sqrt(m2 / (n - 1))) if n > 1 else np.nan,
+                "min": self.min(),
+                "max": self.max(),
+            },
+            name=self.name,
+        )
+
+    def _extreme(self, pick: Callable):
+        best = None
+        for values in self._values():
+            values = values.dropna()
+            if len(values):
+                value = values.min() if pick is min else values.max()
+                best = value if best is None else pick(best, value)
+        return np.nan if best is None else best
+
+    def min(self):
+        return self._extreme(min)
+
+    def max(self):
+        return self._extreme(max)
+
+    def _arg_extreme(self, largest: bool):
+        top = self.nlargest(1) if largest else self.nsmallest(1)
+        if not len(top):
+            raise ValueError("attempt to get argmax of an empty sequence")
+        return top.index[0]
+
+    def idxmax(self):
+        return self._arg_extreme(True)
+
+    def idxmin(self):
+        return self._arg_extreme(False)
+
+    def any(self) -> bool:
+        return any(bool(values.any()) for values in self._values())
+
+    def all(self) -> bool:
+        return all(bool(values.all()) for values in self._values())
+
+    def unique(self) -> np.ndarray:
+        seen = {}
+        for values in self._values():
+            seen.update(dict.fromkeys(pd.unique(values.to_numpy())))
+        return np.array(list(seen), dtype=object)
+
+    def nunique(self, dropna: bool = True) -> int:
+        values = self.unique()
+        return int(sum(1 for v in values if not (dropna and pd.isna(v))))
+
+    def value_counts(self, normalize=False, sort=True, ascending=False, dropna=True):
+        parts = [values.value_counts(dropna=dropna) for values in self._values()]
+        counts = _combine(parts, lambda grouped: grouped.sum())
+        if counts is None:
+            counts = pd.Series(dtype="int64")
+        counts = counts[counts > 0].rename("count")
+        counts.index.name = self.name
+        if sort:
+            counts = counts.sort_values(ascending=ascending, kind="stable")
+        if normalize:
+            counts = (counts / counts.sum()).rename("proportion")
+        return counts
+
+    def nlargest(self, n: int = 5, keep: str = "first") -> pd.Series:
+        return self.sort_values(ascending=False).head(n)
+
+    def nsmallest(self, n: int = 5, keep: str = "first") -> pd.Series:
+        return self.sort_values(ascending=True).head(n)
+
+    def sort_values(self, ascending: bool = True) -> LazySorted:
+        return LazySorted(self._without_nan(), None, ascending)
+
+    def _without_nan(self) -> "LazySeries":
+        return self._map(lambda s: s.dropna())
+
+    def __str__(self):
+        return f"{self.head(DISPLAY_ROWS)}\n\n[{len(self)} rows]"
+
+    __repr__ = __str__
+
+
+class LazyGroupBy:
+    """
+    A group-by over a LazyFrame. Each chunk is aggregated on its own and the
+    partial results are merged as the scan goes, so memory grows with the
+    number of groups, not rows. Means are merged from sums and counts.
+    """
+
+    AGGREGATIONS = {"sum", "mean", "count", "min", "max", "size"}
+
+    def __init__(self, frame: LazyFrame, keys: List[str], selection=None, dropna=True):
+        self._frame = frame
+        self._keys = keys
+        self._selection = selection
+        self._dropna = dropna
+
+    def __getitem__(self, key) -> "LazyGroupBy":
+        return LazyGroupBy(self._frame, self._keys, key, self._dropna)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._frame._selected and name not in self._keys:
+            return self[name]
+        raise UnsupportedOperation(f"GroupBy.{name}")
+
+    def _value_columns(self, func: str) -> List[str]:
+        if self._selection is not None:
+            if isinstance(self._selection, str):
+                return [self._selection]
+            return list(self._selection)
+        columns = [name for name in self._frame._selected if name not in self._keys]
+        if func in ("sum", "mean"):
+            numeric = self._frame._numeric()
+            columns = [name for name in columns if name in numeric]
+        return columns
+
+    def _scan(self, partials: List[str], columns: List[str]) -> Dict[str, Any]:
+        running = {partial: None for partial in partials}
+        merge = {"sum": "sum", "count": "sum", "size": "sum", "min": "min", "max": "max"}
+        read = list(dict.fromkeys(self._keys + columns))
+        for chunk in self._frame._chunks(read):
+            grouped = chunk.groupby(self._keys, observed=True, dropna=self._dropna, sort=False)
+            for partial in partials:
+                if partial == "size":
+                    part = grouped.size()
+                else:
+                    part = getattr(grouped[columns], partial)()
+                previous = running[partial]
+                parts = [part] if previous is None else [previous, part]
+                running[partial] = _combine(
+                    parts, lambda g, how=merge[partial]: getattr(g, how)()
+                )
+        return running
+
+    def _aggregate(self, func: str):
+        if func not in self.AGGREGATIONS:
+            raise UnsupportedOperation(f"GroupBy.{func}")
+        columns = self._value_columns(func)
+        partials = ["sum", "count"] if func == "mean" else [func]
+        running = self._scan(partials, [] if func == "size" else columns)
+        if func == "mean":
+            result = running["sum"] / running["count"] if running["sum"] is not None else None
+        else:
+            result = running[func]
+        if result is None:
+            result = pd.DataFrame(columns=columns) if func != "size" else pd.Series(dtype="int64")
+        result = result.sort_index()
+        if func != "size" and isinstance(self._selection, str):
+            return result[self._selection]
+        return result
+
+    def agg(self, func):
+        if isinstance(func, str):
+            return self._aggregate(func)
+        if isinstance(func, (list, tuple)):
+            results = {name: self._aggregate(name) for name in func}
+            if isinstance(self._selection, str):
+                return pd.DataFrame(results)
+            return pd.concat(results, axis=1).swaplevel(axis=1).sort_index(axis=1, level=0)
+        raise UnsupportedOperation("GroupBy.agg with a mapping or a function")
+
+    aggregate = agg
+
+    def sum(self, numeric_only: bool = True):
+        return self._aggregate("sum")
+
+    def mean(self, numeric_only: bool = True):
+        return self._aggregate("mean")
+
+    def count(self):
+        return self._aggregate("count")
+
+    def min(self, numeric_only: bool = False):
+        return self._aggregate("min")
+
+    def max(self, numeric_only: bool = False):
+        return self._aggregate("max")
+
+    def size(self):
+        return self._aggregate("size")
+
+
+def _run_pandas_code(output: str, df) -> str:
+    """
+    Runs a pandas expression the way the default output processor of
+    PandasInstructionParser does, but lets exceptions through.
+    """
+    local_vars = {"df": df, "pd": pd}
+    global_vars = {"np": np}
+    code = parse_code_markdown(output, only_last=True)[0]
+    tree = ast.parse(code)
+    safe_exec(ast.unparse(ast.Module(tree.body[:-1], type_ignores=[])), {}, local_vars)
+    last = ast.unparse(ast.Module(tree.body[-1:], type_ignores=[]))
+    if last.strip("'\"") != last:
+        last = safe_eval(last, global_vars, local_vars)
+    return str(safe_eval(last, global_vars, local_vars))
+
+
+def _referenced_columns(output: str, columns: List[str]) -> List[str]:
+    """Returns the table columns named by string constants or attributes in the code."""
+    code = parse_code_markdown(output, only_last=True)[0]
+    names = set()
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            names.add(node.value)
+        elif isinstance(node, ast.Attribute):
+            names.add(node.attr)
+    return [name for name in columns if name in names]
+
+
+class OutOfCoreInstructionParser(PandasInstructionParser):
+    """
+    Runs the pandas code the LLM writes against a LazyFrame over the table. If
+    the code uses an operation that cannot run in chunks, the columns it names
+    are loaded into memory and the code runs on plain pandas, as long as they
+    fit within in_memory_max_bytes; otherwise an error explains what is
+    supported, like the default parser does for failing code.
+
+    Args:
+        table (ColumnarTable | CsvTable): The table to query.
+        in_memory_max_bytes (int): The largest projection loaded as a fallback.
+        output_kwargs (Dict, optional): Options of the default output processor.
+    """
+
+    def __init__(
+        self,
+        table,
+        in_memory_max_bytes: int = IN_MEMORY_MAX_BYTES,
+        output_kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        super().__init__(table.head(DISPLAY_ROWS), output_kwargs)
+        self.table = table
+        self.in_memory_max_bytes = in_memory_max_bytes
+
+    def parse(self, output: str) -> Any:
+        try:
+            try:
+                return _run_pandas_code(output, LazyFrame(self.table))
+            except UnsupportedOperation as e:
+                columns = _referenced_columns(output, self.table.columns)
+                columns = columns or self.table.columns
+                size = self.table.column_bytes(columns)
+                if size > self.in_memory_max_bytes:
+                    raise RuntimeError(
+                        f"{e} is not supported on this table, which is too large "
+                        "to load into memory. Use filters, column selection, "
+                        "aggregations (sum, mean, min, max, count, value_counts), "
+                        "groupby, nlargest/nsmallest or sort_values(...).head(n)."
+                    ) from e
+                logger.info(f"Loading columns {columns} in memory for: {output}")
+                return _run_pandas_code(output, self.table.to_pandas(columns))
+        except Exception as e:
+            logger.warning(f"Out-of-core pandas code failed: {e}")
+            return (
+                "There was an error running the output as Python code. "
+                f"Error message: {e}"
+            )
+
+
+class OutOfCoreQueryEngine(CachedPandasQueryEngine):
+    """
+    A PandasQueryEngine for tables larger than memory. The prompt shows the
+    first rows of the table as usual, and the generated code runs through
+    OutOfCoreInstructionParser, so prompts and instructions work unchanged.
+
+    Args:
+        table (ColumnarTable | CsvTable): The table to query.
+        in_memory_max_bytes (int): The largest projection loaded as a fallback.
+        **kwargs: Passed on to CachedPandasQueryEngine.
+    """
+
+    def __init__(self, table, in_memory_max_bytes: int = IN_MEMORY_MAX_BYTES, **kwargs):
+        self.table = table
+        parser = OutOfCoreInstructionParser(
+            table, in_memory_max_bytes, kwargs.get("output_kwargs")
+        )
+        super().__init__(
+            df=table.head(kwargs.get("head", 5)), instruction_parser=parser, **kwargs
+        )
+
+
+def create_table_query_engine(
+    table, in_memory_max_bytes: int = IN_MEMORY_MAX_BYTES, **kwargs
+) -> PandasQueryEngine:
+    """
+    Creates a query engine for a table: a CachedPandasQueryEngine over the
+    loaded table when it fits within in_memory_max_bytes, an
+    OutOfCoreQueryEngine otherwise.
+
+    Args:
+        table (ColumnarTable | CsvTable): The table to query.
+        in_memory_max_bytes (int): The size up to which the table is loaded.
+        **kwargs: Passed on to the query engine.
+
+    Returns:
+        PandasQueryEngine: The query engine.
+    """
+    if table.column_bytes() <= in_memory_max_bytes:
+        return CachedPandasQueryEngine(df=table.to_pandas(), **kwargs)
+    logger.info(f"Querying {table.column_bytes()} bytes out of core")
+    return OutOfCoreQueryEngine(table, in_memory_max_bytes, **kwargs)
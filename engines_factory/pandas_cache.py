@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import pandas as pd
+from llama_index.core.base.response.schema import Response
+from llama_index.core.schema import QueryBundle
+from llama_index.experimental.query_engine import PandasQueryEngine
+
+
+logger = logging.getLogger(__name__)
+PANDAS_CACHE_MAX_ENTRIES = 1024
+# The default output processor reports failing code with this prefix
+ERROR_PREFIX = "There was an error running the output as Python code."
+
+
+def normalize_query(query: str) -> str:
+    """
+    Drops whitespace and trailing punctuation differences from a query. Case is
+    kept, since values in a query, like 'ON' and 'on', may be case sensitive.
+    """
+    return re.sub(r"\s+", " ", query).strip().rstrip("?.! ")
+
+
+class PandasQueryCache:
+    """
+    An in-memory cache of answered pandas queries, shared by the CSV tools.
+    Each entry holds the generated pandas expression, its output and the final
+    response. Entries are keyed by the content hash of the data file, so a
+    changed file never hits, and the least recently used entries are evicted
+    beyond max_entries.
+    """
+
+    def __init__(self, max_entries: int = PANDAS_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: str, entry: Dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Returns the entry count and the hit, miss and eviction counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class CachedPandasQueryEngine(PandasQueryEngine):
+    """
+    A PandasQueryEngine that renders the table head for the prompt once, and
+    answers repeated queries from a PandasQueryCache without calling the LLM.
+    The cache key covers the data file hash, the normalized query, the LLM and
+    the prompt and instructions, so updating the prompt starts a fresh set of
+    entries. Outputs of failing code are not cached.
+
+    Args:
+        df (pd.DataFrame): The table to query.
+        source_hash (str, optional): The content hash of the table's data
+            file. Queries are only cached when it is given.
+        cache (PandasQueryCache, optional): The cache to answer from.
+        **kwargs: Passed on to PandasQueryEngine.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        source_hash: Optional[str] = None,
+        cache: Optional[PandasQueryCache] = None,
+        **kwargs,
+    ):
+        super().__init__(df=df, **kwargs)
+        self.source_hash = source_hash
+        self.cache = cache
+        self._table_context = str(self._df.head(self._head))
+
+    def _get_table_context(self) -> str:
+        return self._table_context
+
+    def _cache_key(self, query_str: str) -> str:
+        key = [
+            self.source_hash,
+            normalize_query(query_str),
+            self._llm.metadata.model_name,
+            self._pandas_prompt.get_template(),
+            self._instruction_str,
+            self._head,
+            self._synthesize_response,
+        ]
+        return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+    def _query(self, query_bundle: QueryBundle) -> Response:
+        if self.cache is None or self.source_hash is None:
+            return super()._query(query_bundle)
+
+        key = self._cache_key(query_bundle.query_str)
+        entry = self.cache.get(key)
+        if entry is not None:
+            logger.info(f"Answered from the pandas query cache: {query_bundle.query_str}")
+            return Response(response=entry["response"], metadata=dict(entry["metadata"]))
+
+        response = super()._query(query_bundle)
+        output = str(response.metadata["raw_pandas_output"])
+        if not output.startswith(ERROR_PREFIX):
+            self.cache.set(
+                key,
+                {
+                    "response": response.response,
+                    "metadata": {
+                        "pandas_instruction_str": response.metadata["pandas_instruction_str"],
+                        "raw_pandas_output": output,
+                    },
+                },
+            )
+        return response
@@ -1,11 +1,20 @@
+import itertools
 import os
 import logging
+from collections.abc import Iterator
 from typing import List
-from llama_index.core import (
-    StorageContext,
-    VectorStoreIndex,
-    load_index_from_storage,
-    SimpleDirectoryReader,
+from llama_index.core import VectorStoreIndex
+
+from engines_factory.bm25_index import build_bm25_index
+from engines_factory.hybrid_retriever import create_pdf_query_engine
+from engines_factory.index_manifest import IndexManifest, current_index_settings
+from engines_factory.mmap_vector_store import ANN_NLIST, new_storage_context
+from engines_factory.pdf_ingestion import (
+    build_index_streaming,
+    build_pdf_indexes,
+    checkpoint_key,
+    iter_pdf_pages,
+    load_index,
 )
 
 
@@ -13,33 +22,82 @@ logger = logging.getLogger(__name__)
 PDF_DATA_FOLDER = "data/pdf"
 
 
-def get_index(data, index_name):
+def get_index(data, index_name, source_file=None, manifest=None, ann_nlist=ANN_NLIST):
     """
     Given a set of data and an index name, returns a VectorStoreIndex that is
     built from the data. If the index_name already exists, it loads the index
     from the existing file. If the index_name does not exist, it builds the index
     from the data and saves it to the given index name.
 
+    When a source file is given, the index manifest decides whether the stored
+    index is still valid: it is only reused if it was built from the same file
+    content with the same parser and embedding settings, and rebuilt otherwise.
+
+    When the data is an iterator, such as iter_pdf_pages, the documents are
+    indexed in batches as they are produced, see build_index_streaming. With a
+    source file the build is checkpointed, and an interrupted build resumes.
+
     Args:
-        data (iterable): The data to build the index from.
+        data (iterable or callable): The data to build the index from, or a
+            function returning it. A function is only called when the index has
+            to be built, so loading a stored index never parses the source.
         index_name (str): The name of the index to build or load.
+        source_file (str, optional): The file the data was read from.
+        manifest (IndexManifest, optional): The manifest to check and update.
+            Loaded from disk when not given.
+        ann_nlist (int, optional): The approximate nearest-neighbour setting of
+            a new index; see MmapVectorStore.
 
     Returns:
         VectorStoreIndex: The VectorStoreIndex built from the data.
     """
-    index = None
-    if not os.path.exists(index_name):
-        index = VectorStoreIndex.from_documents(data, show_progress=True)
-        index.storage_context.persist(persist_dir=index_name)
+    if source_file is None:
+        is_current = os.path.exists(index_name)
     else:
-        index = load_index_from_storage(
-            StorageContext.from_defaults(persist_dir=index_name)
+        manifest = manifest or IndexManifest.load()
+        settings = current_index_settings()
+        source_hash = manifest.source_hash(index_name, source_file)
+        is_current = manifest.is_current(index_name, source_hash, settings)
+
+    if is_current:
+        return load_index(index_name)
+
+    documents = data() if callable(data) else data
+    if isinstance(documents, Iterator):
+        key = None
+        if source_file is not None:
+            # The directory holds a partial build until the manifest records it
+            manifest.forget(index_name)
+            manifest.save()
+            key = checkpoint_key(source_hash, settings)
+        # Resumed builds skip the pages already indexed; they are parsed again
+        # but not embedded again
+        index = build_index_streaming(
+            lambda start: itertools.islice(documents, start, None),
+            index_name,
+            key=key,
+            ann_nlist=ann_nlist,
         )
+    else:
+        logger.info(f"Building index {index_name}")
+        index = VectorStoreIndex.from_documents(
+            documents,
+            storage_context=new_storage_context(ann_nlist=ann_nlist),
+            show_progress=True,
+        )
+        index.storage_context.persist(persist_dir=index_name)
+        build_bm25_index(index, index_name)
+
+    if source_file is not None:
+        manifest.record(index_name, source_file, source_hash, settings)
+        manifest.save()
 
     return index
 
 
-def get_pdf_engine(pdf_file: str, index_name: str):
+def get_pdf_engine(
+    pdf_file: str, index_name: str, manifest=None, pdf_folder: str = PDF_DATA_FOLDER
+):
     """
     Given a PDF file and an index name, returns a VectorStoreQueryEngine that is
     built from the PDF file. If the index_name already exists, it loads the index
@@ -49,6 +107,9 @@ def get_pdf_engine(pdf_file: str, index_name: str):
     Args:
         pdf_file (str): The name of the PDF file.
         index_name (str): The name of the index to build or load.
+        manifest (IndexManifest, optional): The manifest used to decide whether
+            the stored index is still valid.
+        pdf_folder (str): The folder containing the PDF file.
 
     Returns:
         Optional[VectorStoreQueryEngine]: The VectorStoreQueryEngine built from the PDF file.
@@ -56,20 +117,22 @@ def get_pdf_engine(pdf_file: str, index_name: str):
     """
     try:
         # Build the path to the PDF file
-        pdf_path = os.path.join(PDF_DATA_FOLDER, pdf_file)
-
-        # Load the PDF file using the SimpleDirectoryReader
-        pdf_reader = SimpleDirectoryReader(input_files=[pdf_path])
-        pdf_data = pdf_reader.load_data()
-
-        # Build the index from the PDF data
-        pdf_index = get_index(pdf_data, index_name)
+        pdf_path = os.path.join(pdf_folder, pdf_file)
+
+        # Load or build the index; the PDF is only parsed if it has to be built,
+        # and then streamed page by page
+        pdf_index = get_index(
+            lambda: iter_pdf_pages(pdf_path),
+            index_name,
+            source_file=pdf_path,
+            manifest=manifest,
+        )
 
         # Log a success message
         logger.info(f"Successfully created index for {pdf_file}")
 
         # Return the QueryEngine built from the index
-        return pdf_index.as_query_engine()
+        return create_pdf_query_engine(pdf_index, index_name)
     except Exception as e:
         # Log an error message if there is an error while building the index
         logger.error(f"Failed to create index for {pdf_file}. Error was {e}")
@@ -80,6 +143,7 @@ def get_pdf_engine(pdf_file: str, index_name: str):
 
 def get_pdf_engines_from_folder(
     pdf_folder: str,
+    workers: int = 1,
 ) -> List:
     """
     Creates a list of VectorStoreQueryEngines from all PDF files in a given folder.
@@ -87,12 +151,29 @@ def get_pdf_engines_from_folder(
 
     Args:
         pdf_folder (str): The path to the folder containing PDF files.
+        workers (int): The number of processes used to parse the PDFs whose
+            index has to be built. With more than one worker, the engines are
+            returned in file name order.
 
     Returns:
         List[Optional[VectorStoreQueryEngine]]: A list of VectorStoreQueryEngines for each PDF file.
             If an engine cannot be created for a PDF, None is added to the list for that file.
     """
+    if workers > 1:
+        pdf_files = sorted(f for f in os.listdir(pdf_folder) if f.endswith(".pdf"))
+        index_names = [os.path.splitext(pdf_file)[0] for pdf_file in pdf_files]
+        indexes = build_pdf_indexes(
+            [os.path.join(pdf_folder, pdf_file) for pdf_file in pdf_files],
+            index_names,
+            workers=workers,
+        )
+        return [
+            create_pdf_query_engine(index, index_name) if index else None
+            for index, index_name in zip(indexes, index_names)
+        ]
+
     pdf_engines = []
+    manifest = IndexManifest.load()
 
     # Iterate over all files in the specified folder
     for pdf_file in os.listdir(pdf_folder):
@@ -102,7 +183,9 @@ def get_pdf_engines_from_folder(
             index_name = os.path.splitext(pdf_file)[0]
 
             # Get the PDF engine for the current file
-            pdf_engine = get_pdf_engine(pdf_file, index_name)
+            pdf_engine = get_pdf_engine(
+                pdf_file, index_name, manifest=manifest, pdf_folder=pdf_folder
+            )
 
             # Append the result to the list
             pdf_engines.append(pdf_engine)
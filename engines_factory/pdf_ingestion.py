@@ -0,0 +1,486 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from llama_index.core import (
+    Settings,
+    VectorStoreIndex,
+    load_index_from_storage,
+    SimpleDirectoryReader,
+)
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.readers.file.base import default_file_metadata_func
+from llama_index.core.schema import Document, MetadataMode
+from pypdf import PdfReader
+
+from engines_factory.bm25_index import build_bm25_index
+from engines_factory.index_manifest import IndexManifest, current_index_settings
+from engines_factory.mmap_vector_store import (
+    ANN_NLIST,
+    load_storage_context,
+    new_storage_context,
+)
+
+
+logger = logging.getLogger(__name__)
+EMBED_BATCH_SIZE = 256
+# Pages chunked and embedded together when a PDF is streamed
+PDF_PAGE_BATCH = int(os.getenv("PDF_PAGE_BATCH", "32"))
+# Pages between checkpoints; each checkpoint rewrites the index built so far
+PDF_CHECKPOINT_PAGES = int(os.getenv("PDF_CHECKPOINT_PAGES", "256"))
+# PDFs with at least this many pages are streamed by build_pdf_indexes
+STREAM_MIN_PAGES = int(os.getenv("STREAM_MIN_PAGES", "200"))
+CHECKPOINT_FILE_NAME = "ingest_checkpoint.json"
+# One lock per index directory, so two threads never build the same index at once
+_index_locks: Dict[str, threading.Lock] = {}
+_index_locks_guard = threading.Lock()
+# The metadata SimpleDirectoryReader keeps out of the embedded and LLM text
+EXCLUDED_FILE_METADATA_KEYS = [
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+]
+
+
+def load_pdf_data(pdf_path: str):
+    """
+    Parses a PDF file into a list of Documents, one per page.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+
+    Returns:
+        List[Document]: The parsed pages.
+    """
+    return SimpleDirectoryReader(input_files=[pdf_path]).load_data()
+
+
+def pdf_page_count(pdf_path: str) -> int:
+    """Returns the number of pages of a PDF, or 0 if it cannot be read."""
+    try:
+        with open(pdf_path, "rb") as f:
+            return len(PdfReader(f).pages)
+    except Exception as e:
+        logger.error(f"Failed to read {pdf_path}. Error was {e}")
+        return 0
+
+
+def iter_pdf_pages(pdf_path: str, start_page: int = 0) -> Iterator[Document]:
+    """
+    Parses a PDF page by page, yielding each page as soon as it is parsed. The
+    Documents match those of load_pdf_data, but only the page being parsed is
+    held in memory.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        start_page (int): The first page to yield; earlier pages are not parsed.
+
+    Yields:
+        Document: One Document per page.
+    """
+    file_metadata = default_file_metadata_func(pdf_path)
+    with open(pdf_path, "rb") as f:
+        # Given a file object, pypdf reads the file as needed instead of at once
+        reader = PdfReader(f)
+        page_labels = reader.page_labels
+        for page_number in range(start_page, len(reader.pages)):
+            document = Document(
+                text=reader.pages[page_number].extract_text(),
+                metadata={"page_label": page_labels[page_number], **file_metadata},
+            )
+            document.excluded_embed_metadata_keys.extend(EXCLUDED_FILE_METADATA_KEYS)
+            document.excluded_llm_metadata_keys.extend(EXCLUDED_FILE_METADATA_KEYS)
+            yield document
+
+
+def load_index(index_name: str) -> VectorStoreIndex:
+    """
+    Loads a persisted index from the given directory, with its vectors memory
+    mapped.
+
+    Args:
+        index_name (str): The directory the index was persisted to.
+
+    Returns:
+        VectorStoreIndex: The loaded index.
+    """
+    return load_index_from_storage(load_storage_context(index_name))
+
+
+def parse_pdf_nodes(pdf_path: str, transformations: List) -> List:
+    """
+    Parses a PDF and splits it into nodes, without embedding them. This is the
+    CPU-bound part of ingestion and runs inside the worker processes.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        transformations (List): The transformations (node parser) to apply.
+
+    Returns:
+        List[BaseNode]: The nodes of the PDF, in document order.
+    """
+    return run_transformations(load_pdf_data(pdf_path), transformations)
+
+
+def iter_parsed_pdfs(pdf_paths: List[str], workers: int = 1):
+    """
+    Parses PDFs into nodes, across a pool of worker processes when more than one
+    worker is requested. Results are yielded in the order of pdf_paths, so the
+    output is deterministic while the workers run ahead.
+
+    Args:
+        pdf_paths (List[str]): The PDF files to parse.
+        workers (int): The number of worker processes.
+
+    Yields:
+        Tuple[str, Optional[List[BaseNode]]]: The path and its nodes, or None
+            when the file could not be parsed.
+    """
+    transformations = Settings.transformations
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is not None:
+            futures = [
+                executor.submit(parse_pdf_nodes, pdf_path, transformations)
+                for pdf_path in pdf_paths
+            ]
+        for position, pdf_path in enumerate(pdf_paths):
+            try:
+                if executor is not None:
+                    nodes = futures[position].result()
+                else:
+                    nodes = parse_pdf_nodes(pdf_path, transformations)
+            except Exception as e:
+                logger.error(f"Failed to parse {pdf_path}. Error was {e}")
+                nodes = None
+            yield pdf_path, nodes
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def embed_nodes_batched(
+    nodes: List,
+    batch_size: int = EMBED_BATCH_SIZE,
+    progress: Optional[Callable[[int, int], None]] = None,
+):
+    """
+    Embeds the nodes that have no embedding yet, in batches of a fixed size, and
+    stores the vectors on the nodes. Nodes of several files can be passed at once
+    so the embedder always gets full batches.
+
+    Args:
+        nodes (List[BaseNode]): The nodes to embed.
+        batch_size (int): The number of texts sent to the embedder per call.
+        progress (Callable[[int, int], None], optional): Called after each
+            batch with the number of nodes embedded so far and the total.
+    """
+    embed_model = Settings.embed_model
+    pending = [node for node in nodes if node.embedding is None]
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start : start + batch_size]
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        for node, embedding in zip(batch, embed_model.get_text_embedding_batch(texts)):
+            node.embedding = embedding
+        if progress is not None:
+            progress(start + len(batch), len(pending))
+
+
+def checkpoint_key(source_hash: str, settings: dict) -> str:
+    """Returns the key under which a streamed build of a source file is checkpointed."""
+    return hashlib.sha256(
+        json.dumps([source_hash, settings], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _read_checkpoint(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _page_id(position: int) -> str:
+    return f"page_{position}"
+
+
+def _page_position(ref_doc_id: str) -> int:
+    prefix, _, number = ref_doc_id.rpartition("_")
+    return int(number) if prefix == "page" and number.isdigit() else -1
+
+
+def _write_checkpoint(path: str, key: str, pages_done: int):
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"key": key, "pages_done": pages_done}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def build_index_streaming(
+    pages: Callable[[int], Iterable[Document]],
+    index_name: str,
+    key: Optional[str] = None,
+    total_pages: Optional[int] = None,
+    page_batch: int = PDF_PAGE_BATCH,
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    checkpoint_pages: int = PDF_CHECKPOINT_PAGES,
+    progress: Optional[Callable[[int, int], None]] = None,
+    ann_nlist: Optional[int] = ANN_NLIST,
+) -> VectorStoreIndex:
+    """
+    Builds and persists an index from pages as they are parsed. Pages are
+    chunked, embedded and inserted page_batch at a time, so memory use depends
+    on the batch size rather than on the document size. Every checkpoint_pages
+    pages the index is persisted with a checkpoint; a build interrupted after a
+    checkpoint with the same key resumes from it instead of starting over.
+
+    Args:
+        pages (Callable[[int], Iterable[Document]]): Returns the pages from the
+            given page number on.
+        index_name (str): The directory the index is persisted to.
+        key (str, optional): Identifies the source and settings, see
+            checkpoint_key. Without it a build always starts over.
+        total_pages (int, optional): The page count, for progress reports.
+        page_batch (int): The number of pages chunked and embedded together.
+        embed_batch_size (int): The number of chunks sent to the embedder per call.
+        checkpoint_pages (int): The number of pages between checkpoints.
+        progress (Callable[[int, int], None], optional): Called after each batch
+            with the pages indexed so far and the page count.
+        ann_nlist (int, optional): The approximate nearest-neighbour setting of
+            a new index; see MmapVectorStore. A resumed index keeps its own.
+
+    Returns:
+        VectorStoreIndex: The built index, with its BM25 index persisted.
+    """
+    checkpoint_path = os.path.join(index_name, CHECKPOINT_FILE_NAME)
+    index, pages_done = None, 0
+    checkpoint = _read_checkpoint(checkpoint_path) if key is not None else None
+    if checkpoint is not None and checkpoint.get("key") == key:
+        try:
+            index = load_index(index_name)
+            pages_done = checkpoint["pages_done"]
+            # The index is persisted before its checkpoint is written, so it may
+            # hold pages past the checkpoint; they are indexed again below
+            for ref_doc_id in list(index.ref_doc_info):
+                if _page_position(ref_doc_id) >= pages_done:
+                    index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+            logger.info(f"Resuming index {index_name} after {pages_done} pages")
+        except Exception as e:
+            logger.error(f"Failed to resume index {index_name}. Error was {e}")
+    if index is None:
+        logger.info(f"Building index {index_name}")
+        index = VectorStoreIndex(
+            nodes=[], storage_context=new_storage_context(ann_nlist=ann_nlist)
+        )
+        pages_done = 0
+
+    transformations = Settings.transformations
+    last_checkpoint = pages_done
+    batch = []
+
+    def index_batch():
+        nonlocal pages_done, last_checkpoint
+        nodes = run_transformations(batch, transformations)
+        embed_nodes_batched(nodes, embed_batch_size)
+        index.insert_nodes(nodes)
+        pages_done += len(batch)
+        batch.clear()
+        if progress is not None:
+            progress(pages_done, total_pages or pages_done)
+        if key is not None and pages_done - last_checkpoint >= checkpoint_pages:
+            index.storage_context.persist(persist_dir=index_name)
+            _write_checkpoint(checkpoint_path, key, pages_done)
+            last_checkpoint = pages_done
+
+    for position, page in enumerate(pages(pages_done), start=pages_done):
+        # Each page's chunks refer to it by position, see the resume above
+        page.id_ = _page_id(position)
+        batch.append(page)
+        if len(batch) >= page_batch:
+            index_batch()
+    if batch:
+        index_batch()
+
+    index.storage_context.persist(persist_dir=index_name)
+    build_bm25_index(index, index_name)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return index
+
+
+def index_lock(index_name: str) -> threading.Lock:
+    """
+    Returns the lock held while the index in a directory is built or removed.
+
+    Args:
+        index_name (str): The index directory.
+
+    Returns:
+        threading.Lock: The same lock for every call with the same directory.
+    """
+    with _index_locks_guard:
+        return _index_locks.setdefault(os.path.abspath(index_name), threading.Lock())
+
+
+def build_pdf_indexes(
+    pdf_paths: List[str],
+    index_names: List[str],
+    workers: int = 1,
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    manifest: Optional[IndexManifest] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    ann_nlist: Optional[int] = ANN_NLIST,
+) -> List[Optional[VectorStoreIndex]]:
+    """
+    Loads or builds one index per PDF. Indexes that are current according to the
+    manifest are loaded from storage; the others are parsed and chunked across a
+    pool of worker processes, embedded in batches in this process, persisted and
+    recorded in the manifest. PDFs of at least STREAM_MIN_PAGES pages are
+    instead streamed page by page in this process, see build_index_streaming,
+    so a large file never has to be held in memory at once.
+
+    Args:
+        pdf_paths (List[str]): The PDF files to index.
+        index_names (List[str]): The index directory for each PDF.
+        workers (int): The number of worker processes used for parsing. With one
+            worker, files are parsed in this process.
+        embed_batch_size (int): The number of chunks embedded per batch.
+        manifest (IndexManifest, optional): The manifest to check and update.
+            Loaded from disk when not given.
+        progress (Callable[[int, int], None], optional): Called after each
+            embedding batch with the chunks embedded so far and the total of
+            the files being embedded together; for a streamed file, with the
+            pages indexed so far and its page count.
+        ann_nlist (int, optional): The approximate nearest-neighbour setting of
+            the indexes that are built; see MmapVectorStore.
+
+    Returns:
+        List[Optional[VectorStoreIndex]]: The index for each PDF, in the order of
+            pdf_paths. A file that fails to parse or index gets None and does not
+            stop the others.
+    """
+    # Another thread may be building one of these indexes, e.g. a PDF added
+    # from the app that the folder watcher has also picked up. The manifest
+    # is read once those builds are done, so it has their entries.
+    with ExitStack() as stack:
+        for index_name in sorted(set(map(os.path.abspath, index_names))):
+            stack.enter_context(index_lock(index_name))
+        return _build_pdf_indexes(
+            pdf_paths, index_names, workers, embed_batch_size, manifest, progress, ann_nlist
+        )
+
+
+def _build_pdf_indexes(
+    pdf_paths, index_names, workers, embed_batch_size, manifest, progress, ann_nlist
+):
+    manifest = manifest or IndexManifest.load()
+    settings = current_index_settings()
+    indexes: List[Optional[VectorStoreIndex]] = [None] * len(pdf_paths)
+    stale = []
+
+    for position, (pdf_path, index_name) in enumerate(zip(pdf_paths, index_names)):
+        try:
+            source_hash = manifest.source_hash(index_name, pdf_path)
+            if manifest.is_current(index_name, source_hash, settings):
+                indexes[position] = load_index(index_name)
+            else:
+                stale.append((position, source_hash))
+        except Exception as e:
+            logger.error(f"Failed to load index for {pdf_path}. Error was {e}")
+
+    if not stale:
+        return indexes
+
+    small = []
+    for position, source_hash in stale:
+        page_count = pdf_page_count(pdf_paths[position])
+        if page_count < STREAM_MIN_PAGES:
+            small.append((position, source_hash))
+            continue
+        pdf_path, index_name = pdf_paths[position], index_names[position]
+        try:
+            # The directory holds a partial build until the manifest records it
+            manifest.forget(index_name)
+            manifest.save()
+            indexes[position] = build_index_streaming(
+                lambda start, pdf_path=pdf_path: iter_pdf_pages(pdf_path, start),
+                index_name,
+                key=checkpoint_key(source_hash, settings),
+                total_pages=page_count,
+                embed_batch_size=embed_batch_size,
+                progress=progress,
+                ann_nlist=ann_nlist,
+            )
+            manifest.record(index_name, pdf_path, source_hash, settings)
+            manifest.save()
+        except Exception as e:
+            logger.error(f"Failed to create index for {pdf_path}. Error was {e}")
+    stale = small
+
+    # Nodes are buffered until a full embedding batch is ready
+    buffered = []
+    buffered_nodes = 0
+    stale_paths = [pdf_paths[position] for position, _ in stale]
+    parsed = iter_parsed_pdfs(stale_paths, workers=workers)
+    for (position, source_hash), (_, nodes) in zip(stale, parsed):
+        if nodes is None:
+            continue
+        buffered.append((position, source_hash, nodes))
+        buffered_nodes += len(nodes)
+        if buffered_nodes >= embed_batch_size:
+            _finish_indexes(
+                buffered, pdf_paths, index_names, indexes, manifest, settings,
+                embed_batch_size, progress, ann_nlist,
+            )
+            buffered, buffered_nodes = [], 0
+    _finish_indexes(
+        buffered, pdf_paths, index_names, indexes, manifest, settings,
+        embed_batch_size, progress, ann_nlist,
+    )
+
+    return indexes
+
+
+def _finish_indexes(
+    buffered, pdf_paths, index_names, indexes, manifest, settings, embed_batch_size,
+    progress=None, ann_nlist=ANN_NLIST,
+):
+    """Embeds the buffered nodes together, then builds and persists each index and its BM25 index."""
+    all_nodes = [node for _, _, nodes in buffered for node in nodes]
+    try:
+        embed_nodes_batched(all_nodes, embed_batch_size, progress)
+    except Exception as e:
+        # Retry file by file, so only the file that fails is left out; the
+        # chunks embedded before the failure are kept
+        logger.error(f"Failed to embed a batch of {len(all_nodes)} chunks. Error was {e}")
+        failed = []
+        for item in buffered:
+            try:
+                embed_nodes_batched(item[2], embed_batch_size)
+            except Exception as e:
+                logger.error(f"Failed to embed {pdf_paths[item[0]]}. Error was {e}")
+                failed.append(item)
+        buffered = [item for item in buffered if item not in failed]
+
+    for position, source_hash, nodes in buffered:
+        pdf_path, index_name = pdf_paths[position], index_names[position]
+        try:
+            logger.info(f"Building index {index_name}")
+            index = VectorStoreIndex(
+                nodes=nodes, storage_context=new_storage_context(ann_nlist=ann_nlist)
+            )
+            index.storage_context.persist(persist_dir=index_name)
+            build_bm25_index(index, index_name)
+            manifest.record(index_name, pdf_path, source_hash, settings)
+            manifest.save()
+            indexes[position] = index
+        except Exception as e:
+            logger.error(f"Failed to create index for {pdf_path}. Error was {e}")
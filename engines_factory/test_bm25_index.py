@@ -0,0 +1,66 @@
+import os
+import shutil
+import unittest
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+
+from engines_factory.bm25_index import BM25Index, bm25_index_path, load_bm25_index, tokenize
+from engines_factory.hybrid_retriever import HybridRetriever
+from engines_factory.mmap_vector_store import new_storage_context
+
+
+TEXTS = [
+    "The province of Ontario sets its own minimum wage.",
+    "Section s.12 of the Act covers the powers of the province.",
+    "Quebec and Ontario share a long border along the river.",
+    "Population tables list every province and territory.",
+]
+
+
+class TestBM25Index(unittest.TestCase):
+
+    def setUp(self):
+        self.persist_dir = "test_bm25_index"
+        os.makedirs(self.persist_dir, exist_ok=True)
+        self.node_ids = [f"node_{i}" for i in range(len(TEXTS))]
+
+    def tearDown(self):
+        if os.path.exists(self.persist_dir):
+            shutil.rmtree(self.persist_dir)
+
+    def test_identifiers_rank_first_and_survive_reload(self):
+        self.assertEqual(tokenize("See s.12!"), ["see", "s.12", "s", "12"])
+
+        path = bm25_index_path(self.persist_dir)
+        BM25Index.build(self.node_ids, TEXTS).save(path)
+        index = BM25Index.load(path)
+
+        results = index.search("what does s.12 say", top_k=2)
+        self.assertEqual(results[0][0], "node_1")
+        self.assertEqual([node_id for node_id, _ in index.search("ontario")], ["node_0", "node_2"])
+        self.assertEqual(index.search("nothing matches"), [])
+
+    def test_hybrid_retriever_finds_keyword_match(self):
+        # Constant embeddings make the vector ranking uninformative
+        nodes = [
+            TextNode(id_=node_id, text=text, embedding=[1.0, 0.0])
+            for node_id, text in zip(self.node_ids, TEXTS)
+        ]
+        index = VectorStoreIndex(
+            nodes=nodes,
+            storage_context=new_storage_context(),
+            embed_model=MockEmbedding(embed_dim=2),
+        )
+        # No BM25 index is stored yet, so it is built from the docstore
+        bm25_index = load_bm25_index(index, self.persist_dir)
+        self.assertTrue(os.path.exists(bm25_index_path(self.persist_dir)))
+
+        retriever = HybridRetriever(index, bm25_index, similarity_top_k=1, candidates=4)
+        [result] = retriever.retrieve("Quebec border")
+        self.assertEqual(result.node.node_id, "node_2")
+
+
+if __name__ == "__main__":
+    unittest.main()
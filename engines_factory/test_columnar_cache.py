@@ -0,0 +1,92 @@
+import json
+import unittest
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from llama_index.experimental.query_engine.pandas import PandasInstructionParser
+
+from engines_factory.columnar_cache import META_FILE, CsvColumnarCache
+
+
+class TestCsvColumnarCache(unittest.TestCase):
+
+    def setUp(self):
+        # Define a temporary CSV file and cache directory
+        self.csv_file = "test_table.csv"
+        self.cache_dir = "test_csv_cache"
+        self.df = pd.DataFrame(
+            {
+                "country": ["Canada", "Chile", None, "Canada", "Benin"],
+                "year": [2001, 2002, 2003, 2004, 2005],
+                "population": [1.5, 2.25, np.nan, 4.0, 5.5],
+                "growth": [0.1, 0.2, 0.3, 0.4, 0.5],
+            }
+        )
+        self.df.to_csv(self.csv_file, index=False)
+
+    def tearDown(self):
+        # Remove the temporary files after each test
+        if os.path.exists(self.csv_file):
+            os.remove(self.csv_file)
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_round_trip_with_downcast_columns(self):
+        # Small chunks make the conversion span several chunks
+        cache = CsvColumnarCache(self.cache_dir, chunk_rows=2)
+        df = cache.load(self.csv_file)
+
+        # The columns are narrow on disk, but loaded as pandas reads the CSV
+        target_dir = cache.convert(self.csv_file)[0]
+        with open(os.path.join(target_dir, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        stored = {
+            column["name"]: np.load(os.path.join(target_dir, column["file"])).dtype
+            for column in meta["columns"]
+        }
+        self.assertEqual(
+            stored,
+            {"country": np.int8, "year": np.int16, "population": np.float32, "growth": np.float64},
+        )
+        self.assertEqual(meta["columns"][0]["categories"], ["Benin", "Canada", "Chile"])
+        pd.testing.assert_frame_equal(df, pd.read_csv(self.csv_file))
+        self.assertTrue(cache.reports[-1]["converted"])
+
+        # A second cache on the same directory loads without converting
+        cache = CsvColumnarCache(self.cache_dir)
+        projected = cache.load(self.csv_file, columns=["year"])
+        self.assertEqual(list(projected.columns), ["year"])
+        self.assertFalse(cache.reports[-1]["converted"])
+
+    def test_int_chunks_promoted_to_float_keep_precision(self):
+        # The first chunk is all integers too large for float32; the second
+        # chunk's missing value makes the column float
+        pd.DataFrame({"pop": [1234567891, 987654321, np.nan, 5]}).to_csv(
+            self.csv_file, index=False
+        )
+        cache = CsvColumnarCache(self.cache_dir, chunk_rows=2)
+        df = cache.load(self.csv_file)
+
+        self.assertEqual(df["pop"].dtype, np.float64)
+        np.testing.assert_array_equal(df["pop"], [1234567891, 987654321, np.nan, 5])
+
+
+    def test_generated_code_does_not_overflow_narrow_columns(self):
+        pd.DataFrame(
+            {"country": ["India", "China", "Chile"], "population": [1428627663, 1425671352, 19629590]}
+        ).to_csv(self.csv_file, index=False)
+        cache = CsvColumnarCache(self.cache_dir)
+        parser = PandasInstructionParser(cache.load(self.csv_file))
+        expected = PandasInstructionParser(pd.read_csv(self.csv_file))
+
+        for query in [
+            "(df['population'] * 100 / df['population'].sum()).max()",
+            "(df['population'] * 1000).sum()",
+            "df.sort_values('population', ascending=False)['country'].head(2)",
+        ]:
+            with self.subTest(query=query):
+                self.assertEqual(parser.parse(query), expected.parse(query))
+
+
+if __name__ == "__main__":
+    unittest.main()
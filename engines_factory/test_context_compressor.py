@@ -0,0 +1,96 @@
+import unittest
+from typing import List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from engines_factory.context_compressor import ContextCompressor
+
+
+class KeywordEmbedding(BaseEmbedding):
+    """Embeds a text as the counts of a few keywords."""
+
+    def _embed(self, text: str) -> List[float]:
+        words = text.lower().split()
+        return [float(sum(word.startswith(key) for word in words)) for key in ("wage", "river", "census")]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+
+def make_nodes(*texts):
+    return [
+        NodeWithScore(node=TextNode(id_=f"node_{i}", text=text), score=1.0 - i / 10)
+        for i, text in enumerate(texts)
+    ]
+
+
+class TestContextCompressor(unittest.TestCase):
+
+    def test_drops_duplicates_and_repeated_headers(self):
+        compressor = ContextCompressor(embed_model=KeywordEmbedding(), token_budget=1000)
+        first = "Annual Report 2023\nThe minimum wage rose in 2023. It is reviewed yearly."
+        nodes = make_nodes(
+            first,
+            first,
+            first + " Reviews are public.",
+            "Annual Report 2023\nIt is reviewed yearly. The river flooded in spring.",
+        )
+
+        result = compressor.postprocess_nodes(nodes, QueryBundle("wage"))
+
+        self.assertEqual(
+            [node.node.get_content() for node in result],
+            [
+                "Annual Report 2023 The minimum wage rose in 2023. It is reviewed yearly.",
+                "Reviews are public.",
+                "The river flooded in spring.",
+            ],
+        )
+        # The stored nodes are left untouched
+        self.assertIn("Annual Report", nodes[3].node.get_content())
+
+    def test_keeps_sentences_contained_in_longer_ones(self):
+        compressor = ContextCompressor(embed_model=KeywordEmbedding(), token_budget=1000)
+        nodes = make_nodes(
+            "The rate is 5 percent for small firms. Wages rose.",
+            # Overlaps the first chunk, starting in the middle of its first sentence
+            "percent for small firms. Wages rose. The rate is 5. Rivers flooded.",
+        )
+
+        result = compressor.postprocess_nodes(nodes, QueryBundle("wage"))
+
+        self.assertEqual(
+            [node.node.get_content() for node in result],
+            [
+                "The rate is 5 percent for small firms. Wages rose.",
+                "The rate is 5. Rivers flooded.",
+            ],
+        )
+
+    def test_keeps_relevant_sentences_within_budget(self):
+        compressor = ContextCompressor(embed_model=KeywordEmbedding(), token_budget=20)
+        nodes = make_nodes(
+            "The census counted every household. The minimum wage rose in 2023. "
+            "The river flooded in spring. Wage reviews happen every year."
+        )
+
+        [result] = compressor.postprocess_nodes(nodes, QueryBundle("what is the minimum wage"))
+
+        self.assertEqual(
+            result.node.get_content(),
+            "The minimum wage rose in 2023. ... Wage reviews happen every year.",
+        )
+        stats = compressor.stats()
+        self.assertEqual(stats["queries"], 1)
+        self.assertGreater(stats["tokens_saved"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+from typing import List
+from unittest import mock
+
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import MockLLM
+from llama_index.core.schema import NodeRelationship, QueryBundle, RelatedNodeInfo, TextNode
+
+from engines_factory import corpus_index
+from engines_factory.corpus_index import build_corpus_index, get_corpus_query_engine
+from engines_factory.index_manifest import IndexManifest
+
+
+class CountingEmbedding(MockEmbedding):
+    """A MockEmbedding that records the texts it embeds."""
+
+    texts: List[str] = []
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.texts.extend(texts)
+        return super()._get_text_embeddings(texts)
+
+
+def parse_text_files(pdf_paths, workers=1):
+    """Parses each line of a text file as one page, in place of the PDF parser."""
+    for pdf_path in pdf_paths:
+        with open(pdf_path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        yield pdf_path, [
+            TextNode(
+                text=line,
+                relationships={
+                    NodeRelationship.SOURCE: RelatedNodeInfo(node_id=f"{pdf_path}#{i}")
+                },
+            )
+            for i, line in enumerate(lines)
+        ]
+
+
+class TestCorpusIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.index_name = os.path.join(self.folder, "corpus")
+        self.manifest_path = os.path.join(self.folder, "manifest.json")
+        self.embed_model = CountingEmbedding(embed_dim=8, texts=[])
+        self.previous_embed_model = Settings._embed_model
+        Settings.embed_model = self.embed_model
+        patch = mock.patch.object(corpus_index, "iter_parsed_pdfs", parse_text_files)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        Settings._embed_model = self.previous_embed_model
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write(self, name, lines):
+        path = os.path.join(self.folder, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        return path
+
+    def build(self, pdf_paths):
+        return build_corpus_index(
+            pdf_paths,
+            index_name=self.index_name,
+            manifest=IndexManifest.load(self.manifest_path),
+        )
+
+    def file_texts(self, index):
+        texts = {}
+        for node in index.docstore.docs.values():
+            texts.setdefault(node.metadata["file_name"], []).append(node.get_content())
+        return {name: sorted(lines) for name, lines in texts.items()}
+
+    def test_only_changed_files_are_embedded_again(self):
+        a = self.write("a.pdf", ["Rivers flood in spring.", "Dams hold water."])
+        b = self.write("b.pdf", ["Wages rose last year."])
+        self.build([a, b])
+        self.assertEqual(len(self.embed_model.texts), 3)
+
+        self.embed_model.texts.clear()
+        self.write("a.pdf", ["Rivers flood in autumn."])
+        index = self.build([a, b])
+
+        # The embedded text carries the file name; the hash is kept out of it
+        [text] = self.embed_model.texts
+        self.assertTrue(text.endswith("Rivers flood in autumn."))
+        self.assertNotIn("file_hash", text)
+        self.assertEqual(
+            self.file_texts(index),
+            {"a.pdf": ["Rivers flood in autumn."], "b.pdf": ["Wages rose last year."]},
+        )
+
+    def test_removed_file_nodes_are_deleted(self):
+        a = self.write("a.pdf", ["Rivers flood in spring."])
+        b = self.write("b.pdf", ["Wages rose last year.", "Prices rose too."])
+        self.build([a, b])
+
+        self.embed_model.texts.clear()
+        index = self.build([a])
+
+        self.assertEqual(self.embed_model.texts, [])
+        self.assertEqual(self.file_texts(index), {"a.pdf": ["Rivers flood in spring."]})
+        self.assertEqual(len(index.vector_store.vectors()[index.vector_store._alive]), 1)
+        manifest = IndexManifest.load(self.manifest_path)
+        self.assertNotIn(f"{self.index_name}/b.pdf", manifest.entries)
+
+    def test_file_filter_retrieves_only_that_file(self):
+        a = self.write("a.pdf", [f"Report page {i}." for i in range(5)])
+        b = self.write("b.pdf", [f"Report page {i}." for i in range(5)])
+        index = self.build([a, b])
+
+        query_engine = get_corpus_query_engine(
+            index, file_name="b.pdf", llm=MockLLM(), similarity_top_k=10
+        )
+        nodes = query_engine.retrieve(QueryBundle("Report page"))
+
+        self.assertEqual(len(nodes), 5)
+        self.assertEqual({node.metadata["file_name"] for node in nodes}, {"b.pdf"})
+
+
+if __name__ == "__main__":
+    unittest.main()
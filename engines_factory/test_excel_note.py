@@ -1,8 +1,9 @@
 import unittest
 import os
+import threading
 import openpyxl
 from datetime import datetime
-from excel_note_engine import save_excel_note  # Adjust the import as needed
+from engines_factory.excel_note_engine import get_note_sink, save_excel_note  # Adjust the import as needed
 
 
 class TestSaveExcelNote(unittest.TestCase):
@@ -21,9 +22,10 @@ class TestSaveExcelNote(unittest.TestCase):
             wb.save(self.test_file)
 
     def tearDown(self):
-        # Remove the temporary Excel file after each test
-        if os.path.exists(self.test_file):
-            os.remove(self.test_file)
+        # Remove the temporary Excel file, its note log and lock after each test
+        for path in [self.test_file, f"{self.test_file}.wal", f"{self.test_file}.lock"]:
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_save_note(self):
         # Test saving a note
@@ -33,6 +35,9 @@ class TestSaveExcelNote(unittest.TestCase):
         # Check if the function returns "note saved"
         self.assertEqual(result, "note saved")
 
+        # Notes reach the workbook in batches; write the pending ones now
+        get_note_sink(self.test_file).flush()
+
         # Verify the note is saved in the Excel file
         wb = openpyxl.load_workbook(self.test_file)
         ws = wb["Notes"]
@@ -52,6 +57,21 @@ class TestSaveExcelNote(unittest.TestCase):
         self.assertEqual(saved_note, note)
         self.assertTrue(datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S"))
 
+    def test_concurrent_notes_are_all_saved(self):
+        threads = [
+            threading.Thread(target=save_excel_note, args=(f"note {i}", self.test_file))
+            for i in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        get_note_sink(self.test_file).flush()
+
+        wb = openpyxl.load_workbook(self.test_file)
+        saved_notes = [row[1] for row in wb["Notes"].iter_rows(values_only=True)]
+        self.assertEqual(sorted(n for n in saved_notes if n), sorted(f"note {i}" for i in range(20)))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import os
+import shutil
+from engines_factory.index_manifest import IndexManifest, file_sha256
+
+
+class TestIndexManifest(unittest.TestCase):
+
+    def setUp(self):
+        # Define a temporary source file, index directory and manifest
+        self.source_file = "test_source.pdf"
+        self.index_name = "test_source_index"
+        self.manifest_file = "test_index_manifest.json"
+        self.settings = {"embed_model": "test-model", "chunk_size": 1024}
+
+        with open(self.source_file, "w") as f:
+            f.write("%PDF-1.4\n%Mock PDF content")
+        os.makedirs(self.index_name, exist_ok=True)
+
+    def tearDown(self):
+        # Remove the temporary files after each test
+        for path in (self.source_file, self.manifest_file):
+            if os.path.exists(path):
+                os.remove(path)
+        if os.path.exists(self.index_name):
+            shutil.rmtree(self.index_name)
+
+    def test_recorded_index_is_current(self):
+        manifest = IndexManifest(self.manifest_file)
+        source_hash = manifest.source_hash(self.index_name, self.source_file)
+        manifest.record(self.index_name, self.source_file, source_hash, self.settings)
+        manifest.save()
+
+        # The manifest survives a reload and still matches the unchanged file
+        manifest = IndexManifest.load(self.manifest_file)
+        source_hash = manifest.source_hash(self.index_name, self.source_file)
+        self.assertEqual(source_hash, file_sha256(self.source_file))
+        self.assertTrue(
+            manifest.is_current(self.index_name, source_hash, self.settings)
+        )
+
+    def test_changed_file_or_settings_is_stale(self):
+        manifest = IndexManifest(self.manifest_file)
+        source_hash = manifest.source_hash(self.index_name, self.source_file)
+        manifest.record(self.index_name, self.source_file, source_hash, self.settings)
+
+        # Changing the embedding settings invalidates the index
+        other_settings = dict(self.settings, embed_model="other-model")
+        self.assertFalse(
+            manifest.is_current(self.index_name, source_hash, other_settings)
+        )
+
+        # Editing the file invalidates the index
+        with open(self.source_file, "a") as f:
+            f.write("\n%Edited")
+        new_hash = manifest.source_hash(self.index_name, self.source_file)
+        self.assertNotEqual(new_hash, source_hash)
+        self.assertFalse(manifest.is_current(self.index_name, new_hash, self.settings))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import MagicMock
+from llama_index.core.base.response.schema import Response
+from engines_factory.lazy_engine import EngineCache, LazyQueryEngine
+
+
+class TestLazyQueryEngine(unittest.TestCase):
+
+    def make_engine(self, name, cache, size):
+        # A loader that counts how often the real engine is built
+        loader = MagicMock(
+            side_effect=lambda: MagicMock(**{"query.return_value": Response(name)})
+        )
+        engine = LazyQueryEngine(name, loader, cache=cache, size_fn=lambda _: size)
+        return engine, loader
+
+    def test_loads_on_first_query_only(self):
+        engine, loader = self.make_engine("a", EngineCache(), 10)
+        self.assertFalse(engine.loaded)
+        loader.assert_not_called()
+
+        engine.query("first")
+        engine.query("second")
+        loader.assert_called_once()
+        self.assertEqual(engine.get().query.call_count, 2)
+
+    def test_evicts_least_recently_used_over_budget(self):
+        cache = EngineCache(max_bytes=25)
+        first, first_loader = self.make_engine("first", cache, 10)
+        second, _ = self.make_engine("second", cache, 10)
+        third, _ = self.make_engine("third", cache, 10)
+
+        first.query("q")
+        second.query("q")
+        first.query("q")
+        third.query("q")
+
+        # second was used least recently, so it is the one unloaded
+        self.assertTrue(first.loaded)
+        self.assertFalse(second.loaded)
+        self.assertTrue(third.loaded)
+        self.assertEqual(cache.stats()["bytes"], 20)
+
+        # An evicted engine is rebuilt on its next query
+        second.query("q")
+        self.assertTrue(second.loaded)
+        self.assertEqual(first_loader.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
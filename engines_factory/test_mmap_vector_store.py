@@ -0,0 +1,245 @@
+import unittest
+import os
+import shutil
+from unittest import mock
+
+import numpy as np
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores import (
+    ExactMatchFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+)
+from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+
+from engines_factory import mmap_vector_store
+from engines_factory.ivf_index import ann_recall_report
+from engines_factory.mmap_vector_store import (
+    MmapVectorStore,
+    dequantize,
+    load_storage_context,
+    quantization_recall_report,
+    quantize,
+)
+
+
+class TestMmapVectorStore(unittest.TestCase):
+
+    def setUp(self):
+        # Define a temporary index directory and a few nodes
+        self.persist_dir = "test_mmap_index"
+        self.persist_path = os.path.join(self.persist_dir, "default__vector_store.json")
+        self.nodes = [
+            TextNode(
+                id_=f"node_{i}",
+                text=f"text {i}",
+                embedding=embedding,
+                metadata={"file_name": file_name},
+                relationships={
+                    NodeRelationship.SOURCE: RelatedNodeInfo(node_id=file_name)
+                },
+            )
+            for i, (embedding, file_name) in enumerate(
+                [([1.0, 0.0, 0.0], "a.pdf"), ([0.0, 1.0, 0.0], "a.pdf"),
+                 ([0.0, 0.0, 1.0], "b.pdf")]
+            )
+        ]
+
+    def tearDown(self):
+        # Remove the temporary directory after each test
+        if os.path.exists(self.persist_dir):
+            shutil.rmtree(self.persist_dir)
+
+    def test_query_after_reload(self):
+        store = MmapVectorStore()
+        store.add(self.nodes)
+        store.persist(self.persist_path)
+
+        # The reloaded store is memory mapped and returns the closest node first
+        store = MmapVectorStore.from_persist_dir(self.persist_dir)
+        result = store.query(
+            VectorStoreQuery(query_embedding=[0.1, 0.9, 0.0], similarity_top_k=2)
+        )
+        self.assertEqual(result.ids, ["node_1", "node_0"])
+        self.assertAlmostEqual(result.similarities[0], 0.9939, places=3)
+
+    def test_filters_and_delete(self):
+        store = MmapVectorStore()
+        store.add(self.nodes)
+
+        # Only nodes of the filtered file are candidates
+        filters = MetadataFilters(filters=[ExactMatchFilter(key="file_name", value="b.pdf")])
+        result = store.query(
+            VectorStoreQuery(query_embedding=[1.0, 0.0, 0.0], similarity_top_k=3,
+                             filters=filters)
+        )
+        self.assertEqual(result.ids, ["node_2"])
+
+        # Deleted nodes are not returned, and are dropped when persisting
+        store.delete("a.pdf")
+        store.persist(self.persist_path)
+        store = MmapVectorStore.from_persist_dir(self.persist_dir)
+        result = store.query(
+            VectorStoreQuery(query_embedding=[1.0, 0.0, 0.0], similarity_top_k=3)
+        )
+        self.assertEqual(result.ids, ["node_2"])
+
+    def test_ann_index_is_persisted_and_used(self):
+        store = MmapVectorStore(ann_nlist=2, ann_nprobe=2)
+        store.add(self.nodes)
+        store.persist(self.persist_path)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.persist_dir, "default__vector_store.ivf.npz"))
+        )
+
+        # Probing every list gives the same answer as an exact search
+        store = MmapVectorStore.from_persist_dir(self.persist_dir)
+        query = VectorStoreQuery(query_embedding=[0.0, 0.2, 0.9], similarity_top_k=1)
+        self.assertEqual(store.query(query).ids, ["node_2"])
+        rows, _ = store.search_rows(store.vectors()[2], 1, nprobe=0)
+        self.assertEqual(rows.tolist(), [2])
+
+    def test_ann_index_is_updated_until_rows_drift(self):
+        rng = np.random.default_rng(0)
+
+        def random_nodes(start, count):
+            return [
+                TextNode(
+                    id_=f"node_{i}",
+                    text=f"text {i}",
+                    embedding=rng.normal(size=8).tolist(),
+                    relationships={
+                        NodeRelationship.SOURCE: RelatedNodeInfo(node_id=f"doc_{i % 10}")
+                    },
+                )
+                for i in range(start, start + count)
+            ]
+
+        store = MmapVectorStore(ann_nlist=4, ann_nprobe=4)
+        store.add(random_nodes(0, 100))
+        store.persist(self.persist_path)
+        centroids = store._ivf.centroids
+
+        # Within the growth threshold the trained lists are kept and updated
+        store.add(random_nodes(100, 10))
+        store.delete("doc_0")
+        store.persist(self.persist_path)
+        self.assertIs(store._ivf.centroids, centroids)
+        self.assertEqual(store._ivf.trained_count, 100)
+
+        store = MmapVectorStore.from_persist_dir(self.persist_dir)
+        self.assertEqual(store._ivf.count, 99)
+        self.assertEqual(sorted(store._ivf.order.tolist()), list(range(99)))
+        # Probing every list gives the same answer as an exact search
+        for query in rng.normal(size=(5, 8)):
+            query = query / np.linalg.norm(query)
+            approximate, _ = store.search_rows(query, 5)
+            exact, _ = store.search_rows(query, 5, nprobe=0)
+            self.assertEqual(approximate.tolist(), exact.tolist())
+
+        # Past it they are trained again
+        store.add(random_nodes(110, 30))
+        store.persist(self.persist_path)
+        self.assertEqual(store._ivf.trained_count, 129)
+
+    def test_ann_recall_report_is_exact_when_probing_every_list(self):
+        rng = np.random.default_rng(0)
+        store = MmapVectorStore(ann_nlist=8)
+        store.add(
+            [
+                TextNode(id_=f"node_{i}", text="", embedding=rng.normal(size=16).tolist())
+                for i in range(400)
+            ]
+        )
+        store.persist(self.persist_path)
+
+        report = ann_recall_report(store, top_k=5, nprobe_values=[1, 8])
+
+        self.assertEqual([row["nprobe"] for row in report], ["exact", 1, 8])
+        self.assertLess(report[1]["recall"], 1.0)
+        self.assertEqual(report[2]["recall"], 1.0)
+
+    def test_ann_nprobe_setting_overrides_the_stored_value(self):
+        store = MmapVectorStore(ann_nlist=2, ann_nprobe=1)
+        store.add(self.nodes)
+        store.persist(self.persist_path)
+
+        with mock.patch.object(mmap_vector_store, "ANN_NPROBE", 0):
+            self.assertEqual(MmapVectorStore.from_persist_dir(self.persist_dir).ann_nprobe, 0)
+        self.assertEqual(MmapVectorStore.from_persist_dir(self.persist_dir).ann_nprobe, 1)
+
+    def test_quantized_store_after_reload(self):
+        for dtype in ("float16", "int8"):
+            with self.subTest(dtype=dtype):
+                store = MmapVectorStore()
+                store.configure_dtype(dtype)
+                store.add(self.nodes)
+                store.persist(self.persist_path)
+
+                store = MmapVectorStore.from_persist_dir(self.persist_dir)
+                self.assertEqual(store.vector_dtype, dtype)
+                result = store.query(
+                    VectorStoreQuery(query_embedding=[0.1, 0.9, 0.0], similarity_top_k=2)
+                )
+                self.assertEqual(result.ids, ["node_1", "node_0"])
+                self.assertAlmostEqual(result.similarities[0], 0.9939, places=2)
+
+    def test_legacy_json_store_is_converted_and_kept(self):
+        index = VectorStoreIndex(
+            nodes=self.nodes,
+            storage_context=StorageContext.from_defaults(),
+            embed_model=MockEmbedding(embed_dim=3),
+        )
+        index.storage_context.persist(persist_dir=self.persist_dir)
+
+        storage_context = load_storage_context(self.persist_dir)
+
+        self.assertTrue(MmapVectorStore.exists(self.persist_dir))
+        self.assertFalse(os.path.exists(self.persist_path))
+        self.assertTrue(os.path.exists(f"{self.persist_path}.bak"))
+        result = storage_context.vector_store.query(
+            VectorStoreQuery(query_embedding=[0.0, 0.0, 1.0], similarity_top_k=1)
+        )
+        self.assertEqual(result.ids, ["node_2"])
+
+
+class TestQuantization(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        matrix = rng.normal(size=(500, 64)).astype(np.float32)
+        self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    def test_round_trip(self):
+        for dtype, tolerance in [("float32", 0.0), ("float16", 1e-3), ("int8", 1e-2)]:
+            with self.subTest(dtype=dtype):
+                stored, scales = quantize(self.matrix, dtype)
+                self.assertEqual(stored.dtype, np.dtype(dtype))
+                self.assertEqual(scales is not None, dtype == "int8")
+                restored = dequantize(stored, scales)
+                self.assertEqual(restored.dtype, np.float32)
+                self.assertLessEqual(np.abs(restored - self.matrix).max(), tolerance)
+
+    def test_int8_zero_rows_and_bad_dtype(self):
+        stored, scales = quantize(np.zeros((2, 4), dtype=np.float32), "int8")
+        np.testing.assert_array_equal(dequantize(stored, scales), np.zeros((2, 4)))
+        with self.assertRaises(ValueError):
+            quantize(self.matrix, "int4")
+
+    def test_recall_against_float32(self):
+        report = {
+            row["dtype"]: row for row in quantization_recall_report(self.matrix, top_k=10)
+        }
+
+        self.assertEqual(report["float32"]["recall"], 1.0)
+        self.assertGreaterEqual(report["float16"]["recall"], 0.99)
+        self.assertGreaterEqual(report["int8"]["recall"], 0.9)
+        self.assertEqual(
+            [report[dtype]["bytes_per_vector"] for dtype in ("float32", "float16", "int8")],
+            [256, 128, 68],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from llama_index.experimental.query_engine.pandas import PandasInstructionParser
+
+from engines_factory.columnar_cache import convert_csv
+from engines_factory.out_of_core import ColumnarTable, CsvTable, OutOfCoreInstructionParser
+
+
+class TestOutOfCoreInstructionParser(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.csv_file = os.path.join(self.test_dir, "sales.csv")
+        rng = np.random.default_rng(0)
+        rows = 5000
+        pd.DataFrame(
+            {
+                "region": rng.choice(["north", "south", "east"], rows),
+                "units": rng.integers(0, 1000, rows),
+                "price": rng.integers(100, 10000, rows) / 100,
+            }
+        ).to_csv(self.csv_file, index=False)
+        convert_csv(self.csv_file, os.path.join(self.test_dir, "columns"))
+        self.expected = PandasInstructionParser(pd.read_csv(self.csv_file))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def tables(self):
+        # Small chunks, so every query spans several of them
+        return [
+            ColumnarTable(os.path.join(self.test_dir, "columns"), chunk_rows=700),
+            CsvTable(self.csv_file, chunk_rows=700),
+        ]
+
+    def test_chunked_results_match_pandas(self):
+        queries = [
+            "df['units'].sum()",
+            "len(df[df.price > 50])",
+            "df[(df.region == 'north') & (df.units < 100)]['price'].max()",
+            "df.groupby('region')['units'].sum()",
+            "df.groupby('region').size()",
+            "df['region'].value_counts()",
+            "df.nlargest(3, 'price')[['region', 'price']]",
+        ]
+        for table in self.tables():
+            parser = OutOfCoreInstructionParser(table, in_memory_max_bytes=0)
+            for query in queries:
+                with self.subTest(table=type(table).__name__, query=query):
+                    self.assertEqual(parser.parse(query), self.expected.parse(query))
+
+    def test_narrow_columns_do_not_overflow(self):
+        # Populations fit int32 on disk, but not once multiplied
+        rng = np.random.default_rng(1)
+        pd.DataFrame(
+            {
+                "country": [f"country {i}" for i in range(2000)],
+                "population": rng.integers(1, 1_500_000_000, 2000),
+            }
+        ).to_csv(self.csv_file, index=False)
+        convert_csv(self.csv_file, os.path.join(self.test_dir, "columns"))
+        expected = PandasInstructionParser(pd.read_csv(self.csv_file))
+
+        queries = [
+            "(df['population'] * 100).max()",
+            "(df['population'] * 1000).sum()",
+            "df.nlargest(3, 'population')['country']",
+        ]
+        for table in self.tables():
+            parser = OutOfCoreInstructionParser(table, in_memory_max_bytes=0)
+            for query in queries:
+                with self.subTest(table=type(table).__name__, query=query):
+                    self.assertEqual(parser.parse(query), expected.parse(query))
+
+    def test_unsupported_operation_falls_back_only_within_budget(self):
+        for table in self.tables():
+            query = "df['units'].median()"
+            fallback = OutOfCoreInstructionParser(table, in_memory_max_bytes=2**30)
+            self.assertEqual(fallback.parse(query), self.expected.parse(query))
+
+            refused = OutOfCoreInstructionParser(table, in_memory_max_bytes=0)
+            self.assertIn("not supported", refused.parse(query))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import MagicMock
+
+import pandas as pd
+from llama_index.core.llms import LLMMetadata
+
+from engines_factory.pandas_cache import CachedPandasQueryEngine, PandasQueryCache
+
+
+class TestCachedPandasQueryEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({"units": [1, 2, 3]})
+        self.llm = MagicMock()
+        self.llm.metadata = LLMMetadata(model_name="test-model")
+        self.llm.predict.return_value = "df['units'].sum()"
+
+    def make_engine(self, cache, source_hash="abc"):
+        return CachedPandasQueryEngine(
+            df=self.df, source_hash=source_hash, cache=cache, llm=self.llm
+        )
+
+    def test_repeated_query_skips_llm(self):
+        engine = self.make_engine(PandasQueryCache())
+
+        first = engine.query("What is the total of units?")
+        second = engine.query("  What is the total   of units ")
+
+        self.assertEqual(str(first), "6")
+        self.assertEqual(str(second), "6")
+        self.llm.predict.assert_called_once()
+        self.assertEqual(
+            second.metadata["pandas_instruction_str"], "df['units'].sum()"
+        )
+
+    def test_queries_differing_in_case_miss(self):
+        engine = self.make_engine(PandasQueryCache())
+
+        engine.query("rows where code == 'ON'")
+        engine.query("rows where code == 'on'")
+
+        self.assertEqual(self.llm.predict.call_count, 2)
+
+    def test_changed_file_and_failing_code_miss(self):
+        cache = PandasQueryCache()
+        self.make_engine(cache, "abc").query("total units")
+        self.make_engine(cache, "def").query("total units")
+        self.assertEqual(self.llm.predict.call_count, 2)
+
+        # Outputs of code that failed are retried rather than cached
+        self.llm.predict.return_value = "df['missing'].sum()"
+        engine = self.make_engine(cache, "abc")
+        engine.query("missing total")
+        engine.query("missing total")
+        self.assertEqual(self.llm.predict.call_count, 4)
+
+    def test_evicts_least_recently_used(self):
+        cache = PandasQueryCache(max_entries=2)
+        engine = self.make_engine(cache)
+        for query in ["a", "b", "a", "c"]:
+            engine.query(query)
+
+        self.assertEqual(cache.stats()["evictions"], 1)
+        engine.query("a")
+        self.assertEqual(self.llm.predict.call_count, 3)
+        engine.query("b")
+        self.assertEqual(self.llm.predict.call_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
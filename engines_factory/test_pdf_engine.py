@@ -1,7 +1,7 @@
 import unittest
 import os
 from unittest.mock import patch, MagicMock
-from pdf_engine import (
+from engines_factory.pdf_engine import (
     get_pdf_engine,
     get_pdf_engines_from_folder,
 )  # Adjust the import as needed
@@ -26,8 +26,8 @@ class TestPDFEngines(unittest.TestCase):
                 os.remove(os.path.join(self.test_pdf_folder, file))
             os.rmdir(self.test_pdf_folder)
 
-    @patch("pdf_engine.SimpleDirectoryReader")
-    @patch("pdf_engine.get_index")
+    @patch("engines_factory.pdf_ingestion.SimpleDirectoryReader")
+    @patch("engines_factory.pdf_engine.get_index")
     def test_get_pdf_engine(self, mock_get_index, mock_reader):
         # Mock the behavior of SimpleDirectoryReader and get_index
         mock_reader_instance = MagicMock()
@@ -42,7 +42,7 @@ class TestPDFEngines(unittest.TestCase):
         engine = get_pdf_engine("test_document.pdf", "test_index")
         self.assertEqual(engine, "mock query engine")
 
-    @patch("pdf_engine.get_pdf_engine")
+    @patch("engines_factory.pdf_engine.get_pdf_engine")
     def test_get_pdf_engines_from_folder(self, mock_get_pdf_engine):
         # Mock the behavior of get_pdf_engine
         mock_get_pdf_engine.return_value = "mock query engine"
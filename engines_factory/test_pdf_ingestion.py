@@ -0,0 +1,149 @@
+import os
+import shutil
+import unittest
+from typing import List
+from unittest import mock
+
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import Document, TextNode
+
+from engines_factory import pdf_ingestion
+from engines_factory.index_manifest import IndexManifest
+from engines_factory.pdf_ingestion import CHECKPOINT_FILE_NAME, build_index_streaming
+
+
+class CountingEmbedding(MockEmbedding):
+    """A MockEmbedding that counts the texts it embeds."""
+
+    embedded: int = 0
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.embedded += len(texts)
+        return super()._get_text_embeddings(texts)
+
+
+class FailingEmbedding(MockEmbedding):
+    """A MockEmbedding that fails on batches containing the word "broken"."""
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if any("broken" in text for text in texts):
+            raise RuntimeError("embedding failed")
+        return super()._get_text_embeddings(texts)
+
+
+class TestFinishIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.index_names = ["test_finish_good", "test_finish_broken"]
+        self.previous_embed_model = Settings._embed_model
+        Settings.embed_model = FailingEmbedding(embed_dim=8)
+
+    def tearDown(self):
+        Settings._embed_model = self.previous_embed_model
+        for index_name in self.index_names:
+            shutil.rmtree(index_name, ignore_errors=True)
+
+    def test_embedding_failure_drops_only_the_failing_file(self):
+        buffered = [
+            (0, "hash0", [TextNode(text="A good page.")]),
+            (1, "hash1", [TextNode(text="A broken page.")]),
+        ]
+        indexes = [None, None]
+        manifest = IndexManifest("test_finish_manifest.json")
+
+        with mock.patch.object(manifest, "record"), mock.patch.object(manifest, "save"):
+            pdf_ingestion._finish_indexes(
+                buffered, ["good.pdf", "broken.pdf"], self.index_names, indexes,
+                manifest, {}, embed_batch_size=8,
+            )
+
+        self.assertIsNotNone(indexes[0])
+        self.assertIsNone(indexes[1])
+
+
+class TestBuildIndexStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.index_name = "test_streaming_index"
+        self.documents = [
+            Document(text=f"Page {i} of the manual.", metadata={"page_label": str(i + 1)})
+            for i in range(10)
+        ]
+        self.embed_model = CountingEmbedding(embed_dim=8)
+        self.previous_embed_model = Settings._embed_model
+        Settings.embed_model = self.embed_model
+
+    def tearDown(self):
+        Settings._embed_model = self.previous_embed_model
+        if os.path.exists(self.index_name):
+            shutil.rmtree(self.index_name)
+
+    def pages(self, fail_at=None):
+        def pages_from(start):
+            for position in range(start, len(self.documents)):
+                if position == fail_at:
+                    raise RuntimeError("interrupted")
+                yield self.documents[position]
+
+        return pages_from
+
+    def build(self, pages):
+        return build_index_streaming(
+            pages, self.index_name, key="source", page_batch=2, checkpoint_pages=4
+        )
+
+    def test_interrupted_build_resumes_from_checkpoint(self):
+        with self.assertRaises(RuntimeError):
+            self.build(self.pages(fail_at=7))
+        # Pages 0-3 were checkpointed; pages 4-5 were embedded but not saved
+        self.assertTrue(os.path.exists(os.path.join(self.index_name, CHECKPOINT_FILE_NAME)))
+        self.assertEqual(self.embed_model.embedded, 6)
+
+        index = self.build(self.pages())
+
+        self.assertEqual(self.embed_model.embedded, 12)
+        self.assertEqual(len(index.index_struct.nodes_dict), 10)
+        self.assertFalse(os.path.exists(os.path.join(self.index_name, CHECKPOINT_FILE_NAME)))
+
+    def test_crash_before_checkpoint_does_not_duplicate_pages(self):
+        write_checkpoint = pdf_ingestion._write_checkpoint
+
+        def crash_at_second_checkpoint(path, key, pages_done):
+            if pages_done == 8:
+                raise RuntimeError("crashed")
+            write_checkpoint(path, key, pages_done)
+
+        # Pages 0-7 are persisted, but the checkpoint still says 4
+        with mock.patch.object(pdf_ingestion, "_write_checkpoint", crash_at_second_checkpoint):
+            with self.assertRaises(RuntimeError):
+                self.build(self.pages())
+
+        index = self.build(self.pages())
+
+        texts = sorted(node.get_content() for node in index.docstore.docs.values())
+        self.assertEqual(texts, sorted(document.text for document in self.documents))
+        self.assertEqual(len(index.index_struct.nodes_dict), 10)
+
+    def test_changed_key_starts_over(self):
+        with self.assertRaises(RuntimeError):
+            self.build(self.pages(fail_at=5))
+
+        index = build_index_streaming(
+            self.pages(), self.index_name, key="changed source", page_batch=2
+        )
+
+        self.assertEqual(self.embed_model.embedded, 4 + 10)
+        self.assertEqual(len(index.index_struct.nodes_dict), 10)
+
+    def test_ann_setting_reaches_the_new_index(self):
+        index = build_index_streaming(self.pages(), self.index_name, ann_nlist=2)
+
+        self.assertEqual(index.vector_store.ann_nlist, 2)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.index_name, "default__vector_store.ivf.npz"))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from typing import List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.tools import FunctionTool
+
+from engines_factory.tool_router import ToolRouter
+
+
+KEYWORDS = ("wage", "river", "census", "budget")
+
+
+class KeywordEmbedding(BaseEmbedding):
+    """Embeds a text as the counts of a few keywords, and counts the texts it embeds."""
+
+    embedded: int = 0
+
+    def _embed(self, text: str) -> List[float]:
+        words = text.lower().replace(".", " ").split()
+        return [float(sum(word.startswith(key) for word in words)) for key in KEYWORDS]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        self.embedded += 1
+        return self._embed(text)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+
+def make_tool(name, description):
+    return FunctionTool.from_defaults(fn=lambda: "", name=name, description=description)
+
+
+class TestToolRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.embed_model = KeywordEmbedding()
+        self.tools = [
+            make_tool("csv_data_1", "Minimum wage by state."),
+            make_tool("pdf_data_1", "River flood reports."),
+            make_tool("pdf_data_2", "Census of households."),
+            make_tool("excel_note_saver", "Saves a note."),
+        ]
+        self.router = ToolRouter(
+            self.tools, top_n=1, always_include=["excel_note_saver"], embed_model=self.embed_model
+        )
+
+    def names(self, tools):
+        return [tool.metadata.name for tool in tools]
+
+    def test_selects_most_similar_and_always_included(self):
+        self.assertEqual(
+            self.names(self.router.retrieve("How did the river rise?")),
+            ["pdf_data_1", "excel_note_saver"],
+        )
+        self.assertEqual(
+            self.names(self.router.retrieve("What is the wage in Ohio?")),
+            ["csv_data_1", "excel_note_saver"],
+        )
+        # Each tool is embedded once; the note tool is never embedded
+        self.assertEqual(self.embed_model.embedded, 3)
+
+    def test_routes_on_the_new_prompt_only(self):
+        message = (
+            "Here is the relevant history:\nPrompt: river river census\n"
+            "Response: The river rose.\n\nNew prompt: And the wage?"
+        )
+        self.assertEqual(
+            self.names(self.router.retrieve(message)), ["csv_data_1", "excel_note_saver"]
+        )
+
+    def test_embeds_only_added_tools(self):
+        self.router.retrieve("river")
+        self.tools.append(make_tool("csv_data_2", "Budget of each city."))
+
+        self.assertEqual(
+            self.names(self.router.retrieve("the city budget")),
+            ["excel_note_saver", "csv_data_2"],
+        )
+        self.assertEqual(self.embed_model.embedded, 4)
+
+    def test_offers_all_tools_when_few(self):
+        self.router.top_n = 3
+        self.assertEqual(self.router.retrieve("river"), self.tools)
+
+
+if __name__ == "__main__":
+    unittest.main()
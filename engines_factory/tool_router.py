@@ -0,0 +1,133 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.tools import BaseTool
+
+
+logger = logging.getLogger(__name__)
+TOOL_ROUTING = os.getenv("TOOL_ROUTING", "false").lower() == "true"
+# The tools offered to the agent per user turn, besides the always included ones
+TOOL_ROUTER_TOP_N = int(os.getenv("TOOL_ROUTER_TOP_N", "8"))
+TOOL_ROUTER_ALWAYS_INCLUDE = [
+    name.strip()
+    for name in os.getenv("TOOL_ROUTER_ALWAYS_INCLUDE", "excel_note_saver").split(",")
+    if name.strip()
+]
+# Prompts that carry conversation history put the new message after this marker
+NEW_PROMPT_MARKER = "New prompt:"
+
+
+def tool_text(tool: BaseTool) -> str:
+    """Returns the text a tool is embedded by: its name and description."""
+    return f"{tool.metadata.name}: {tool.metadata.description}"
+
+
+class ToolRouter:
+    """
+    Selects the tools relevant to a user turn by embedding similarity, so the
+    agent's prompt lists a few tools instead of one per document. Each tool's
+    name and description are embedded once and kept; tools added to or
+    replaced in the list later are embedded on the first turn that sees them.
+    The selected tools are returned in list order, which keeps the prompt
+    stable across turns that route to the same tools.
+
+    Passed to ReActAgent.from_tools as tool_retriever, which calls retrieve with
+    the user message at every reasoning step. When the message carries the
+    conversation history, only the text after NEW_PROMPT_MARKER is routed on,
+    so the tools follow the new question rather than the earlier turns.
+
+    Args:
+        tools (List[BaseTool]): All the tools. The list is read on each turn, so
+            changes to it are picked up.
+        top_n (int): The number of most similar tools offered per turn.
+        always_include (Sequence[str]): The names of tools offered on every turn.
+        embed_model (BaseEmbedding, optional): Embeds the tools and messages.
+            Defaults to Settings.embed_model.
+    """
+
+    def __init__(
+        self,
+        tools: List[BaseTool],
+        top_n: int = TOOL_ROUTER_TOP_N,
+        always_include: Sequence[str] = TOOL_ROUTER_ALWAYS_INCLUDE,
+        embed_model: Optional[BaseEmbedding] = None,
+    ):
+        self.tools = tools
+        self.top_n = top_n
+        self.always_include = set(always_include)
+        self._embed_model = embed_model
+        self._embeddings: Dict[str, np.ndarray] = {}
+        self._last_query: Tuple[str, Optional[np.ndarray]] = ("", None)
+        self._lock = threading.Lock()
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        return self._embed_model or Settings.embed_model
+
+    def _tool_embeddings(self, tools: List[BaseTool]) -> np.ndarray:
+        """Returns the normalized embeddings of the tools, embedding the new ones in one batch."""
+        texts = [tool_text(tool) for tool in tools]
+        with self._lock:
+            missing = list(dict.fromkeys(text for text in texts if text not in self._embeddings))
+        if missing:
+            vectors = self.embed_model.get_text_embedding_batch(missing)
+            with self._lock:
+                for text, vector in zip(missing, vectors):
+                    self._embeddings[text] = _normalize(vector)
+                # Forget the descriptions of tools that were replaced or removed
+                live = set(texts)
+                for text in list(self._embeddings):
+                    if text not in live:
+                        del self._embeddings[text]
+        with self._lock:
+            return np.stack([self._embeddings[text] for text in texts])
+
+    def _query_embedding(self, message: str) -> np.ndarray:
+        # The worker retrieves at every step of a turn with the same message
+        with self._lock:
+            last_message, last_embedding = self._last_query
+        if last_embedding is not None and last_message == message:
+            return last_embedding
+        embedding = _normalize(self.embed_model.get_query_embedding(message))
+        with self._lock:
+            self._last_query = (message, embedding)
+        return embedding
+
+    def retrieve(self, message: str) -> List[BaseTool]:
+        """
+        Returns the tools to offer for a user message: the top_n most similar
+        to it plus the always included ones, in list order. All tools are
+        returned if there are no more than that, or if embedding fails.
+
+        Args:
+            message (str): The user message.
+
+        Returns:
+            List[BaseTool]: The selected tools.
+        """
+        message = message.rpartition(NEW_PROMPT_MARKER)[2]
+        tools = list(self.tools)
+        pinned = [tool.metadata.name in self.always_include for tool in tools]
+        candidates = [tool for tool, pin in zip(tools, pinned) if not pin]
+        if len(candidates) <= self.top_n or not message.strip():
+            return tools
+        try:
+            similarities = self._tool_embeddings(candidates) @ self._query_embedding(message)
+        except Exception as e:
+            logger.error(f"Offering all tools, routing failed. Error was {e}")
+            return tools
+
+        best = np.argsort(-similarities, kind="stable")[: self.top_n]
+        selected = {id(candidates[i]) for i in best}
+        return [tool for tool, pin in zip(tools, pinned) if pin or id(tool) in selected]
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
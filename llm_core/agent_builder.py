@@ -1,66 +1,351 @@
 import os
+import shutil
+import threading
 from llama_index.core.agent import ReActAgent
 from .llm_setup import groq_llm
 from .agent_helpers import (
     create_tools_from_query_engines,
     create_csv_query_engines_from_folder,
+    create_lazy_csv_query_engines_from_folder,
+    create_lazy_pdf_engines_from_folder,
     create_pdf_engines_from_folder,
+    create_pdf_corpus_tool,
+    DESCRIPTION_WORKERS,
 )
 from .prompts_setup import context
+from engines_factory.columnar_cache import CsvColumnarCache
 from engines_factory.excel_note_engine import excel_note_engine
+from engines_factory.hybrid_retriever import create_pdf_query_engine
+from engines_factory.lazy_engine import EngineCache
+from engines_factory.pandas_cache import PandasQueryCache
+from engines_factory.pdf_ingestion import build_pdf_indexes
+from engines_factory.tool_router import TOOL_ROUTING, ToolRouter
 
 DATA_FOLDER = "data"
 CSV_FOLDER_NAME = "csv"
 PDF_FOLDER_NAME = "pdf"
+PDF_INGEST_WORKERS = int(os.getenv("PDF_INGEST_WORKERS", "1"))
+SHARED_PDF_INDEX = os.getenv("SHARED_PDF_INDEX", "false").lower() == "true"
+LAZY_TOOLS = os.getenv("LAZY_TOOLS", "false").lower() == "true"
+TOOL_MEMORY_MB = int(os.getenv("TOOL_MEMORY_MB", "1024"))
+CSV_COLUMNAR_CACHE = os.getenv("CSV_COLUMNAR_CACHE", "false").lower() == "true"
+CSV_CACHE_DIR = os.getenv("CSV_CACHE_DIR", "csv_cache")
+OUT_OF_CORE_CSV = os.getenv("OUT_OF_CORE_CSV", "false").lower() == "true"
+IN_MEMORY_MAX_MB = int(os.getenv("IN_MEMORY_MAX_MB", "256"))
+PANDAS_CACHE_MAX_ENTRIES = int(os.getenv("PANDAS_CACHE_MAX_ENTRIES", "1024"))
 
+# Serializes changes to a running agent's tools made from different threads
+tools_lock = threading.Lock()
 
-def build_agent(
+
+def build_tools(
     data_folder=DATA_FOLDER,
     csv_folder_name=CSV_FOLDER_NAME,
     pdf_folder_name=PDF_FOLDER_NAME,
+    pdf_ingest_workers=PDF_INGEST_WORKERS,
+    shared_pdf_index=SHARED_PDF_INDEX,
+    description_workers=DESCRIPTION_WORKERS,
+    lazy_tools=LAZY_TOOLS,
+    tool_memory_mb=TOOL_MEMORY_MB,
+    csv_columnar_cache=CSV_COLUMNAR_CACHE,
+    out_of_core_csv=OUT_OF_CORE_CSV,
+    pandas_cache_max_entries=PANDAS_CACHE_MAX_ENTRIES,
 ):
     """
-    Builds and returns a ReActAgent with tools created from CSV and PDF query engines.
+    Builds the agent's tools from the CSV and PDF query engines, plus the note
+    tool. The tools hold no per-conversation state, so one list can be shared
+    by many agents.
 
     Parameters:
     - data_folder (str): The base folder where data is stored.
     - csv_folder_name (str): The folder name for CSV files.
     - pdf_folder_name (str): The folder name for PDF files.
+    - pdf_ingest_workers (int): The number of processes used to parse PDFs.
+    - shared_pdf_index (bool): Whether to ingest all PDFs into one shared index
+      exposed as a single corpus tool, instead of one index and tool per PDF.
+    - description_workers (int): The maximum number of tool descriptions
+      generated at once.
+    - lazy_tools (bool): Whether to load each CSV and PDF index only when its
+      tool is first called, instead of loading all of them up front.
+    - tool_memory_mb (int): The memory budget of the loaded lazy tools. The
+      least recently used ones are unloaded beyond it.
+    - csv_columnar_cache (bool): Whether to convert each CSV once into a
+      columnar, memory mapped cache in CSV_CACHE_DIR and load it from there.
+    - out_of_core_csv (bool): Whether to query CSV files larger than
+      IN_MEMORY_MAX_MB in chunks instead of loading them into memory.
+    - pandas_cache_max_entries (int): The number of answered CSV queries kept
+      to answer repeated queries without the LLM. 0 disables the cache.
 
     Returns:
-    - ReActAgent: An instance of the ReActAgent configured with the necessary tools.
+    - List: The tools.
     """
     print("Setting up the agent...")
 
+    # In lazy mode, engines are loaded on their first query and evicted over budget
+    engine_cache = EngineCache(max_bytes=tool_memory_mb * 1024 * 1024)
+
     # Create query engines for CSV files
     csv_files_folder = os.path.join(data_folder, csv_folder_name)
-    csv_query_engines_list = create_csv_query_engines_from_folder(csv_files_folder)
+    csv_cache = CsvColumnarCache(CSV_CACHE_DIR) if csv_columnar_cache else None
+    in_memory_max_mb = IN_MEMORY_MAX_MB if out_of_core_csv else None
+    query_cache = (
+        PandasQueryCache(pandas_cache_max_entries) if pandas_cache_max_entries else None
+    )
+    if lazy_tools:
+        csv_query_engines_list, csv_sources = create_lazy_csv_query_engines_from_folder(
+            csv_files_folder,
+            cache=engine_cache,
+            return_sources=True,
+            csv_cache=csv_cache,
+            in_memory_max_mb=in_memory_max_mb,
+            query_cache=query_cache,
+        )
+    else:
+        csv_query_engines_list, csv_sources = create_csv_query_engines_from_folder(
+            csv_files_folder,
+            return_sources=True,
+            csv_cache=csv_cache,
+            in_memory_max_mb=in_memory_max_mb,
+            query_cache=query_cache,
+        )
     print(
         f"{len(csv_query_engines_list)} CSV query engines have been created successfully."
     )
 
-    # Create query engines for PDF files
+    # Create query engines for PDF files, or a single tool over the PDF corpus
     pdf_files_folder = os.path.join(data_folder, pdf_folder_name)
-    pdf_query_engines_list = create_pdf_engines_from_folder(pdf_files_folder)
-    print(
-        f"{len(pdf_query_engines_list)} PDF query engines have been created successfully."
-    )
+    pdf_query_engines_list = []
+    pdf_sources = []
+    if shared_pdf_index:
+        pdf_corpus_tool = create_pdf_corpus_tool(
+            pdf_files_folder, workers=pdf_ingest_workers
+        )
+        print("The PDF corpus tool has been created successfully.")
+    elif lazy_tools:
+        pdf_query_engines_list, pdf_sources = create_lazy_pdf_engines_from_folder(
+            pdf_files_folder,
+            cache=engine_cache,
+            workers=pdf_ingest_workers,
+            return_sources=True,
+        )
+    else:
+        pdf_query_engines_list, pdf_sources = create_pdf_engines_from_folder(
+            pdf_files_folder, workers=pdf_ingest_workers, return_sources=True
+        )
+    if not shared_pdf_index:
+        print(
+            f"{len(pdf_query_engines_list)} PDF query engines have been created successfully."
+        )
 
-    # Create tools from query engines
+    # Create tools from query engines, reusing cached descriptions of unchanged files
     tools = create_tools_from_query_engines(
-        csv_query_engines_list, pdf_query_engines_list
+        csv_query_engines_list,
+        pdf_query_engines_list,
+        csv_sources=csv_sources,
+        pdf_sources=pdf_sources,
+        max_workers=description_workers,
     )
+    if shared_pdf_index:
+        tools.append(pdf_corpus_tool)
 
     # Add excel engine tool to save notes
     tools.append(excel_note_engine)
+    return tools
+
+
+def create_agent(tools, verbose=True, tool_router=None):
+    """
+    Creates a ReActAgent over already built tools. The agent holds its own
+    chat memory, so each conversation needs its own agent.
+
+    Parameters:
+    - tools (List): The tools, as returned by build_tools.
+    - verbose (bool): Whether to print the agent's reasoning.
+    - tool_router (ToolRouter, optional): Selects the tools offered on each
+      turn. Defaults to a new router over tools with TOOL_ROUTING, and to
+      offering every tool without it. Agents sharing tools can share one
+      router, so each tool is embedded once.
+
+    Returns:
+    - ReActAgent: The agent.
+    """
+    if tool_router is None and TOOL_ROUTING:
+        tool_router = ToolRouter(tools)
+    if tool_router is None:
+        agent = ReActAgent.from_tools(tools, llm=groq_llm, verbose=verbose, context=context)
+    else:
+        agent = ReActAgent.from_tools(
+            tool_retriever=tool_router, llm=groq_llm, verbose=verbose, context=context
+        )
+    # The agent offers this very list, so tools appended to it are picked up
+    agent.tools = tools
+    agent.tool_router = tool_router
+    return agent
+
+
+def build_agent(**kwargs):
+    """
+    Builds and returns a ReActAgent with tools created from CSV and PDF query engines.
 
-    # Create the agent
-    agent = ReActAgent.from_tools(tools, llm=groq_llm, verbose=True, context=context)
+    Parameters:
+    - **kwargs: The options of build_tools.
 
+    Returns:
+    - ReActAgent: An instance of the ReActAgent configured with the necessary tools.
+    """
+    agent = create_agent(build_tools(**kwargs))
     print("Agent setup is done.")
     return agent
 
 
+def answer_deltas(deltas):
+    """Yields the streamed answer without the agent's "Thought: ... Answer:" preamble."""
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        if "Answer:" in buffer:
+            answer = buffer.split("Answer:", 1)[1].lstrip()
+            break
+        if len(buffer) >= len("Thought") and not buffer.startswith("Thought"):
+            answer = buffer
+            break
+    else:
+        # The stream ended without an answer marker; show what came
+        if buffer:
+            yield buffer
+        return
+    if answer:
+        yield answer
+    yield from deltas
+
+
+def agent_tools(agent):
+    """
+    Returns the tool list of an agent built by create_agent. The ReAct worker,
+    or the tool router, keeps the list it was built with, so tools appended to
+    it are offered to the LLM from the next step on.
+    """
+    return agent.tools
+
+
+def tool_number(tools, prefix, source_file=None):
+    """
+    Returns the number to name a tool with, for tool names made of prefix and a
+    number. A file that already has a tool keeps its number; a new one gets one
+    above the highest in use, so a removed tool's name is not reused.
+    """
+    old = source_tool(tools, source_file) if source_file is not None else None
+    if old is not None and old.metadata.name[len(prefix) :].isdigit():
+        return int(old.metadata.name[len(prefix) :])
+    numbers = [
+        int(tool.metadata.name[len(prefix) :])
+        for tool in tools
+        if tool.metadata.name.startswith(prefix) and tool.metadata.name[len(prefix) :].isdigit()
+    ]
+    return max(numbers, default=0) + 1
+
+
+def source_tool(tools, source_file):
+    """Returns the tool built from a source file, or None."""
+    source_file = os.path.abspath(source_file)
+    for tool in tools:
+        source = getattr(tool, "source_file", None)
+        if source is not None and os.path.abspath(source) == source_file:
+            return tool
+    return None
+
+
+def put_tool(tools, tool):
+    """
+    Adds a tool to a running agent's tool list, replacing the tool with the
+    same source file or name if there is one. The agent offers the new tool
+    from its next step on.
+    """
+    with tools_lock:
+        old = None
+        if getattr(tool, "source_file", None) is not None:
+            old = source_tool(tools, tool.source_file)
+        if old is None:
+            old = next((t for t in tools if t.metadata.name == tool.metadata.name), None)
+        if old is None:
+            tools.append(tool)
+        else:
+            tools[tools.index(old)] = tool
+
+
+def remove_tool(tools, tool):
+    """Removes a tool from a running agent's tool list, if it is still there."""
+    with tools_lock:
+        if tool in tools:
+            tools.remove(tool)
+
+
+def add_pdf_tool(
+    agent,
+    pdf_path,
+    data_folder=DATA_FOLDER,
+    pdf_folder_name=PDF_FOLDER_NAME,
+    progress=None,
+    embed_batch_size=32,
+    shared_pdf_index=SHARED_PDF_INDEX,
+):
+    """
+    Indexes a PDF and adds a tool for it to a running agent. The file is copied
+    into the PDF folder first, so it is also loaded on the next start. With a
+    shared PDF index the file is added to the corpus instead, and the corpus
+    tool is replaced so its description lists the new file.
+
+    Parameters:
+    - agent (ReActAgent): An agent built by build_agent.
+    - pdf_path (str): The PDF file to add.
+    - data_folder (str): The base folder where data is stored.
+    - pdf_folder_name (str): The folder name for PDF files.
+    - progress (Callable[[int, int], None], optional): Called with the number
+      of chunks embedded so far and their total, or for a large PDF that is
+      streamed, the pages indexed so far and the page count.
+    - embed_batch_size (int): The chunks embedded per batch; smaller batches
+      report progress more often.
+    - shared_pdf_index (bool): Whether the PDFs are served by one corpus tool.
+
+    Returns:
+    - BaseTool: The new tool.
+    """
+    pdf_folder = os.path.join(data_folder, pdf_folder_name)
+    os.makedirs(pdf_folder, exist_ok=True)
+    file_name = os.path.basename(pdf_path)
+    target_path = os.path.join(pdf_folder, file_name)
+    if os.path.abspath(pdf_path) != os.path.abspath(target_path):
+        shutil.copyfile(pdf_path, target_path)
+
+    if shared_pdf_index:
+        tool = create_pdf_corpus_tool(
+            pdf_folder, embed_batch_size=embed_batch_size, progress=progress
+        )
+        put_tool(agent_tools(agent), tool)
+        print(f"Added {file_name} to the tool {tool.metadata.name}.")
+        return tool
+
+    # Indexes are stored under the file name without extension, as at startup
+    index_name = os.path.splitext(file_name)[0]
+    [index] = build_pdf_indexes(
+        [target_path], [index_name], embed_batch_size=embed_batch_size, progress=progress
+    )
+    if index is None:
+        raise RuntimeError(f"Could not index {file_name}")
+
+    tools = agent_tools(agent)
+    number = tool_number(tools, "pdf_data_", target_path)
+    [tool] = create_tools_from_query_engines(
+        [],
+        [create_pdf_query_engine(index, index_name)],
+        pdf_sources=[target_path],
+        pdf_offset=number - 1,
+    )
+    put_tool(tools, tool)
+    print(f"Added the tool {tool.metadata.name} for {file_name}.")
+    return tool
+
+
 # Example usage
 # if __name__ == "__main__":
 #     agent = build_agent()
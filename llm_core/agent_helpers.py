@@ -1,30 +1,150 @@
 import os
+import threading
 import pandas as pd
-from typing import List
-from llama_index.experimental.query_engine import PandasQueryEngine
-from llama_index.core import (
-    StorageContext,
-    VectorStoreIndex,
-    load_index_from_storage,
-    SimpleDirectoryReader,
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from llama_index.core.tools import FunctionTool, QueryEngineTool, ToolMetadata
+
+from engines_factory.corpus_index import build_corpus_index, get_corpus_query_engine
+from engines_factory.hybrid_retriever import create_pdf_query_engine
+from engines_factory.index_manifest import (
+    IndexManifest,
+    current_index_settings,
+    file_sha256,
+)
+from engines_factory.lazy_engine import (
+    LazyQueryEngine,
+    dataframe_engine_bytes,
+    directory_bytes,
 )
-from llama_index.core.tools import QueryEngineTool, ToolMetadata
+from engines_factory.out_of_core import ColumnarTable, CsvTable, create_table_query_engine
+from engines_factory.pandas_cache import CachedPandasQueryEngine
+from engines_factory.pdf_ingestion import build_pdf_indexes, load_index
 
 from .prompts_setup import new_prompt
 from .llm_setup import groq_llm
+from .rate_limiter import BACKGROUND, request_lane
+from .sqlite_cache import SqliteCache
+
+DESCRIPTION_CACHE_PATH = os.getenv("DESCRIPTION_CACHE_PATH", "description_cache.sqlite")
+DESCRIPTION_WORKERS = int(os.getenv("DESCRIPTION_WORKERS", "4"))
+# Keeps the hash of each described file, reused while its size and mtime match
+DESCRIPTION_MANIFEST_PATH = os.path.splitext(DESCRIPTION_CACHE_PATH)[0] + "_manifest.json"
+# Version 2 descriptions do not name the tool number, which is added to each tool
+DESCRIPTION_CACHE_VERSION = 2
+_description_manifest_lock = threading.Lock()
+
+
+def read_csv_table(file_path, csv_cache=None):
+    """
+    Reads a CSV file into a DataFrame, through the columnar cache when one is given.
+
+    Parameters:
+    - file_path (str): The CSV file.
+    - csv_cache (CsvColumnarCache, optional): The columnar cache.
+
+    Returns:
+    - pd.DataFrame: The table.
+    """
+    if csv_cache is None:
+        return pd.read_csv(file_path)
+    df = csv_cache.load(file_path)
+    report = csv_cache.reports[-1]
+    print(
+        f"Loaded {file_path} from the columnar cache in {report['cache_load_s']:.2f}s "
+        f"(CSV parse {report['csv_load_s']:.2f}s), using "
+        f"{report['cache_memory_bytes'] / 2**20:.1f} MB instead of "
+        f"{report['csv_memory_bytes'] / 2**20:.1f} MB ({report['memory_saved']:.0%} saved)."
+    )
+    return df
+
+
+def csv_source_hash(file_path, csv_cache=None):
+    """
+    Returns the content hash of a CSV file. The columnar cache already knows
+    the hash of an unchanged file, so the file is only read when it changed.
+    """
+    if csv_cache is None:
+        return file_sha256(file_path)
+    return os.path.basename(csv_cache.convert(file_path)[0])
+
+
+def create_csv_query_engine(
+    file_path,
+    verbose=False,
+    prompt=new_prompt,
+    csv_cache=None,
+    in_memory_max_mb=None,
+    query_cache=None,
+):
+    """
+    Creates a PandasQueryEngine for a CSV file.
+
+    Parameters:
+    - file_path (str): The CSV file.
+    - verbose (bool): Whether to enable verbose mode for the query engine.
+    - prompt (PromptTemplate): The pandas prompt of the query engine.
+    - csv_cache (CsvColumnarCache, optional): The columnar cache to load from.
+    - in_memory_max_mb (int, optional): If given, files larger than this are
+      not loaded but queried out of core, in chunks.
+    - query_cache (PandasQueryCache, optional): Answers repeated queries
+      against the unchanged file without calling the LLM.
+
+    Returns:
+    - PandasQueryEngine: The query engine.
+    """
+    cache_kwargs = {}
+    if query_cache is not None:
+        cache_kwargs = {
+            "source_hash": csv_source_hash(file_path, csv_cache),
+            "cache": query_cache,
+        }
+    if in_memory_max_mb is None:
+        df = read_csv_table(file_path, csv_cache)
+        query_engine = CachedPandasQueryEngine(df=df, verbose=verbose, **cache_kwargs)
+    else:
+        if csv_cache is None:
+            table = CsvTable(file_path)
+        else:
+            table = ColumnarTable(csv_cache.convert(file_path)[0])
+        query_engine = create_table_query_engine(
+            table,
+            in_memory_max_bytes=in_memory_max_mb * 1024 * 1024,
+            verbose=verbose,
+            **cache_kwargs,
+        )
+    query_engine.update_prompts({"pandas_prompt": prompt})
+    return query_engine
+
 
-def create_csv_query_engines_from_folder(folder_path, verbose=False, prompt=new_prompt):
+def create_csv_query_engines_from_folder(
+    folder_path,
+    verbose=False,
+    prompt=new_prompt,
+    return_sources=False,
+    csv_cache=None,
+    in_memory_max_mb=None,
+    query_cache=None,
+):
     """
     Creates a list of PandasQueryEngine instances for all CSV files in the specified folder.
 
     Parameters:
     - folder_path (str): The path to the folder containing CSV files.
     - verbose (bool): Whether to enable verbose mode for the query engines.
+    - return_sources (bool): Whether to also return the path of each engine's file.
+    - csv_cache (CsvColumnarCache, optional): Loads the CSV files from a
+      columnar cache instead of parsing them on every start.
+    - in_memory_max_mb (int, optional): If given, files larger than this are
+      queried out of core instead of loaded into memory.
+    - query_cache (PandasQueryCache, optional): The cache of answered queries.
 
     Returns:
-    - List[PandasQueryEngine]: A list of PandasQueryEngine instances.
+    - List[PandasQueryEngine]: A list of PandasQueryEngine instances, or a tuple
+      of that list and the matching list of file paths if return_sources is True.
     """
     query_engines = []
+    sources = []
 
     try:
         # Iterate over all files in the specified folder
@@ -32,20 +152,15 @@ def create_csv_query_engines_from_folder(folder_path, verbose=False, prompt=new_
             # Check if the file is a CSV file
             if file_name.endswith(".csv"):
                 file_path = os.path.join(folder_path, file_name)
-                try:
-                    # Read the CSV file into a DataFrame
-                    df = pd.read_csv(file_path)
-                except Exception as e:
-                    print(f"Error occurred while reading {file_name}: {e}")
-                    continue
-
                 try:
                     # Create a PandasQueryEngine instance
-                    query_engine = PandasQueryEngine(df=df, verbose=verbose)
-                    query_engine.update_prompts({"pandas_prompt": prompt})
+                    query_engine = create_csv_query_engine(
+                        file_path, verbose, prompt, csv_cache, in_memory_max_mb, query_cache
+                    )
 
                     # Add the query engine to the list
                     query_engines.append(query_engine)
+                    sources.append(file_path)
                 except Exception as e:
                     print(
                         f"Error occurred while creating query engine for {file_name}: {e}"
@@ -55,56 +170,212 @@ def create_csv_query_engines_from_folder(folder_path, verbose=False, prompt=new_
             f"Error occurred while creating query engines from folder {folder_path}: {e}"
         )
 
+    if return_sources:
+        return query_engines, sources
     return query_engines
 
 
-def get_index(data, index_name):
-    index = None
-    if not os.path.exists(index_name):
-        print("building index", index_name)
-        index = VectorStoreIndex.from_documents(data, show_progress=True)
-        index.storage_context.persist(persist_dir=index_name)
-    else:
-        index = load_index_from_storage(
-            StorageContext.from_defaults(persist_dir=index_name)
+def create_pdf_engines_from_folder(folder_path, workers=1, return_sources=False):
+    """
+    Creates a list of query engines for all PDF files in the specified folder.
+
+    Parameters:
+    - folder_path (str): The path to the folder containing PDF files.
+    - workers (int): The number of processes used to parse and chunk the PDFs
+      whose index is missing or stale. Embedding runs in batches in this process.
+    - return_sources (bool): Whether to also return the path of each engine's file.
+
+    Returns:
+    - List: A list of query engines for each PDF file, in file name order.
+      Files that fail to index are skipped. If return_sources is True, a tuple
+      of that list and the matching list of file paths.
+    """
+    # Use the file name without extension as index name
+    pdf_files = sorted(f for f in os.listdir(folder_path) if f.endswith(".pdf"))
+    pdf_paths = [os.path.join(folder_path, file_name) for file_name in pdf_files]
+    index_names = [os.path.splitext(file_name)[0] for file_name in pdf_files]
+    indexes = build_pdf_indexes(pdf_paths, index_names, workers=workers)
+
+    # Convert the indexes to query engines, skipping the files that failed
+    query_engines = []
+    sources = []
+    for pdf_path, index_name, index in zip(pdf_paths, index_names, indexes):
+        if index is not None:
+            query_engines.append(create_pdf_query_engine(index, index_name))
+            sources.append(pdf_path)
+
+    if return_sources:
+        return query_engines, sources
+    return query_engines
+
+
+def create_lazy_csv_query_engines_from_folder(
+    folder_path,
+    cache=None,
+    verbose=False,
+    prompt=new_prompt,
+    return_sources=False,
+    csv_cache=None,
+    in_memory_max_mb=None,
+    query_cache=None,
+):
+    """
+    Creates a lazy query engine for every CSV file in the specified folder. A
+    file is only read into a DataFrame when its engine is first queried.
+
+    Parameters:
+    - folder_path (str): The path to the folder containing CSV files.
+    - cache (EngineCache, optional): The cache that unloads engines over budget.
+    - verbose (bool): Whether to enable verbose mode for the query engines.
+    - return_sources (bool): Whether to also return the path of each engine's file.
+    - csv_cache (CsvColumnarCache, optional): The columnar cache to load from.
+    - in_memory_max_mb (int, optional): If given, files larger than this are
+      queried out of core instead of loaded into memory.
+    - query_cache (PandasQueryCache, optional): The cache of answered queries.
+
+    Returns:
+    - List[LazyQueryEngine]: The lazy query engines, in file name order, or a
+      tuple of that list and the matching file paths if return_sources is True.
+    """
+    csv_paths = [
+        os.path.join(folder_path, file_name)
+        for file_name in sorted(os.listdir(folder_path))
+        if file_name.endswith(".csv")
+    ]
+
+    def loader(file_path):
+        def load():
+            return create_csv_query_engine(
+                file_path, verbose, prompt, csv_cache, in_memory_max_mb, query_cache
+            )
+
+        return load
+
+    query_engines = [
+        LazyQueryEngine(
+            file_path, loader(file_path), cache=cache, size_fn=dataframe_engine_bytes
         )
+        for file_path in csv_paths
+    ]
 
-    return index
+    if return_sources:
+        return query_engines, csv_paths
+    return query_engines
 
 
-def create_pdf_engines_from_folder(folder_path):
+def create_lazy_pdf_engines_from_folder(
+    folder_path, cache=None, workers=1, return_sources=False
+):
     """
-    Creates a list of query engines for all PDF files in the specified folder.
+    Creates a lazy query engine for every PDF file in the specified folder.
+    Missing or stale indexes are built now, so that the engines only have to
+    load a persisted index when they are first queried.
 
     Parameters:
     - folder_path (str): The path to the folder containing PDF files.
+    - cache (EngineCache, optional): The cache that unloads engines over budget.
+    - workers (int): The number of processes used to parse PDFs being indexed.
+    - return_sources (bool): Whether to also return the path of each engine's file.
 
     Returns:
-    - List: A list of query engines for each PDF file.
+    - List[LazyQueryEngine]: The lazy query engines, in file name order. Files
+      that fail to index are skipped. If return_sources is True, a tuple of that
+      list and the matching file paths.
     """
-    query_engines = []
+    pdf_files = sorted(f for f in os.listdir(folder_path) if f.endswith(".pdf"))
+    pdf_paths = [os.path.join(folder_path, file_name) for file_name in pdf_files]
+    index_names = [os.path.splitext(file_name)[0] for file_name in pdf_files]
+
+    # Only the indexes that are missing or out of date are built here
+    manifest = IndexManifest.load()
+    settings = current_index_settings()
+    stale = [
+        position
+        for position, (pdf_path, index_name) in enumerate(zip(pdf_paths, index_names))
+        if not manifest.is_current(
+            index_name, manifest.source_hash(index_name, pdf_path), settings
+        )
+    ]
+    built = build_pdf_indexes(
+        [pdf_paths[position] for position in stale],
+        [index_names[position] for position in stale],
+        workers=workers,
+        manifest=manifest,
+    )
+    failed = {position for position, index in zip(stale, built) if index is None}
 
-    # Iterate over all files in the specified folder
-    for file_name in os.listdir(folder_path):
-        # Check if the file is a PDF file
-        if file_name.endswith(".pdf"):
-            file_path = os.path.join(folder_path, file_name)
-            # Read the PDF file
-            reader = SimpleDirectoryReader(input_files=[file_path])
-            pdf_data = reader.load_data()
-            # Create an index for the PDF data
-            index_name = os.path.splitext(file_name)[
-                0
-            ]  # Use the file name without extension as index name
-            index = get_index(pdf_data, index_name)
-            # Convert the index to a query engine
-            query_engine = index.as_query_engine()
-            # Add the query engine to the list
-            query_engines.append(query_engine)
+    def loader(index_name):
+        return lambda: create_pdf_query_engine(load_index(index_name), index_name)
 
+    query_engines = []
+    sources = []
+    for position, (pdf_path, index_name) in enumerate(zip(pdf_paths, index_names)):
+        if position in failed:
+            continue
+        query_engines.append(
+            LazyQueryEngine(
+                pdf_path,
+                loader(index_name),
+                cache=cache,
+                size_fn=lambda _, index_name=index_name: directory_bytes(index_name),
+            )
+        )
+        sources.append(pdf_path)
+
+    if return_sources:
+        return query_engines, sources
     return query_engines
 
 
+def create_pdf_corpus_tool(
+    folder_path, workers=1, max_listed_files=50, embed_batch_size=32, progress=None
+):
+    """
+    Ingests all PDF files in the specified folder into one shared index and wraps
+    it in a single tool. The agent can restrict a search to one file by name, so
+    the prompt does not grow with one tool per document.
+
+    Parameters:
+    - folder_path (str): The path to the folder containing PDF files.
+    - workers (int): The number of processes used to parse new or changed PDFs.
+    - max_listed_files (int): How many file names the tool description lists.
+    - embed_batch_size (int): The chunks embedded per batch.
+    - progress (Callable[[int, int], None], optional): Called with the number
+      of chunks of a new or changed file embedded so far and their total.
+
+    Returns:
+    - FunctionTool: The corpus search tool.
+    """
+    pdf_files = sorted(f for f in os.listdir(folder_path) if f.endswith(".pdf"))
+    index = build_corpus_index(
+        [os.path.join(folder_path, file_name) for file_name in pdf_files],
+        workers=workers,
+        embed_batch_size=embed_batch_size,
+        progress=progress,
+    )
+    query_engine = get_corpus_query_engine(index)
+
+    def search_pdf_corpus(query: str, file_name: str = "") -> str:
+        """Searches the PDF documents, optionally only the file named file_name."""
+        if not file_name:
+            return str(query_engine.query(query))
+        if file_name not in pdf_files:
+            return f"Unknown file {file_name}. Available files: {', '.join(pdf_files)}"
+        return str(get_corpus_query_engine(index, file_name=file_name).query(query))
+
+    listed_files = ", ".join(pdf_files[:max_listed_files])
+    if len(pdf_files) > max_listed_files:
+        listed_files += f" and {len(pdf_files) - max_listed_files} more"
+
+    return FunctionTool.from_defaults(
+        fn=search_pdf_corpus,
+        name="pdf_corpus",
+        description=f"""This tool searches {len(pdf_files)} PDF documents and answers questions about them.
+    Pass the question as query. To search a single document, also pass its file name as file_name.
+    Available files: {listed_files}.""",
+    )
+
+
 def generate_description(engine, file_type, index):
     # Extract a sample of content from the query engine
     # This could be a summary, the first few lines, or any other relevant snippet
@@ -112,35 +383,162 @@ def generate_description(engine, file_type, index):
         "Provide a brief summary or key points of this document."
     )
 
-    # Generate a prompt based on the file type, index, and sample content
+    # Generate a prompt based on the file type and sample content. The tool
+    # number is left out: descriptions are cached, and a file's number can change
     prompt = (
-        f"Based on the following content from {file_type} data file {index}, "
+        f"Based on the following content from a {file_type} data file, "
         f"provide a brief description: {sample_content}"
     )
 
     # Use the LLM to generate a description
     response = groq_llm.complete(prompt)
     
-    print("This is a description for PDF: ", response.text.strip())
+    print(f"This is a description for {file_type} data file {index}: ", response.text.strip())
     return response.text.strip()
 
 
-def create_tools_from_query_engines(csv_engines: List, pdf_engines: List) -> List:
+def description_source_hashes(sources: List[Optional[str]]) -> List[Optional[str]]:
+    """
+    Returns the content hash of each source file, None for a missing source or
+    a file that cannot be read. Files whose size and modification time are
+    unchanged since they were last hashed are not read again.
+
+    Parameters:
+    - sources (List[Optional[str]]): The source files.
+
+    Returns:
+    - List[Optional[str]]: The hashes, in the order of the sources.
+    """
+    hashes = []
+    with _description_manifest_lock:
+        manifest = IndexManifest.load(DESCRIPTION_MANIFEST_PATH)
+        for source in sources:
+            if source is None:
+                hashes.append(None)
+                continue
+            entry_name = os.path.abspath(source)
+            try:
+                source_hash = manifest.source_hash(entry_name, source)
+                manifest.record(entry_name, source, source_hash, {})
+            except OSError as e:
+                print(f"Error occurred while hashing {source}: {e}")
+                source_hash = None
+            hashes.append(source_hash)
+        if any(source is not None for source in sources):
+            manifest.save()
+    return hashes
+
+
+def generate_descriptions(
+    items: List[Tuple],
+    cache: Optional[SqliteCache] = None,
+    max_workers: int = DESCRIPTION_WORKERS,
+) -> List[str]:
+    """
+    Returns a description for each query engine. Descriptions are stored in the
+    cache keyed by the file type, the LLM and the content hash of the source
+    file, so unchanged files reuse their stored description, whatever number
+    their tool gets. The missing ones are generated concurrently.
+
+    Parameters:
+    - items (List[Tuple]): (engine, file_type, index, source_file) tuples. The
+      description of an item without a source file is always generated.
+    - cache (SqliteCache, optional): The description cache.
+    - max_workers (int): The maximum number of descriptions generated at once.
+
+    Returns:
+    - List[str]: The descriptions, in the order of the items.
+    """
+    descriptions = [None] * len(items)
+    keys = [None] * len(items)
+    if cache is not None:
+        hashes = description_source_hashes([source for *_, source in items])
+        for i, ((_, file_type, _, _), source_hash) in enumerate(zip(items, hashes)):
+            if source_hash is not None:
+                keys[i] = (
+                    f"v{DESCRIPTION_CACHE_VERSION}:{file_type}:"
+                    f"{groq_llm.model_name}:{source_hash}"
+                )
+        cached = cache.get_many(key for key in keys if key is not None)
+        for i, key in enumerate(keys):
+            if key in cached:
+                descriptions[i] = cached[key].decode("utf-8")
+
+    def describe(i):
+        engine, file_type, index, _ = items[i]
+        try:
+            # Descriptions wait behind interactive requests for the LLM quota
+            with request_lane(BACKGROUND):
+                description = generate_description(engine, file_type, index)
+        except Exception as e:
+            print(f"Error occurred while describing {file_type} data file {index}: {e}")
+            return ""
+        if keys[i] is not None:
+            cache.set(keys[i], description.encode("utf-8"))
+        return description
+
+    missing = [i for i, description in enumerate(descriptions) if description is None]
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            for i, description in zip(missing, executor.map(describe, missing)):
+                descriptions[i] = description
+    return descriptions
+
+
+def create_tools_from_query_engines(
+    csv_engines: List,
+    pdf_engines: List,
+    csv_sources: Optional[List[str]] = None,
+    pdf_sources: Optional[List[str]] = None,
+    max_workers: int = DESCRIPTION_WORKERS,
+    csv_offset: int = 0,
+    pdf_offset: int = 0,
+) -> List:
     """
     Creates a list of tools from CSV and PDF query engines.
 
     Parameters:
     - csv_engines (List): A list of query engines for CSV files.
     - pdf_engines (List): A list of query engines for PDF files.
+    - csv_sources (List[str], optional): The source file of each CSV engine.
+    - pdf_sources (List[str], optional): The source file of each PDF engine.
+      Descriptions of engines with a source file are cached by its content hash.
+    - max_workers (int): The maximum number of descriptions generated at once.
+    - csv_offset (int): The number the first CSV tool is numbered after, so
+      tools added to a running agent do not reuse a name.
+    - pdf_offset (int): The same for the PDF tools.
 
     Returns:
-    - List: A list of QueryEngineTool instances.
+    - List: A list of QueryEngineTool instances. Each tool's source file is
+      kept in its source_file attribute.
     """
     tools = []
+    cache = None
+    if csv_sources is not None or pdf_sources is not None:
+        cache = SqliteCache(DESCRIPTION_CACHE_PATH)
+
+    # Describe all engines at once, before building the tools
+    csv_sources = csv_sources or [None] * len(csv_engines)
+    pdf_sources = pdf_sources or [None] * len(pdf_engines)
+    descriptions = generate_descriptions(
+        [
+            (engine, "CSV", csv_offset + i + 1, source)
+            for i, (engine, source) in enumerate(zip(csv_engines, csv_sources))
+        ]
+        + [
+            (engine, "PDF", pdf_offset + i + 1, source)
+            for i, (engine, source) in enumerate(zip(pdf_engines, pdf_sources))
+        ],
+        cache,
+        max_workers,
+    )
+    csv_descriptions = descriptions[: len(csv_engines)]
+    pdf_descriptions = descriptions[len(csv_engines) :]
 
     # Create tools for CSV query engines
-    for i, engine in enumerate(csv_engines):
-        description = generate_description(engine, "CSV", i + 1)
+    for i, (engine, description, source) in enumerate(
+        zip(csv_engines, csv_descriptions, csv_sources), start=csv_offset
+    ):
         tool = QueryEngineTool(
             query_engine=engine,
             metadata=ToolMetadata(
@@ -148,11 +546,14 @@ def create_tools_from_query_engines(csv_engines: List, pdf_engines: List) -> Lis
                 description=f"This tool provides insights from CSV data file {i+1}. {description}",
             ),
         )
+        # Lets the folder watcher find the tool of a changed file
+        tool.source_file = source
         tools.append(tool)
 
     # Create tools for PDF query engines
-    for i, engine in enumerate(pdf_engines):
-        description = generate_description(engine, "PDF", i + 1)
+    for i, (engine, description, source) in enumerate(
+        zip(pdf_engines, pdf_descriptions, pdf_sources), start=pdf_offset
+    ):
         tool = QueryEngineTool(
             query_engine=engine,
             metadata=ToolMetadata(
@@ -160,6 +561,7 @@ def create_tools_from_query_engines(csv_engines: List, pdf_engines: List) -> Lis
                 description=f"This tool provides insights from PDF data file {i+1}. {description}",
             ),
         )
+        tool.source_file = source
         tools.append(tool)
 
     return tools
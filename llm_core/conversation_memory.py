@@ -0,0 +1,218 @@
+import os
+import queue
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+from .rate_limiter import BACKGROUND, estimate_tokens, request_lane
+
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "2"))
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "20"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+MEMORY_MIN_RELEVANCE = float(os.getenv("MEMORY_MIN_RELEVANCE", "0"))
+
+SUMMARY_PROMPT = (
+    "Update the summary of a conversation between a user and an assistant with "
+    "the new exchange below. Keep the facts, numbers, names and open questions "
+    "the user may refer back to, and drop everything else. Answer with the "
+    "updated summary only, in at most {max_words} words.\n\n"
+    "Summary so far:\n{summary}\n\n"
+    "New exchange:\n{exchange}\n\n"
+    "Updated summary:"
+)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts a text down to about max_tokens tokens, marking the cut."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[: max(max_tokens - 1, 0) * 4].rstrip() + " ..."
+
+
+def _cosine(a, b) -> float:
+    norm = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(np.dot(a, b) / norm) if norm else 0.0
+
+
+def _word_overlap(a: str, b: str) -> float:
+    words_a = set(a.lower().split())
+    words_b = set(b.lower().split())
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+class ConversationMemory:
+    """
+    Keeps the history of a chat session and builds the history part of each
+    prompt within a token budget. The most recent turns are always included,
+    older turns only when they are relevant to the new prompt, and turns that
+    fall out of the window are folded into a rolling summary.
+
+    Parameters:
+    - llm (LLM, optional): Writes the rolling summary. Without it, turns that
+      fall out of the window are dropped.
+    - embed_model (BaseEmbedding, optional): Ranks older turns by similarity
+      to the new prompt. Without it, turns are ranked by word overlap.
+    - token_budget (int): The most history tokens added to a prompt.
+    - recent_turns (int): The number of latest turns included before any
+      older ones, as long as they fit.
+    - max_turns (int): The number of turns kept verbatim.
+    - summary_tokens (int): The length limit of the rolling summary.
+    - min_relevance (float): Older turns scoring at or below it are left out.
+    """
+
+    def __init__(
+        self,
+        llm=None,
+        embed_model=None,
+        token_budget=MEMORY_TOKEN_BUDGET,
+        recent_turns=MEMORY_RECENT_TURNS,
+        max_turns=MEMORY_MAX_TURNS,
+        summary_tokens=MEMORY_SUMMARY_TOKENS,
+        min_relevance=MEMORY_MIN_RELEVANCE,
+    ):
+        self.llm = llm
+        self.embed_model = embed_model
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.max_turns = max_turns
+        self.summary_tokens = summary_tokens
+        self.min_relevance = min_relevance
+        self.turns: List[Dict] = []
+        self.summary = ""
+        self._lock = threading.Lock()
+        # One worker applies the summaries, in the order the turns expired
+        self._summary_queue = queue.Queue()
+        self._summary_worker = None
+        # Summaries started before clear() must not bring back the old conversation
+        self._generation = 0
+
+    def add(self, prompt, response):
+        """
+        Records a turn. Its tokens are counted and it is embedded once, here,
+        so building later prompts does not re-read the whole history.
+
+        Parameters:
+        - prompt (str): The user's prompt.
+        - response: The agent's response.
+        """
+        # A single long answer may take at most half of the budget
+        text = truncate_to_tokens(
+            f"Prompt: {prompt}\nResponse: {response}", self.token_budget // 2
+        )
+        turn = {"text": text, "tokens": estimate_tokens(text), "embedding": None}
+        if self.embed_model is not None:
+            turn["embedding"] = self.embed_model.get_text_embedding(text)
+
+        with self._lock:
+            self.turns.append(turn)
+            expired = self.turns[: max(len(self.turns) - self.max_turns, 0)]
+            del self.turns[: len(expired)]
+            if expired and self.llm is not None:
+                # Summarize off the user's path
+                for turn in expired:
+                    self._summary_queue.put((turn, self._generation))
+                if self._summary_worker is None:
+                    self._summary_worker = threading.Thread(
+                        target=self._summarize, daemon=True
+                    )
+                    self._summary_worker.start()
+
+    def _summarize(self):
+        while True:
+            turn, generation = self._summary_queue.get()
+            try:
+                if generation == self._generation:
+                    self._summarize_turn(turn, generation)
+            finally:
+                self._summary_queue.task_done()
+
+    def wait_for_summary(self):
+        """Blocks until the turns that expired so far are folded into the summary."""
+        self._summary_queue.join()
+
+    def _summarize_turn(self, turn, generation):
+        prompt = SUMMARY_PROMPT.format(
+            max_words=self.summary_tokens * 3 // 4,
+            summary=self.summary or "(empty)",
+            exchange=turn["text"],
+        )
+        try:
+            # The summary is not needed for the current answer, so it can wait
+            with request_lane(BACKGROUND):
+                summary = str(self.llm.complete(prompt).text).strip()
+        except Exception as e:
+            print(f"Error occurred while summarizing the conversation: {e}")
+            return
+        with self._lock:
+            if generation == self._generation:
+                self.summary = truncate_to_tokens(summary, self.summary_tokens)
+
+    def _rank(self, prompt, candidates):
+        if self.embed_model is not None:
+            query = self.embed_model.get_query_embedding(prompt)
+            scores = [_cosine(query, turn["embedding"]) for turn in candidates]
+        else:
+            scores = [_word_overlap(prompt, turn["text"]) for turn in candidates]
+        order = sorted(range(len(candidates)), key=lambda i: -scores[i])
+        return [candidates[i] for i in order if scores[i] > self.min_relevance]
+
+    def get_relevant_history(self, prompt) -> str:
+        """
+        Returns the summary and the turns chosen for a new prompt, oldest
+        first, within the token budget.
+
+        Parameters:
+        - prompt (str): The new prompt.
+
+        Returns:
+        - str: The history text, empty if there is none.
+        """
+        with self._lock:
+            turns = list(self.turns)
+            summary = self.summary
+
+        remaining = self.token_budget
+        parts = []
+        if summary:
+            summary_text = f"Summary of the earlier conversation: {summary}"
+            remaining -= estimate_tokens(summary_text)
+            parts.append(summary_text)
+
+        recent = turns[-self.recent_turns :] if self.recent_turns else []
+        older = turns[: len(turns) - len(recent)]
+        chosen = set()
+        for turn in list(reversed(recent)) + self._rank(prompt, older):
+            if turn["tokens"] <= remaining:
+                chosen.add(id(turn))
+                remaining -= turn["tokens"]
+
+        parts.extend(turn["text"] for turn in turns if id(turn) in chosen)
+        return "\n".join(parts)
+
+    def build_prompt(self, prompt) -> str:
+        """
+        Returns the prompt to send to the agent: the relevant history followed
+        by the new prompt.
+
+        Parameters:
+        - prompt (str): The new prompt.
+
+        Returns:
+        - str: The prompt with its history.
+        """
+        history = self.get_relevant_history(prompt)
+        if not history:
+            return prompt
+        return f"Here is the relevant history:\n{history}\n\nNew prompt: {prompt}"
+
+    def clear(self):
+        """Forgets the whole conversation, including the summary."""
+        with self._lock:
+            self.turns = []
+            self.summary = ""
+            self._generation += 1
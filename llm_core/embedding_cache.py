@@ -0,0 +1,96 @@
+import hashlib
+import os
+from typing import Any, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+from .sqlite_cache import SqliteCache
+
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024"))
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model with an on-disk cache of chunk embeddings keyed by
+    the model name and a hash of the chunk text. The cache is shared by every
+    index, so rebuilding an index, renaming a PDF or ingesting repeated
+    boilerplate only embeds text that has never been seen before.
+
+    Missing texts are sorted by length before being batched, so short chunks
+    are not padded to the length of the longest chunk in their batch. Query
+    embeddings are not cached; they are computed by the wrapped model.
+    """
+
+    embed_model: BaseEmbedding = Field(description="The wrapped embedding model.")
+    length_bucketing: bool = Field(
+        default=True, description="Whether to batch missing texts by length."
+    )
+
+    _cache: SqliteCache = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache_path: str = EMBEDDING_CACHE_PATH,
+        max_mb: int = EMBEDDING_CACHE_MAX_MB,
+        **kwargs: Any,
+    ):
+        kwargs.setdefault("model_name", embed_model.model_name)
+        # Batches handed to the wrapper are the window that is cached and sorted
+        # by length; the wrapped model still embeds in its own batch size.
+        kwargs.setdefault("embed_batch_size", max(embed_model.embed_batch_size, 256))
+        super().__init__(embed_model=embed_model, **kwargs)
+        self._cache = SqliteCache(cache_path, max_bytes=max_mb * 1024 * 1024)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> SqliteCache:
+        return self._cache
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        cached = self._cache.get_many(keys)
+
+        # Embed each distinct missing text once, in batches of the wrapped model
+        missing = list(dict.fromkeys(k for k in keys if k not in cached))
+        if missing:
+            text_of = dict(zip(keys, texts))
+            if self.length_bucketing:
+                missing.sort(key=lambda key: len(text_of[key]))
+            batch_size = self.embed_model.embed_batch_size
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start : start + batch_size]
+                embeddings = self.embed_model._get_text_embeddings(
+                    [text_of[key] for key in batch]
+                )
+                vectors = [np.asarray(e, dtype=np.float32).tobytes() for e in embeddings]
+                self._cache.set_many(zip(batch, vectors))
+                cached.update(zip(batch, vectors))
+
+        return [np.frombuffer(cached[key], dtype=np.float32).tolist() for key in keys]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._get_text_embeddings(texts)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.embed_model._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self.embed_model._aget_query_embedding(query)
@@ -0,0 +1,218 @@
+import os
+import shutil
+import threading
+
+from engines_factory.columnar_cache import CsvColumnarCache
+from engines_factory.hybrid_retriever import create_pdf_query_engine
+from engines_factory.index_manifest import IndexManifest
+from engines_factory.pandas_cache import PandasQueryCache
+from engines_factory.pdf_ingestion import build_pdf_indexes, index_lock
+
+from .agent_builder import (
+    CSV_CACHE_DIR,
+    CSV_COLUMNAR_CACHE,
+    CSV_FOLDER_NAME,
+    DATA_FOLDER,
+    IN_MEMORY_MAX_MB,
+    OUT_OF_CORE_CSV,
+    PANDAS_CACHE_MAX_ENTRIES,
+    PDF_FOLDER_NAME,
+    SHARED_PDF_INDEX,
+    put_tool,
+    remove_tool,
+    source_tool,
+    tool_number,
+)
+from .agent_helpers import (
+    create_csv_query_engine,
+    create_pdf_corpus_tool,
+    create_tools_from_query_engines,
+)
+
+WATCH_FOLDERS = os.getenv("WATCH_FOLDERS", "false").lower() == "true"
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", "5"))
+
+
+def _scan(folder, extension):
+    """Returns the size and modification time of each file in a folder."""
+    files = {}
+    if not os.path.isdir(folder):
+        return files
+    for entry in os.scandir(folder):
+        if entry.is_file() and entry.name.lower().endswith(extension):
+            stat = entry.stat()
+            files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+class FolderWatcher:
+    """
+    Keeps the tools of a running agent in step with the CSV and PDF folders.
+    The folders are polled every few seconds; a file is picked up once it has
+    stopped changing between two polls, so files still being copied are left
+    alone. An added or changed file gets a new or rebuilt tool that replaces the
+    old one in place, and a deleted file's tool is removed. Only the files that
+    changed are indexed again; with a shared PDF index, their nodes are
+    inserted into or deleted from the corpus index.
+
+    Parameters:
+    - tools (List): The tool list to update, as returned by agent_tools or
+      build_tools. Every agent built on the list sees the changes.
+    - data_folder (str): The base folder where data is stored.
+    - csv_folder_name (str): The folder name for CSV files.
+    - pdf_folder_name (str): The folder name for PDF files.
+    - interval (float): The seconds between polls.
+    - shared_pdf_index (bool): Whether the PDFs are served by one corpus tool.
+    - on_change (Callable[[str], None], optional): Called with a message after
+      each change to the tools. Defaults to print.
+    """
+
+    def __init__(
+        self,
+        tools,
+        data_folder=DATA_FOLDER,
+        csv_folder_name=CSV_FOLDER_NAME,
+        pdf_folder_name=PDF_FOLDER_NAME,
+        interval=WATCH_INTERVAL,
+        shared_pdf_index=SHARED_PDF_INDEX,
+        on_change=print,
+    ):
+        self.tools = tools
+        self.csv_folder = os.path.join(data_folder, csv_folder_name)
+        self.pdf_folder = os.path.join(data_folder, pdf_folder_name)
+        self.interval = interval
+        self.shared_pdf_index = shared_pdf_index
+        self.on_change = on_change
+        self.csv_cache = CsvColumnarCache(CSV_CACHE_DIR) if CSV_COLUMNAR_CACHE else None
+        self.in_memory_max_mb = IN_MEMORY_MAX_MB if OUT_OF_CORE_CSV else None
+        self.query_cache = (
+            PandasQueryCache(PANDAS_CACHE_MAX_ENTRIES) if PANDAS_CACHE_MAX_ENTRIES else None
+        )
+        # The files the tools were built from count as seen
+        self._known = self._scan()
+        self._pending = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _scan(self):
+        return {**_scan(self.csv_folder, ".csv"), **_scan(self.pdf_folder, ".pdf")}
+
+    def start(self):
+        """Starts polling on a background thread."""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops polling after the current poll."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error occurred while watching the data folders: {e}")
+
+    def poll(self):
+        """
+        Checks the folders once and applies the changes to the files that
+        were added, changed or deleted and have since stopped changing.
+
+        Returns:
+        - List[str]: The files whose tools were updated or removed.
+        """
+        current = self._scan()
+        changed = {
+            path for path, stat in current.items() if self._known.get(path) != stat
+        }
+        ready = {path for path in changed if self._pending.get(path) == current[path]}
+        self._pending = {path: current[path] for path in changed - ready}
+        removed = set(self._known) - set(current)
+
+        for path in sorted(ready):
+            self._known[path] = current[path]
+        for path in removed:
+            del self._known[path]
+
+        pdf_changes = [path for path in ready | removed if path.lower().endswith(".pdf")]
+        if self.shared_pdf_index and pdf_changes:
+            self._update_pdf_corpus()
+        for path in sorted(ready):
+            if path.lower().endswith(".csv"):
+                self._update_csv(path)
+            elif not self.shared_pdf_index:
+                self._update_pdf(path)
+        for path in sorted(removed):
+            if path.lower().endswith(".csv") or not self.shared_pdf_index:
+                self._remove(path)
+        return sorted(ready | removed)
+
+    def _update_csv(self, path):
+        try:
+            query_engine = create_csv_query_engine(
+                path,
+                csv_cache=self.csv_cache,
+                in_memory_max_mb=self.in_memory_max_mb,
+                query_cache=self.query_cache,
+            )
+        except Exception as e:
+            print(f"Error occurred while loading {path}: {e}")
+            return
+        number = tool_number(self.tools, "csv_data_", path)
+        [tool] = create_tools_from_query_engines(
+            [query_engine], [], csv_sources=[path], csv_offset=number - 1
+        )
+        self._put(tool, path)
+
+    def _update_pdf(self, path):
+        index_name = os.path.splitext(os.path.basename(path))[0]
+        [index] = build_pdf_indexes([path], [index_name])
+        if index is None:
+            print(f"Could not index {path}")
+            return
+        number = tool_number(self.tools, "pdf_data_", path)
+        [tool] = create_tools_from_query_engines(
+            [],
+            [create_pdf_query_engine(index, index_name)],
+            pdf_sources=[path],
+            pdf_offset=number - 1,
+        )
+        self._put(tool, path)
+
+    def _update_pdf_corpus(self):
+        try:
+            tool = create_pdf_corpus_tool(self.pdf_folder)
+        except Exception as e:
+            print(f"Error occurred while updating the PDF corpus: {e}")
+            return
+        put_tool(self.tools, tool)
+        self.on_change(f"Updated the tool {tool.metadata.name} for the PDF folder.")
+
+    def _put(self, tool, path):
+        updated = source_tool(self.tools, path) is not None
+        put_tool(self.tools, tool)
+        action = "Updated" if updated else "Added"
+        self.on_change(f"{action} the tool {tool.metadata.name} for {os.path.basename(path)}.")
+
+    def _remove(self, path):
+        tool = source_tool(self.tools, path)
+        if tool is not None:
+            remove_tool(self.tools, tool)
+            self.on_change(f"Removed the tool {tool.metadata.name} for {os.path.basename(path)}.")
+        if path.lower().endswith(".pdf"):
+            self._remove_pdf_index(path)
+
+    def _remove_pdf_index(self, path):
+        """Deletes the index of a deleted PDF, if the manifest shows it was built from it."""
+        index_name = os.path.splitext(os.path.basename(path))[0]
+        with index_lock(index_name):
+            manifest = IndexManifest.load()
+            entry = manifest.entries.get(index_name)
+            if entry is None or os.path.abspath(entry["source"]) != os.path.abspath(path):
+                return
+            manifest.forget(index_name)
+            manifest.save()
+            shutil.rmtree(index_name, ignore_errors=True)
@@ -0,0 +1,313 @@
+"""
+Serves the agent over HTTP to many users at once.
+
+Usage:
+    python -m llm_core.http_server [--host 0.0.0.0] [--port 8080]
+
+Endpoints:
+    POST   /sessions                  Starts a session, returns {"session_id": ...}
+    POST   /sessions/{id}/chat        Sends {"message": ..., "stream": false}
+    DELETE /sessions/{id}             Ends a session
+    GET    /health                    Reports sessions and load
+
+The tools and indexes are built once and shared; each session has its own
+agent and conversation memory. Sessions live in the memory of one process,
+so a load balancer in front of several processes needs sticky sessions.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from llama_index.core import Settings
+
+from engines_factory.tool_router import TOOL_ROUTING, ToolRouter
+
+from .agent_builder import answer_deltas, build_tools, create_agent
+from .conversation_memory import ConversationMemory
+from .folder_watcher import WATCH_FOLDERS, FolderWatcher
+from .llm_setup import groq_llm
+
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+# Agent turns block on the LLM and the tools, so they run on worker threads
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "8"))
+# Requests waiting for a worker beyond this are refused with 503
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", "32"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+# Streamed tokens buffered per response before the agent waits for the client
+STREAM_BUFFER = 64
+EXPIRY_TASK = web.AppKey("expiry_task", asyncio.Task)
+
+
+class Session:
+    """The state of one conversation: its agent, memory and turn lock."""
+
+    def __init__(self, session_id, agent, memory):
+        self.session_id = session_id
+        self.agent = agent
+        self.memory = memory
+        self.last_used = time.monotonic()
+        # One turn at a time; the agent's chat memory is not thread safe
+        self.lock = asyncio.Lock()
+
+
+class SessionStore:
+    """
+    Keeps the sessions of this process. Sessions idle for longer than ttl
+    seconds are dropped, and the least recently used one is dropped when a
+    new session would exceed max_sessions.
+
+    Parameters:
+    - tools (List): The shared tools every session's agent uses.
+    - max_sessions (int): The most sessions kept at once.
+    - ttl (float): The idle time in seconds after which a session ends.
+    """
+
+    def __init__(self, tools, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL):
+        self.tools = tools
+        # One router for all sessions, so each tool is embedded once
+        self.tool_router = ToolRouter(tools) if TOOL_ROUTING else None
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        # Sessions are created on worker threads and looked up on the event loop
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self):
+        session = Session(
+            uuid.uuid4().hex,
+            create_agent(self.tools, verbose=False, tool_router=self.tool_router),
+            ConversationMemory(llm=groq_llm, embed_model=Settings.embed_model),
+        )
+        with self._lock:
+            self._expire()
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def expire(self):
+        """Drops the sessions idle for longer than the ttl."""
+        with self._lock:
+            self._expire()
+
+    def _expire(self):
+        oldest = time.monotonic() - self.ttl
+        for session_id, session in list(self._sessions.items()):
+            if session.last_used < oldest and not session.lock.locked():
+                del self._sessions[session_id]
+
+
+class AgentServer:
+    """
+    Runs agent turns for HTTP requests on a bounded thread pool. At most
+    workers turns run at once and at most max_queue wait for a worker; further
+    requests get 503 so the load balancer can try another process.
+
+    Parameters:
+    - tools (List): The shared tools, as returned by build_tools.
+    - workers (int): The number of turns run at once.
+    - max_queue (int): The number of turns allowed to wait for a worker.
+    - max_sessions (int): The most sessions kept at once.
+    - session_ttl (float): The idle time in seconds after which a session ends.
+    """
+
+    def __init__(
+        self,
+        tools,
+        workers=SERVER_WORKERS,
+        max_queue=SERVER_MAX_QUEUE,
+        max_sessions=MAX_SESSIONS,
+        session_ttl=SESSION_TTL,
+    ):
+        self.sessions = SessionStore(tools, max_sessions, session_ttl)
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent")
+        self._slots = asyncio.Semaphore(workers)
+        self.running = 0
+        self.waiting = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/sessions", self.create_session)
+        app.router.add_delete("/sessions/{session_id}", self.delete_session)
+        app.router.add_post("/sessions/{session_id}/chat", self.chat)
+        app.router.add_get("/health", self.health)
+        app.on_startup.append(self._start_expiry)
+        app.on_cleanup.append(self._stop)
+        return app
+
+    async def _start_expiry(self, app):
+        async def expire():
+            while True:
+                await asyncio.sleep(60)
+                self.sessions.expire()
+
+        app[EXPIRY_TASK] = asyncio.create_task(expire())
+
+    async def _stop(self, app):
+        app[EXPIRY_TASK].cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def create_session(self, request):
+        loop = asyncio.get_running_loop()
+        # Creating the agent is quick, but keep the event loop free anyway
+        session = await loop.run_in_executor(self.executor, self.sessions.create)
+        return web.json_response({"session_id": session.session_id}, status=201)
+
+    async def delete_session(self, request):
+        if not self.sessions.delete(request.match_info["session_id"]):
+            raise web.HTTPNotFound(text="Unknown session")
+        return web.Response(status=204)
+
+    async def health(self, request):
+        return web.json_response(
+            {
+                "status": "ok",
+                "sessions": len(self.sessions),
+                "running": self.running,
+                "waiting": self.waiting,
+            }
+        )
+
+    async def chat(self, request):
+        session = self.sessions.get(request.match_info["session_id"])
+        if session is None:
+            raise web.HTTPNotFound(text="Unknown session")
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise web.HTTPBadRequest(text="The body must be JSON")
+        message = body.get("message", "") if isinstance(body, dict) else ""
+        if not isinstance(message, str) or not message.strip():
+            raise web.HTTPBadRequest(text="A non-empty message is required")
+
+        if self.waiting >= self.max_queue:
+            raise web.HTTPServiceUnavailable(
+                text="The server is busy", headers={"Retry-After": "1"}
+            )
+        self.waiting += 1
+        try:
+            await session.lock.acquire()
+            try:
+                await self._slots.acquire()
+            except BaseException:
+                session.lock.release()
+                raise
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            if body.get("stream"):
+                return await self._stream_turn(request, session, message)
+            return await self._turn(session, message)
+        finally:
+            self.running -= 1
+            self._slots.release()
+            session.lock.release()
+
+    async def _turn(self, session, message):
+        def run():
+            # The prompt carries the history, so the agent starts each turn empty
+            session.agent.reset()
+            response = session.agent.chat(session.memory.build_prompt(message))
+            session.memory.add(message, response)
+            return str(response)
+
+        loop = asyncio.get_running_loop()
+        text = await loop.run_in_executor(self.executor, run)
+        return web.json_response({"response": text})
+
+    async def _stream_turn(self, request, session, message):
+        loop = asyncio.get_running_loop()
+        tokens = asyncio.Queue(maxsize=STREAM_BUFFER)
+        stopped = threading.Event()
+        done = object()
+
+        def put(item):
+            # Blocks the worker while the buffer is full, so a slow client
+            # slows the agent down instead of growing the buffer
+            asyncio.run_coroutine_threadsafe(tokens.put(item), loop).result()
+
+        def run():
+            try:
+                session.agent.reset()
+                response = session.agent.stream_chat(session.memory.build_prompt(message))
+                text = ""
+                for delta in answer_deltas(iter(response.response_gen)):
+                    if stopped.is_set():
+                        return
+                    text += delta
+                    put(delta)
+                session.memory.add(message, text)
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+        worker = loop.run_in_executor(self.executor, run)
+        try:
+            while (item := await tokens.get()) is not done:
+                if isinstance(item, Exception):
+                    event = {"error": str(item)}
+                else:
+                    event = {"delta": item}
+                await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            await response.write(b"event: done\ndata: {}\n\n")
+        finally:
+            if not worker.done():
+                # The client went away; let the worker finish without waiting on it
+                stopped.set()
+                while not worker.done():
+                    try:
+                        await asyncio.wait_for(tokens.get(), timeout=0.1)
+                    except asyncio.TimeoutError:
+                        pass
+        return response
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the agent over HTTP.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args(argv)
+
+    tools = build_tools()
+    if WATCH_FOLDERS:
+        # Every session's agent shares the list, so all of them see new files
+        FolderWatcher(tools).start()
+    server = AgentServer(tools)
+    web.run_app(server.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
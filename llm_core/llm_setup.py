@@ -1,21 +1,109 @@
-from groq import Groq
-from typing import Any, Iterator
-from pydantic import Field
+from groq import AsyncGroq, Groq
+from typing import Any, Dict, Iterator, Optional
+from pydantic import Field, PrivateAttr
+import hashlib
+import httpx
+import json
 import os
 
-from llama_index.core.llms import CustomLLM, CompletionResponse, LLMMetadata
+from llama_index.core.llms import (
+    CustomLLM,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    LLMMetadata,
+)
 from llama_index.core.llms.callbacks import llm_completion_callback
 from llama_index.core import Settings
+from llama_index.core.embeddings import resolve_embed_model
+
+from .embedding_cache import CachedEmbedding
+from .rate_limiter import RequestScheduler, estimate_tokens
+from .sqlite_cache import SqliteCache
+
+
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+# An empty path disables the completion cache
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+# 0 leaves the requests/min or tokens/min limit off
+GROQ_REQUESTS_PER_MINUTE = float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "0"))
+GROQ_TOKENS_PER_MINUTE = float(os.getenv("GROQ_TOKENS_PER_MINUTE", "0"))
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "5"))
+# Assumed completion length of requests without max_tokens, until usage is known
+DEFAULT_COMPLETION_TOKENS = 256
+
+
+def _connection_limits():
+    # Keep every connection alive so concurrent sessions reuse TLS connections
+    return httpx.Limits(
+        max_connections=GROQ_MAX_CONNECTIONS,
+        max_keepalive_connections=GROQ_MAX_CONNECTIONS,
+    )
+
+
+def build_groq_client():
+    """Returns a Groq client that reuses connections from a bounded pool."""
+    # Retries are left to the request scheduler, which knows about the quota
+    return Groq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        max_retries=0,
+        http_client=httpx.Client(limits=_connection_limits(), timeout=GROQ_TIMEOUT),
+    )
+
+
+def build_async_groq_client():
+    """Returns an async Groq client that reuses connections from a bounded pool."""
+    return AsyncGroq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        max_retries=0,
+        http_client=httpx.AsyncClient(limits=_connection_limits(), timeout=GROQ_TIMEOUT),
+    )
+
+
+def build_scheduler():
+    """Returns the request scheduler configured from the environment."""
+    return RequestScheduler(
+        requests_per_minute=GROQ_REQUESTS_PER_MINUTE or None,
+        tokens_per_minute=GROQ_TOKENS_PER_MINUTE or None,
+        max_concurrency=GROQ_MAX_CONCURRENCY,
+        max_retries=GROQ_MAX_RETRIES,
+    )
 
 
 class GroqLLM(CustomLLM):
     context_window: int = 32768
     num_output: int = 4096
     model_name: str = "mixtral-8x7b-32768"
-    client: Groq = Field(
-        default_factory=lambda: Groq(api_key=os.getenv("GROQ_API_KEY"))
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    client: Groq = Field(default_factory=build_groq_client)
+    async_client: AsyncGroq = Field(default_factory=build_async_groq_client)
+    cache_path: Optional[str] = Field(
+        default=LLM_CACHE_PATH or None,
+        description="The completion cache file. None disables caching.",
+    )
+    cache_ttl: float = LLM_CACHE_TTL
+    cache_max_mb: int = LLM_CACHE_MAX_MB
+    scheduler: Optional[RequestScheduler] = Field(
+        default_factory=build_scheduler,
+        description="Schedules and retries requests. None sends them directly.",
+        exclude=True,
     )
 
+    _cache: Optional[SqliteCache] = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if self.cache_path:
+            self._cache = SqliteCache(
+                self.cache_path,
+                max_bytes=self.cache_max_mb * 1024 * 1024,
+                ttl=self.cache_ttl,
+            )
+
     @property
     def metadata(self) -> LLMMetadata:
         return LLMMetadata(
@@ -24,22 +112,197 @@ class GroqLLM(CustomLLM):
             model_name=self.model_name,
         )
 
+    def _request(self, prompt: str) -> dict:
+        request = {
+            "messages": [{"role": "user", "content": prompt}],
+            "model": self.model_name,
+        }
+        if self.temperature is not None:
+            request["temperature"] = self.temperature
+        if self.max_tokens is not None:
+            request["max_tokens"] = self.max_tokens
+        return request
+
+    def _cache_key(self, request: dict) -> str:
+        # The request holds the model, the prompt and the sampling parameters
+        payload = json.dumps(request, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def _cached(self, request: dict) -> Optional[str]:
+        if self._cache is None:
+            return None
+        value = self._cache.get(self._cache_key(request))
+        return value.decode("utf-8") if value is not None else None
+
+    def _store(self, request: dict, text: str):
+        if self._cache is not None and text:
+            self._cache.set(self._cache_key(request), text.encode("utf-8"))
+
+    def _estimate(self, request: dict) -> int:
+        prompt = request["messages"][0]["content"]
+        return estimate_tokens(prompt) + (self.max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+    def _call(self, fn, tokens: int, keep_slot: bool = False):
+        if self.scheduler is None:
+            return fn()
+        return self.scheduler.call(fn, tokens, keep_slot=keep_slot)
+
+    async def _acall(self, fn, tokens: int, keep_slot: bool = False):
+        if self.scheduler is None:
+            return await fn()
+        return await self.scheduler.acall(fn, tokens, keep_slot=keep_slot)
+
+    def _record_usage(self, tokens: int, response):
+        if self.scheduler is not None and getattr(response, "usage", None):
+            self.scheduler.record_usage(tokens, response.usage.total_tokens)
+
+    def _release(self):
+        if self.scheduler is not None:
+            self.scheduler.release()
+
+    def cache_stats(self) -> Optional[Dict]:
+        """Returns the completion cache counters, or None if the cache is disabled."""
+        return self._cache.stats() if self._cache is not None else None
+
     @llm_completion_callback()
     def complete(self, prompt: str, **kwargs: Any) -> CompletionResponse:
-        response = self.client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model=self.model_name,
-        )
-        return CompletionResponse(text=response.choices[0].message.content)
+        request = self._request(prompt)
+        text = self._cached(request)
+        if text is None:
+            tokens = self._estimate(request)
+            response = self._call(
+                lambda: self.client.chat.completions.create(**request), tokens
+            )
+            self._record_usage(tokens, response)
+            text = response.choices[0].message.content
+            self._store(request, text)
+        return CompletionResponse(text=text)
 
     @llm_completion_callback()
     def stream_complete(
         self, prompt: str, **kwargs: Any
     ) -> Iterator[CompletionResponse]:
-        full_response = self.complete(prompt, **kwargs)
-        for char in full_response.text:
-            yield CompletionResponse(text=char, delta=char)
+        request = self._request(prompt)
+        text = self._cached(request)
+        if text is not None:
+            yield CompletionResponse(text=text, delta=text)
+            return
+
+        # Yield tokens as the server sends them instead of after the full answer.
+        # The concurrency slot is held until the stream has been read.
+        stream = self._call(
+            lambda: self.client.chat.completions.create(**request, stream=True),
+            self._estimate(request),
+            keep_slot=True,
+        )
+        try:
+            text = ""
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    text += delta
+                    yield CompletionResponse(text=text, delta=delta)
+        finally:
+            self._release()
+        self._store(request, text)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, **kwargs: Any) -> CompletionResponse:
+        request = self._request(prompt)
+        text = self._cached(request)
+        if text is None:
+            tokens = self._estimate(request)
+            response = await self._acall(
+                lambda: self.async_client.chat.completions.create(**request), tokens
+            )
+            self._record_usage(tokens, response)
+            text = response.choices[0].message.content
+            self._store(request, text)
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    async def astream_complete(
+        self, prompt: str, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        request = self._request(prompt)
+        cached = self._cached(request)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            if cached is not None:
+                yield CompletionResponse(text=cached, delta=cached)
+                return
+            stream = await self._acall(
+                lambda: self.async_client.chat.completions.create(
+                    **request, stream=True
+                ),
+                self._estimate(request),
+                keep_slot=True,
+            )
+            try:
+                text = ""
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        text += delta
+                        yield CompletionResponse(text=text, delta=delta)
+            finally:
+                self._release()
+            self._store(request, text)
+
+        return gen()
+
+
+EMBED_MODEL = os.getenv("EMBED_MODEL", "local:BAAI/bge-base-en-v1.5")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_NUM_THREADS = int(os.getenv("EMBED_NUM_THREADS", "0"))
+
+
+def build_embed_model(
+    model=EMBED_MODEL, batch_size=EMBED_BATCH_SIZE, num_threads=EMBED_NUM_THREADS
+):
+    """
+    Builds the embedding model used for indexing and retrieval, wrapped in the
+    shared embedding cache.
+
+    Parameters:
+    - model (str): The embedding model, as accepted by resolve_embed_model.
+    - batch_size (int): The number of chunks embedded per forward pass.
+    - num_threads (int): The number of intra-op threads used by torch on CPU.
+      0 keeps the torch default.
+
+    Returns:
+    - CachedEmbedding: The configured embedding model.
+    """
+    if num_threads > 0:
+        import torch
+
+        torch.set_num_threads(num_threads)
+    embed_model = resolve_embed_model(model)
+    embed_model.embed_batch_size = batch_size
+    return CachedEmbedding(embed_model=embed_model)
+
+
+def use_models(llm, embed_model):
+    """
+    Replaces the LLM and embedding model used by the agent, e.g. with offline
+    stand-ins. Modules that import groq_llm bind it at import time, so this must
+    run before the agent modules are imported.
+
+    Parameters:
+    - llm (LLM): The LLM.
+    - embed_model (BaseEmbedding): The embedding model.
+    """
+    global groq_llm
+    groq_llm = llm
+    Settings.llm = llm
+    Settings.embed_model = embed_model
+
 
-groq_llm = GroqLLM()
-Settings.llm = groq_llm
-Settings.embed_model = "local:BAAI/bge-base-en-v1.5" 
+# MODEL_SETUP=none skips building the Groq client and the embedding model, for
+# runs that install their own with use_models
+if os.getenv("MODEL_SETUP", "default") == "none":
+    groq_llm = None
+else:
+    groq_llm = GroqLLM()
+    Settings.llm = groq_llm
+    Settings.embed_model = build_embed_model()
@@ -0,0 +1,249 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+import groq
+
+
+# Lower lanes are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_request_lane = contextvars.ContextVar("request_lane", default=INTERACTIVE)
+
+RETRYABLE_ERRORS = (
+    groq.RateLimitError,
+    groq.APIConnectionError,
+    groq.InternalServerError,
+)
+
+
+@contextmanager
+def request_lane(lane: int):
+    """
+    Runs the requests made inside the block in the given priority lane.
+
+    Parameters:
+    - lane (int): INTERACTIVE for user turns, BACKGROUND for work that can wait.
+    """
+    token = _request_lane.set(lane)
+    try:
+        yield
+    finally:
+        _request_lane.reset(token)
+
+
+def estimate_tokens(text: str) -> int:
+    """Returns a rough token count of a text, about four characters per token."""
+    return len(text) // 4 + 1
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Returns the delay in seconds the server asked for, if it sent one."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class TokenBucket:
+    """
+    A bucket holding up to rate_per_minute units that refills continuously.
+    Consuming more than is available drives the level negative, so later
+    callers pay back requests that turned out larger than estimated.
+    """
+
+    def __init__(self, rate_per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = rate_per_minute
+        self.level = rate_per_minute
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(
+            self.capacity, self.level + (now - self.updated) * self.capacity / 60
+        )
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Returns how many seconds to wait until amount units are available."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.capacity
+
+    def consume(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+
+class RequestScheduler:
+    """
+    Schedules LLM requests under the provider's quota. Requests wait for a free
+    concurrency slot and for room in the requests/min and tokens/min buckets;
+    waiters are served by lane, then in arrival order. Failed requests that can
+    succeed later are retried with jittered exponential backoff, honouring the
+    server's retry-after header. clock and sleep can be replaced in tests.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: int = 8,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self._requests = (
+            TokenBucket(requests_per_minute, clock) if requests_per_minute else None
+        )
+        self._tokens = TokenBucket(tokens_per_minute, clock) if tokens_per_minute else None
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._active = 0
+
+    def _delay(self, tokens: int) -> float:
+        delay = 0.0
+        if self._requests is not None:
+            delay = max(delay, self._requests.delay(1))
+        if self._tokens is not None:
+            delay = max(delay, self._tokens.delay(tokens))
+        return delay
+
+    def acquire(self, tokens: int = 0):
+        """
+        Blocks until the calling request may start, then takes a concurrency slot.
+
+        Parameters:
+        - tokens (int): The estimated number of tokens the request will use.
+        """
+        entry = (_request_lane.get(), next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    if self._waiting[0] == entry and self._active < self.max_concurrency:
+                        delay = self._delay(tokens)
+                        if delay <= 0:
+                            break
+                        self._condition.wait(delay)
+                    else:
+                        self._condition.wait()
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            if self._requests is not None:
+                self._requests.consume(1)
+            if self._tokens is not None:
+                self._tokens.consume(tokens)
+            self._active += 1
+            self._condition.notify_all()
+
+    def release(self):
+        """Frees the concurrency slot taken by acquire."""
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def record_usage(self, estimated: int, actual: int):
+        """Corrects the tokens/min bucket once the real usage of a request is known."""
+        if self._tokens is not None:
+            with self._condition:
+                self._tokens.consume(actual - estimated)
+                self._condition.notify_all()
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter spreads out clients that failed at the same moment
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        return max(delay, retry_after(error) or 0.0)
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0, keep_slot: bool = False) -> Any:
+        """
+        Runs a request under the scheduler, retrying it on rate limits and
+        transient errors.
+
+        Parameters:
+        - fn (Callable): Makes the request.
+        - tokens (int): The estimated number of tokens the request will use.
+        - keep_slot (bool): Whether to keep the concurrency slot after fn returns,
+          e.g. while a stream is read. The caller must then call release.
+
+        Returns:
+        - Any: The return value of fn.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens)
+            try:
+                result = fn()
+            except RETRYABLE_ERRORS as e:
+                self.release()
+                if attempt == self.max_retries:
+                    raise
+                self.sleep(self._backoff(attempt, e))
+                continue
+            except BaseException:
+                self.release()
+                raise
+            if not keep_slot:
+                self.release()
+            return result
+
+    async def acall(
+        self, fn: Callable[[], Awaitable[Any]], tokens: int = 0, keep_slot: bool = False
+    ) -> Any:
+        """The async version of call; fn returns an awaitable."""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        for attempt in range(self.max_retries + 1):
+            # Waiting happens in a thread so the event loop is never blocked
+            acquiring = loop.run_in_executor(None, context.run, self.acquire, tokens)
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # The thread still takes the slot; give it back once it has
+                acquiring.add_done_callback(
+                    lambda f: f.cancelled() or f.exception() or self.release()
+                )
+                raise
+            try:
+                result = await fn()
+            except RETRYABLE_ERRORS as e:
+                self.release()
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            except BaseException:
+                self.release()
+                raise
+            if not keep_slot:
+                self.release()
+            return result
@@ -1,35 +1,20 @@
-from .agent_builder import build_agent
+from llama_index.core import Settings
 
-# Initialize history as a list of dictionaries
-history = []
-agent = build_agent()
-
-
-def add_to_history(prompt, response):
-    # Add a new entry to the history
-    history.append({"prompt": prompt, "response": response})
-    # Limit history to the last 5 interactions
-    if len(history) > 5:
-        history.pop(0)
+from .agent_builder import agent_tools, build_agent
+from .conversation_memory import ConversationMemory
+from .folder_watcher import WATCH_FOLDERS, FolderWatcher
+from .llm_setup import groq_llm
 
-
-def get_relevant_history():
-    # Optionally, filter or summarize history here
-    return "\n".join(
-        [
-            f"Prompt: {entry['prompt']}\nResponse: {entry['response']}"
-            for entry in history
-        ]
-    )
+# Keep the conversation within a token budget per turn
+memory = ConversationMemory(llm=groq_llm, embed_model=Settings.embed_model)
+agent = build_agent()
+if WATCH_FOLDERS:
+    FolderWatcher(agent_tools(agent)).start()
 
 
 while (prompt := input("Enter a prompt (q to quit): ")) != "q":
-    # Get relevant history
-    relevant_history = get_relevant_history()
-    # Query the agent with the current prompt and relevant history
-    result = agent.query(
-        f"Here is the relevant history:\n{relevant_history}\n\nNew prompt: {prompt}"
-    )
-    # Add the current interaction to history
-    add_to_history(prompt, result)
+    # Query the agent with the current prompt and the history relevant to it
+    result = agent.query(memory.build_prompt(prompt))
     print(result)
+    # Add the current interaction to the memory
+    memory.add(prompt, result)
@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class SqliteCache:
+    """
+    A small key/value cache backed by an SQLite file, shared safely between
+    threads and processes. Entries are evicted least-recently-used first once
+    the cache exceeds max_entries or max_bytes, and expire ttl seconds after
+    they were stored.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                created REAL NOT NULL DEFAULT 0
+            )"""
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(entries)")]
+        if "created" not in columns:
+            # Caches written before entries could expire
+            self._conn.execute(
+                "ALTER TABLE entries ADD COLUMN created REAL NOT NULL DEFAULT 0"
+            )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """
+        Looks up several keys at once and marks the found entries as recently used.
+
+        Args:
+            keys (Iterable[str]): The keys to look up.
+
+        Returns:
+            Dict[str, bytes]: The values of the keys that were found.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        oldest = now - self.ttl if self.ttl is not None else 0
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders}) "
+                    "AND created >= ?",
+                    batch + [oldest],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._conn.executemany(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the value of a key, or None if it is not cached."""
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: Iterable[Tuple[str, bytes]]):
+        """Stores several entries at once, then evicts if the cache is over its bounds."""
+        now = time.time()
+        rows = [(key, value, len(value), now, now) for key, value in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def set(self, key: str, value: bytes):
+        """Stores a single entry."""
+        self.set_many([(key, value)])
+
+    def _evict(self):
+        """
+        Deletes expired entries, then least recently used entries until the
+        cache is within bounds.
+        """
+        if self.ttl is not None:
+            self._conn.execute(
+                "DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,)
+            )
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        excess = 0
+        if self.max_entries is not None:
+            excess = max(excess, count - self.max_entries)
+        if self.max_bytes is not None and total > self.max_bytes and count:
+            average = total / count
+            excess = max(excess, int((total - self.max_bytes) / average) + 1)
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY last_access LIMIT ?)",
+                (excess,),
+            )
+
+    def stats(self) -> Dict:
+        """Returns the hit and miss counters and the current size of the cache."""
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": total}
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
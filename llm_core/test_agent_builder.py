@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+# Keep the real models from being built on import
+os.environ.setdefault("MODEL_SETUP", "none")
+
+from llama_index.core.llms import MockLLM
+from llama_index.core.tools import FunctionTool
+
+from llm_core import agent_builder
+from llm_core.agent_builder import add_pdf_tool, agent_tools, create_agent
+
+
+def fake_tool(name, source_file=None):
+    return SimpleNamespace(metadata=SimpleNamespace(name=name), source_file=source_file)
+
+
+class TestAddPdfTool(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.pdf_path = os.path.join(self.folder, "report.pdf")
+        with open(self.pdf_path, "w") as f:
+            f.write("%PDF")
+        self.data_folder = os.path.join(self.folder, "data")
+        self.tools = [fake_tool("pdf_corpus"), fake_tool("excel_note_saver")]
+        self.agent = SimpleNamespace(tools=self.tools)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_shared_index_replaces_the_corpus_tool(self):
+        folders = []
+
+        def create_pdf_corpus_tool(folder_path, **kwargs):
+            folders.append(folder_path)
+            return fake_tool("pdf_corpus")
+
+        build_pdf_indexes = mock.Mock()
+        with mock.patch.object(agent_builder, "create_pdf_corpus_tool", create_pdf_corpus_tool), \
+                mock.patch.object(agent_builder, "build_pdf_indexes", build_pdf_indexes):
+            tool = add_pdf_tool(
+                self.agent, self.pdf_path, data_folder=self.data_folder, shared_pdf_index=True
+            )
+
+        pdf_folder = os.path.join(self.data_folder, "pdf")
+        self.assertEqual(folders, [pdf_folder])
+        self.assertTrue(os.path.exists(os.path.join(pdf_folder, "report.pdf")))
+        build_pdf_indexes.assert_not_called()
+        # The corpus tool is replaced in place; no per-PDF tool is added
+        self.assertEqual([t.metadata.name for t in self.tools], ["pdf_corpus", "excel_note_saver"])
+        self.assertIs(self.tools[0], tool)
+
+    def test_per_pdf_index_adds_a_tool(self):
+        def create_tools(csv_engines, pdf_engines, pdf_sources=(), pdf_offset=0, **kwargs):
+            return [fake_tool(f"pdf_data_{pdf_offset + 1}", pdf_sources[0])]
+
+        with mock.patch.object(agent_builder, "build_pdf_indexes", lambda *a, **k: ["index"]), \
+                mock.patch.object(agent_builder, "create_pdf_query_engine", lambda *a: None), \
+                mock.patch.object(agent_builder, "create_tools_from_query_engines", create_tools):
+            add_pdf_tool(
+                self.agent, self.pdf_path, data_folder=self.data_folder, shared_pdf_index=False
+            )
+
+        self.assertEqual(
+            [t.metadata.name for t in self.tools], ["pdf_corpus", "excel_note_saver", "pdf_data_1"]
+        )
+
+
+class TestAgentTools(unittest.TestCase):
+
+    def test_appended_tools_are_offered(self):
+        tools = [FunctionTool.from_defaults(fn=lambda x: x, name="first")]
+        with mock.patch.object(agent_builder, "groq_llm", MockLLM()), \
+                mock.patch.object(agent_builder, "TOOL_ROUTING", False):
+            agent = create_agent(tools, verbose=False)
+
+        self.assertIs(agent_tools(agent), tools)
+        agent_tools(agent).append(FunctionTool.from_defaults(fn=lambda x: x, name="second"))
+        offered = agent.agent_worker._get_tools("")
+        self.assertEqual([tool.metadata.name for tool in offered], ["first", "second"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+# Keep the real models from being built on import
+os.environ.setdefault("MODEL_SETUP", "none")
+
+from engines_factory.index_manifest import file_sha256
+from llm_core import agent_helpers
+from llm_core.agent_helpers import generate_descriptions
+from llm_core.sqlite_cache import SqliteCache
+
+
+class FakeEngine:
+    def __init__(self, summary):
+        self.summary = summary
+
+    def query(self, question):
+        return self.summary
+
+
+class FakeLLM:
+    """Describes a file by echoing its summary, slower for earlier files, and records prompts."""
+
+    model_name = "test-model"
+
+    def __init__(self):
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def complete(self, prompt):
+        summary = prompt.rsplit(": ", 1)[1]
+        # Later files finish first, so results come back out of order
+        time.sleep(0.05 / (1 + int(summary.split()[-1])))
+        with self._lock:
+            self.prompts.append(prompt)
+        return SimpleNamespace(text=f"Describes {summary}")
+
+
+class TestGenerateDescriptions(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = SqliteCache(os.path.join(self.folder, "descriptions.sqlite"))
+        self.llm = FakeLLM()
+        patches = [
+            mock.patch.object(agent_helpers, "groq_llm", self.llm),
+            mock.patch.object(
+                agent_helpers,
+                "DESCRIPTION_MANIFEST_PATH",
+                os.path.join(self.folder, "descriptions_manifest.json"),
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write(self, name, text):
+        path = os.path.join(self.folder, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def items(self, paths, first_index=1):
+        return [
+            (FakeEngine(f"table {i}"), "csv", first_index + i, path)
+            for i, path in enumerate(paths)
+        ]
+
+    def test_cached_description_skips_the_llm(self):
+        paths = [self.write("a.csv", "x\n1\n")]
+        first = generate_descriptions(self.items(paths), self.cache)
+
+        second = generate_descriptions(self.items(paths), self.cache)
+
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.llm.prompts), 1)
+
+    def test_changed_file_misses(self):
+        path = self.write("a.csv", "x\n1\n")
+        generate_descriptions(self.items([path]), self.cache)
+
+        self.write("a.csv", "x\n1\n2\n")
+        generate_descriptions(self.items([path]), self.cache)
+
+        self.assertEqual(len(self.llm.prompts), 2)
+
+    def test_key_does_not_depend_on_the_tool_number(self):
+        path = self.write("a.csv", "x\n1\n")
+        generate_descriptions(self.items([path], first_index=1), self.cache)
+
+        # The same file numbered differently, e.g. after another file was removed
+        generate_descriptions(self.items([path], first_index=7), self.cache)
+
+        self.assertEqual(len(self.llm.prompts), 1)
+        self.assertNotIn("7", self.llm.prompts[0])
+        key = f"v2:csv:test-model:{file_sha256(path)}"
+        self.assertEqual(self.cache.get(key), b"Describes table 0")
+
+    def test_concurrent_descriptions_keep_input_order(self):
+        paths = [self.write(f"{i}.csv", f"x\n{i}\n") for i in range(6)]
+        # One cached description in the middle
+        generate_descriptions(self.items(paths)[2:3], self.cache)
+
+        descriptions = generate_descriptions(self.items(paths), self.cache, max_workers=6)
+
+        self.assertEqual(descriptions, [f"Describes table {i}" for i in range(6)])
+        self.assertEqual(len(self.llm.prompts), 6)
+
+    def test_items_without_a_source_are_not_cached(self):
+        items = [(FakeEngine("table 0"), "pdf", 1, None)]
+
+        generate_descriptions(items, self.cache)
+        generate_descriptions(items, self.cache)
+
+        self.assertEqual(len(self.llm.prompts), 2)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
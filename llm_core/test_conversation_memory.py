@@ -0,0 +1,84 @@
+import threading
+import unittest
+from types import SimpleNamespace
+
+from llm_core.conversation_memory import ConversationMemory
+
+
+class SummaryLLM:
+    """Summarizes by appending the first word of each new exchange's prompt."""
+
+    def __init__(self):
+        self.prompts = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def complete(self, prompt):
+        self.release.wait()
+        self.prompts.append(prompt)
+        summary = prompt.split("Summary so far:\n", 1)[1].split("\n", 1)[0]
+        exchange = prompt.split("New exchange:\nPrompt: ", 1)[1]
+        words = [] if summary == "(empty)" else summary.split()
+        return SimpleNamespace(text=" ".join(words + [exchange.split()[0]]))
+
+
+class TestConversationMemory(unittest.TestCase):
+
+    def turns(self, history):
+        return [line for line in history.split("\n") if line.startswith("Prompt: ")]
+
+    def test_recent_turns_come_first_within_budget(self):
+        memory = ConversationMemory(token_budget=40, recent_turns=2, max_turns=10)
+        for i in range(4):
+            memory.add(f"question {i}", "x" * 40)
+
+        history = memory.get_relevant_history("question 0")
+
+        # Each turn takes 18 tokens, so only the latest two fit, even though
+        # the first one matches the prompt best
+        self.assertEqual(
+            self.turns(history), ["Prompt: question 2", "Prompt: question 3"]
+        )
+
+    def test_older_turns_by_relevance_above_cutoff(self):
+        memory = ConversationMemory(token_budget=1000, recent_turns=1, min_relevance=0.1)
+        memory.add("wage in ohio", "It is 10 dollars.")
+        memory.add("river levels", "They rose.")
+        memory.add("latest question", "Answered.")
+
+        history = memory.get_relevant_history("wage in ohio again")
+
+        # The river turn shares no words with the prompt and is left out
+        self.assertEqual(
+            self.turns(history), ["Prompt: wage in ohio", "Prompt: latest question"]
+        )
+
+    def test_expired_turns_are_summarized_in_order(self):
+        llm = SummaryLLM()
+        memory = ConversationMemory(llm=llm, max_turns=1)
+        for word in ["alpha", "beta", "gamma", "delta"]:
+            memory.add(f"{word} question", "answer")
+        memory.wait_for_summary()
+
+        self.assertEqual(memory.summary, "alpha beta gamma")
+        self.assertEqual(len(memory.turns), 1)
+        history = memory.get_relevant_history("next")
+        self.assertTrue(history.startswith("Summary of the earlier conversation: alpha beta gamma"))
+
+    def test_clear_during_summary_drops_it(self):
+        llm = SummaryLLM()
+        llm.release.clear()
+        memory = ConversationMemory(llm=llm, max_turns=1)
+        memory.add("old question", "answer")
+        memory.add("another question", "answer")
+
+        memory.clear()
+        llm.release.set()
+        memory.wait_for_summary()
+
+        self.assertEqual(memory.summary, "")
+        self.assertEqual(memory.get_relevant_history("next"), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from typing import List
+from unittest import mock
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+from llm_core import sqlite_cache
+from llm_core.embedding_cache import CachedEmbedding
+from llm_core.sqlite_cache import SqliteCache
+
+
+class CountingEmbedding(BaseEmbedding):
+    """Embeds a text as its length and first character, and records the batches it embeds."""
+
+    batches: List[List[str]] = []
+
+    def _embed(self, text: str) -> List[float]:
+        return [float(len(text)), float(ord(text[0])) if text else 0.0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.batches.append(list(texts))
+        return [self._embed(text) for text in texts]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def embedded(self) -> List[str]:
+        return [text for batch in self.batches for text in batch]
+
+
+class TestCachedEmbedding(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "embeddings.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def cached(self, model_name="model-a", **kwargs):
+        inner = CountingEmbedding(model_name=model_name, embed_batch_size=2, batches=[])
+        return inner, CachedEmbedding(inner, cache_path=self.path, **kwargs)
+
+    def test_repeated_texts_are_embedded_once(self):
+        inner, cached = self.cached()
+        texts = ["alpha", "be", "alpha", "gamma ray"]
+
+        first = cached.get_text_embedding_batch(texts)
+        self.assertEqual(first, [inner._embed(text) for text in texts])
+        # Each distinct text once, shortest first, in the wrapped model's batch size
+        self.assertEqual(inner.batches, [["be", "alpha"], ["gamma ray"]])
+
+        # A new wrapper on the same file, as after a restart, hits the cache
+        inner, cached = self.cached()
+        self.assertEqual(
+            cached.get_text_embedding_batch(texts + ["delta"]), first + [inner._embed("delta")]
+        )
+        self.assertEqual(inner.embedded(), ["delta"])
+        # Repeated keys are looked up once
+        self.assertEqual(cached.cache.hits, 3)
+
+    def test_changing_the_model_name_misses(self):
+        _, cached = self.cached("model-a")
+        cached.get_text_embedding_batch(["alpha", "be"])
+
+        inner, cached = self.cached("model-b")
+        cached.get_text_embedding_batch(["alpha", "be"])
+
+        self.assertEqual(sorted(inner.embedded()), ["alpha", "be"])
+        self.assertEqual(cached.cache.stats()["entries"], 4)
+
+    def test_queries_are_not_cached(self):
+        inner, cached = self.cached()
+
+        cached.get_query_embedding("alpha")
+
+        self.assertEqual(inner.batches, [])
+        self.assertEqual(cached.cache.stats()["entries"], 0)
+
+
+class TestSqliteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "cache.sqlite")
+        # Every read of the clock is a second later, so access times never tie
+        self.now = 0.0
+        patch = mock.patch.object(sqlite_cache, "time", SimpleNamespace(time=self.tick))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tick(self):
+        self.now += 1
+        return self.now
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_evicts_least_recently_used_over_max_entries(self):
+        cache = SqliteCache(self.path, max_entries=2)
+        cache.set("a", b"1")
+        cache.set("b", b"2")
+        # Reading "a" makes "b" the least recently used
+        self.assertEqual(cache.get("a"), b"1")
+
+        cache.set("c", b"3")
+
+        self.assertEqual(cache.get_many(["a", "b", "c"]), {"a": b"1", "c": b"3"})
+
+    def test_stays_within_max_bytes(self):
+        cache = SqliteCache(self.path, max_bytes=100)
+        for i in range(10):
+            cache.set(f"key{i}", bytes(30))
+
+        self.assertLessEqual(cache.stats()["bytes"], 100)
+        # The most recently stored entries are the ones kept
+        kept = cache.get_many(f"key{i}" for i in range(10))
+        self.assertEqual(sorted(kept), ["key7", "key8", "key9"])
+
+    def test_expired_entries_miss(self):
+        cache = SqliteCache(self.path, ttl=10)
+        cache.set("a", b"1")
+        self.assertEqual(cache.get("a"), b"1")
+
+        self.now += 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
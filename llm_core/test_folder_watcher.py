@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+# Keep the real models from being built on import
+os.environ.setdefault("MODEL_SETUP", "none")
+
+from engines_factory.index_manifest import IndexManifest
+from llm_core import folder_watcher
+from llm_core.folder_watcher import FolderWatcher
+
+
+def fake_tools(csv_engines, pdf_engines, csv_sources=(), pdf_sources=(), csv_offset=0, pdf_offset=0):
+    """Names tools as create_tools_from_query_engines does, without describing them."""
+    tools = [
+        SimpleNamespace(metadata=SimpleNamespace(name=f"csv_data_{csv_offset + i + 1}"), source_file=source)
+        for i, source in enumerate(csv_sources)
+    ]
+    tools += [
+        SimpleNamespace(metadata=SimpleNamespace(name=f"pdf_data_{pdf_offset + i + 1}"), source_file=source)
+        for i, source in enumerate(pdf_sources)
+    ]
+    return tools
+
+
+class TestFolderWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.previous_cwd = os.getcwd()
+        self.folder = tempfile.mkdtemp()
+        # Index directories and the manifest are relative to the working directory
+        os.chdir(self.folder)
+        os.makedirs(os.path.join("data", "csv"))
+        os.makedirs(os.path.join("data", "pdf"))
+        patches = [
+            mock.patch.object(folder_watcher, "create_csv_query_engine", lambda path, **kwargs: path),
+            mock.patch.object(folder_watcher, "create_tools_from_query_engines", fake_tools),
+            mock.patch.object(folder_watcher, "build_pdf_indexes", lambda paths, names: paths),
+            mock.patch.object(folder_watcher, "create_pdf_query_engine", lambda index, name: index),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.tools = []
+        self.changes = []
+
+    def tearDown(self):
+        os.chdir(self.previous_cwd)
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def watcher(self):
+        return FolderWatcher(
+            self.tools,
+            data_folder="data",
+            shared_pdf_index=False,
+            on_change=self.changes.append,
+        )
+
+    def write(self, name, text):
+        path = os.path.join("data", "csv" if name.endswith(".csv") else "pdf", name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def names(self):
+        return sorted(tool.metadata.name for tool in self.tools)
+
+    def test_new_file_is_added_once_it_stops_changing(self):
+        watcher = self.watcher()
+        path = self.write("a.csv", "x\n1\n")
+
+        self.assertEqual(watcher.poll(), [])
+        self.write("a.csv", "x\n1\n2\n")
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(watcher.poll(), [path])
+
+        self.assertEqual(self.names(), ["csv_data_1"])
+        self.assertEqual(self.changes, ["Added the tool csv_data_1 for a.csv."])
+        self.assertEqual(watcher.poll(), [])
+
+    def test_changed_file_replaces_its_tool(self):
+        path = self.write("a.csv", "x\n1\n")
+        self.write("b.csv", "x\n1\n")
+        self.tools.extend(fake_tools([], [], csv_sources=[path, os.path.join("data", "csv", "b.csv")]))
+        old = self.tools[0]
+        watcher = self.watcher()
+
+        self.write("a.csv", "x\n1\n2\n")
+        watcher.poll()
+        watcher.poll()
+
+        self.assertEqual(self.names(), ["csv_data_1", "csv_data_2"])
+        self.assertIsNot(self.tools[0], old)
+        self.assertEqual(self.changes, ["Updated the tool csv_data_1 for a.csv."])
+
+    def test_rename_removes_old_tool_and_adds_new_one(self):
+        path = self.write("a.csv", "x\n1\n")
+        self.tools.extend(fake_tools([], [], csv_sources=[path]))
+        watcher = self.watcher()
+
+        os.rename(path, os.path.join("data", "csv", "b.csv"))
+        watcher.poll()
+        self.assertEqual(self.tools, [])
+        watcher.poll()
+
+        self.assertEqual(len(self.tools), 1)
+        self.assertTrue(self.tools[0].source_file.endswith("b.csv"))
+        self.assertEqual(
+            self.changes,
+            ["Removed the tool csv_data_1 for a.csv.", "Added the tool csv_data_1 for b.csv."],
+        )
+
+    def test_deleted_pdf_removes_only_its_own_index(self):
+        report = self.write("report.pdf", "%PDF")
+        other = self.write("other.pdf", "%PDF")
+        for index_name in ("report", "other"):
+            os.makedirs(index_name)
+        # The "other" index was built from a file elsewhere with the same name
+        manifest = IndexManifest()
+        manifest.record("report", report, "hash", {})
+        manifest.record("other", report, "hash", {})
+        manifest.save()
+        self.tools.extend(fake_tools([], [], pdf_sources=[report, other]))
+        watcher = self.watcher()
+
+        os.remove(report)
+        os.remove(other)
+        self.assertEqual(watcher.poll(), sorted([report, other]))
+
+        self.assertEqual(self.tools, [])
+        self.assertFalse(os.path.exists("report"))
+        self.assertTrue(os.path.exists("other"))
+        self.assertEqual(list(IndexManifest.load().entries), ["other"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import unittest
+import warnings
+from types import SimpleNamespace
+from unittest import mock
+
+# Keep the real models from being built on import
+os.environ.setdefault("MODEL_SETUP", "none")
+
+from aiohttp.test_utils import TestClient, TestServer
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+
+from llm_core import http_server
+from llm_core.http_server import AgentServer, SessionStore
+
+
+class FakeAgent:
+    """Answers with the new prompt once release is set."""
+
+    def __init__(self, release):
+        self.release = release
+        self.prompts = []
+        self.resets = 0
+
+    def reset(self):
+        self.resets += 1
+
+    def chat(self, prompt):
+        self.release.wait()
+        self.prompts.append(prompt)
+        return f"Answer to {prompt.split('New prompt: ')[-1]}"
+
+    def stream_chat(self, prompt):
+        self.prompts.append(prompt)
+        deltas = ["Thought: I can answer.\nAnswer: ", "Hello", " there"]
+        return SimpleNamespace(response_gen=iter(deltas))
+
+
+class TestAgentServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.release = threading.Event()
+        self.release.set()
+        self.agents = []
+
+        def create_agent(tools, verbose=True, tool_router=None):
+            self.agents.append(FakeAgent(self.release))
+            return self.agents[-1]
+
+        patches = [
+            mock.patch.object(http_server, "create_agent", create_agent),
+            mock.patch.object(http_server, "groq_llm", None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.previous_embed_model = Settings._embed_model
+        Settings.embed_model = MockEmbedding(embed_dim=8)
+
+        self.server = AgentServer([], workers=1, max_queue=1)
+        self.client = TestClient(TestServer(self.server.app()))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        self.release.set()
+        await self.client.close()
+        Settings._embed_model = self.previous_embed_model
+
+    async def new_session(self):
+        response = await self.client.post("/sessions")
+        self.assertEqual(response.status, 201)
+        return (await response.json())["session_id"]
+
+    async def chat(self, session_id, body):
+        return await self.client.post(f"/sessions/{session_id}/chat", json=body)
+
+    async def test_session_lifecycle(self):
+        session_id = await self.new_session()
+
+        first = await self.chat(session_id, {"message": "first question"})
+        self.assertEqual(await first.json(), {"response": "Answer to first question"})
+        second = await self.chat(session_id, {"message": "second question"})
+        self.assertEqual(await second.json(), {"response": "Answer to second question"})
+
+        # The history comes from the session's memory; the agent is reset each turn
+        [agent] = self.agents
+        self.assertEqual(agent.resets, 2)
+        self.assertIn("first question", agent.prompts[1])
+        health = await (await self.client.get("/health")).json()
+        self.assertEqual(health["sessions"], 1)
+
+        response = await self.client.delete(f"/sessions/{session_id}")
+        self.assertEqual(response.status, 204)
+        response = await self.chat(session_id, {"message": "third question"})
+        self.assertEqual(response.status, 404)
+
+    async def test_bad_requests(self):
+        session_id = await self.new_session()
+
+        response = await self.client.post(f"/sessions/{session_id}/chat", data="not json")
+        self.assertEqual(response.status, 400)
+        response = await self.chat(session_id, {"message": "  "})
+        self.assertEqual(response.status, 400)
+        response = await self.chat("unknown", {"message": "hello"})
+        self.assertEqual(response.status, 404)
+        response = await self.client.delete("/sessions/unknown")
+        self.assertEqual(response.status, 404)
+
+    async def test_busy_server_refuses_with_503(self):
+        sessions = [await self.new_session() for _ in range(3)]
+        self.release.clear()
+
+        running = asyncio.create_task(self.chat(sessions[0], {"message": "one"}))
+        waiting = asyncio.create_task(self.chat(sessions[1], {"message": "two"}))
+        while not (self.server.running == 1 and self.server.waiting == 1):
+            await asyncio.sleep(0.01)
+
+        refused = await self.chat(sessions[2], {"message": "three"})
+        self.assertEqual(refused.status, 503)
+        self.assertEqual(refused.headers["Retry-After"], "1")
+
+        self.release.set()
+        self.assertEqual((await running).status, 200)
+        self.assertEqual((await waiting).status, 200)
+
+    async def test_streamed_answer(self):
+        session_id = await self.new_session()
+
+        response = await self.chat(session_id, {"message": "hello", "stream": True})
+
+        self.assertEqual(response.headers["Content-Type"], "text/event-stream")
+        events = (await response.text()).strip().split("\n\n")
+        deltas = [json.loads(event[len("data: ") :])["delta"] for event in events[:-1]]
+        self.assertEqual("".join(deltas), "Hello there")
+        self.assertEqual(events[-1], "event: done\ndata: {}")
+        # The streamed answer is remembered for the next turn
+        await self.chat(session_id, {"message": "again"})
+        self.assertIn("Hello there", self.agents[0].prompts[-1])
+
+
+class TestSessionStore(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(http_server, "create_agent", lambda *a, **k: object()),
+            mock.patch.object(http_server, "ConversationMemory", lambda **k: None),
+            mock.patch.object(http_server, "ToolRouter", lambda tools: None),
+            mock.patch.object(http_server, "Settings", SimpleNamespace(embed_model=None)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_session_deleted_during_get(self):
+        store = SessionStore([], max_sessions=4, ttl=60)
+        session_id = store.create().session_id
+        deleted = []
+
+        def monotonic():
+            # Another thread ends the session while get is updating it
+            if not deleted:
+                thread = threading.Thread(target=lambda: deleted.append(store.delete(session_id)))
+                thread.start()
+                thread.join(timeout=0.2)
+            return time.monotonic()
+
+        with mock.patch.object(http_server, "time", SimpleNamespace(monotonic=monotonic)):
+            session = store.get(session_id)
+            while not deleted:
+                time.sleep(0.01)
+
+        self.assertEqual(session.session_id, session_id)
+        self.assertEqual(deleted, [True])
+        self.assertEqual(len(store), 0)
+
+    def test_app_state_uses_app_keys(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+
+            async def start_and_stop():
+                client = TestClient(TestServer(AgentServer([], workers=1).app()))
+                await client.start_server()
+                await client.close()
+
+            asyncio.run(start_and_stop())
+
+
+if __name__ == "__main__":
+    unittest.main()
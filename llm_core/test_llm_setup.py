@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+from groq import AsyncGroq, Groq
+
+# Keep the real models from being built on import
+os.environ.setdefault("MODEL_SETUP", "none")
+
+from llm_core import llm_setup, sqlite_cache
+from llm_core.llm_setup import GroqLLM
+
+
+def completion(content):
+    return {
+        "id": "completion",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "test-model",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+class FakeGroqServer:
+    """Answers chat completions with the prompt in upper case, and records the requests."""
+
+    def __init__(self, answer=str.upper):
+        self.answer = answer
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body)
+        return httpx.Response(200, json=completion(self.answer(body["messages"][0]["content"])))
+
+    def llm(self, **kwargs) -> GroqLLM:
+        transport = httpx.MockTransport(self)
+        return GroqLLM(
+            model_name="test-model",
+            client=Groq(api_key="test", max_retries=0, http_client=httpx.Client(transport=transport)),
+            async_client=AsyncGroq(
+                api_key="test", max_retries=0, http_client=httpx.AsyncClient(transport=transport)
+            ),
+            **kwargs,
+        )
+
+
+def chunk(content):
+    return {
+        "id": "completion",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "test-model",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+
+
+class FakeStreamingServer(FakeGroqServer):
+    """
+    Streams fixed deltas as server-sent events when asked to stream, and
+    records how many events have been sent so far.
+    """
+
+    def __init__(self, deltas, asynchronous=False):
+        super().__init__(answer=lambda prompt: "".join(deltas))
+        self.deltas = deltas
+        self.asynchronous = asynchronous
+        self.sent = 0
+
+    def events(self):
+        for delta in self.deltas:
+            self.sent += 1
+            yield f"data: {json.dumps(chunk(delta))}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        if not body.get("stream"):
+            return super().__call__(request)
+        self.requests.append(body)
+        headers = {"content-type": "text/event-stream"}
+        if self.asynchronous:
+            # The async client reads an async stream
+            async def events():
+                for event in self.events():
+                    yield event
+
+            return httpx.Response(200, headers=headers, content=events())
+        return httpx.Response(200, headers=headers, content=self.events())
+
+
+class TestGroqLLM(unittest.TestCase):
+
+    deltas = ["Hel", "lo", " there"]
+
+    def test_stream_yields_deltas_as_they_arrive(self):
+        server = FakeStreamingServer(self.deltas)
+        llm = server.llm()
+
+        received = []
+        for response in llm.stream_complete("hi"):
+            # Each delta is yielded before the next event is sent
+            self.assertEqual(server.sent, len(received) + 1)
+            received.append(response.delta)
+
+        self.assertEqual(received, self.deltas)
+        self.assertEqual(response.text, "Hello there")
+        self.assertTrue(server.requests[0]["stream"])
+        # The concurrency slot held during the stream is given back
+        self.assertEqual(llm.scheduler._active, 0)
+
+    def test_async_paths_return_the_same_text(self):
+        server = FakeStreamingServer(self.deltas, asynchronous=True)
+        llm = server.llm()
+
+        async def run():
+            completed = await llm.acomplete("hi")
+            deltas = [response.delta async for response in await llm.astream_complete("hi")]
+            return completed.text, deltas
+
+        text, deltas = asyncio.run(run())
+
+        self.assertEqual(text, "Hello there")
+        self.assertEqual(deltas, self.deltas)
+        self.assertEqual([bool(r.get("stream")) for r in server.requests], [False, True])
+        self.assertEqual(llm.scheduler._active, 0)
+
+    def test_streamed_answer_is_cached(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        server = FakeStreamingServer(self.deltas)
+        llm = server.llm(cache_path=os.path.join(folder, "llm_cache.sqlite"))
+
+        list(llm.stream_complete("hi"))
+        [cached] = list(llm.stream_complete("hi"))
+
+        self.assertEqual(cached.text, "Hello there")
+        self.assertEqual(llm.complete("hi").text, "Hello there")
+        self.assertEqual(len(server.requests), 1)
+
+    def test_clients_share_a_bounded_connection_pool(self):
+        with mock.patch.dict(os.environ, {"GROQ_API_KEY": "test"}):
+            llm = GroqLLM(cache_path=None)
+        for client in (llm.client, llm.async_client):
+            pool = client._client._transport._pool
+            self.assertEqual(pool._max_connections, llm_setup.GROQ_MAX_CONNECTIONS)
+            self.assertEqual(pool._max_keepalive_connections, llm_setup.GROQ_MAX_CONNECTIONS)
+            self.assertEqual(client.max_retries, 0)
+
+
+class TestCompletionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "llm_cache.sqlite")
+        # Every read of the clock is a second later, so access times never tie
+        self.now = 0.0
+        patch = mock.patch.object(sqlite_cache, "time", SimpleNamespace(time=self.tick))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.server = FakeGroqServer()
+
+    def tick(self):
+        self.now += 1
+        return self.now
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_same_request_hits(self):
+        llm = self.server.llm(cache_path=self.path, scheduler=None)
+
+        self.assertEqual(llm.complete("hello").text, "HELLO")
+        self.assertEqual(llm.complete("hello").text, "HELLO")
+        # A new LLM on the same file, as after a restart, hits too
+        self.assertEqual(self.server.llm(cache_path=self.path).complete("hello").text, "HELLO")
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(llm.cache_stats()["hits"], 1)
+        self.assertEqual(llm.cache_stats()["misses"], 1)
+
+    def test_different_prompt_or_parameters_miss(self):
+        self.server.llm(cache_path=self.path).complete("hello")
+
+        self.server.llm(cache_path=self.path).complete("hello there")
+        self.server.llm(cache_path=self.path, temperature=0.5).complete("hello")
+        self.server.llm(cache_path=self.path, max_tokens=10).complete("hello")
+
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_expired_completion_is_requested_again(self):
+        llm = self.server.llm(cache_path=self.path, cache_ttl=10)
+        llm.complete("hello")
+        llm.complete("hello")
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.now += 10
+        llm.complete("hello")
+
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_least_recently_used_completion_is_evicted(self):
+        # Three answers of 400 kB do not fit in a 1 MB cache
+        server = FakeGroqServer(answer=lambda prompt: prompt * 400_000)
+        llm = server.llm(cache_path=self.path, cache_max_mb=1)
+        llm.complete("a")
+        llm.complete("b")
+        llm.complete("a")
+
+        llm.complete("c")
+        self.assertEqual(len(server.requests), 3)
+
+        llm.complete("a")
+        self.assertEqual(len(server.requests), 3)
+        llm.complete("b")
+        self.assertEqual(len(server.requests), 4)
+
+    def test_disabled_without_a_path(self):
+        llm = self.server.llm(cache_path=None)
+
+        llm.complete("hello")
+        llm.complete("hello")
+
+        self.assertIsNone(llm.cache_stats())
+        self.assertEqual(len(self.server.requests), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import groq
+import httpx
+
+from llm_core import rate_limiter
+from llm_core.rate_limiter import (
+    BACKGROUND,
+    INTERACTIVE,
+    RequestScheduler,
+    TokenBucket,
+    request_lane,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def rate_limit_error(retry_after=None):
+    headers = {"retry-after": retry_after} if retry_after else {}
+    response = httpx.Response(
+        429, headers=headers, request=httpx.Request("POST", "https://api.groq.com")
+    )
+    return groq.RateLimitError("rate limited", response=response, body=None)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_refills_continuously_up_to_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)
+
+        bucket.consume(60)
+        self.assertEqual(bucket.delay(30), 30.0)
+        clock.now = 10
+        self.assertEqual(bucket.delay(30), 20.0)
+        clock.now = 30
+        self.assertEqual(bucket.delay(30), 0.0)
+        clock.now = 1000
+        bucket.delay(0)
+        self.assertEqual(bucket.level, 60)
+
+    def test_overdraft_is_paid_back(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)
+
+        # A request that used more than estimated drives the level negative
+        bucket.consume(90)
+        self.assertEqual(bucket.delay(1), 31.0)
+
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def test_interactive_lane_is_served_first(self):
+        scheduler = RequestScheduler(max_concurrency=1)
+        scheduler.acquire()
+        served = []
+
+        def request(lane, name):
+            with request_lane(lane):
+                scheduler.acquire()
+            served.append(name)
+            scheduler.release()
+
+        threads = [
+            threading.Thread(target=request, args=(BACKGROUND, "summary")),
+            threading.Thread(target=request, args=(INTERACTIVE, "answer")),
+        ]
+        for thread in threads:
+            thread.start()
+            # Start the next one only once this one is queued
+            while len(scheduler._waiting) < threads.index(thread) + 1:
+                time.sleep(0.001)
+        scheduler.release()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertEqual(served, ["answer", "summary"])
+
+    def test_retries_with_capped_exponential_backoff(self):
+        sleeps = []
+        scheduler = RequestScheduler(max_retries=4, base_delay=1, max_delay=5, sleep=sleeps.append)
+        outcomes = [rate_limit_error()] * 4 + ["done"]
+
+        def fn():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        # The upper bound of each jittered delay
+        with mock.patch.object(rate_limiter.random, "uniform", lambda low, high: high):
+            self.assertEqual(scheduler.call(fn), "done")
+
+        self.assertEqual(sleeps, [1, 2, 4, 5])
+        self.assertEqual(scheduler._active, 0)
+
+    def test_honours_retry_after_and_gives_up(self):
+        sleeps = []
+        scheduler = RequestScheduler(max_retries=2, base_delay=0, sleep=sleeps.append)
+
+        def fn():
+            raise rate_limit_error(retry_after="7")
+
+        with self.assertRaises(groq.RateLimitError):
+            scheduler.call(fn)
+
+        self.assertEqual(sleeps, [7.0, 7.0])
+        self.assertEqual(scheduler._active, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,8 +5,10 @@ import pandas as pd
 from llama_index.experimental.query_engine import PandasQueryEngine
 from llama_index.core.tools import QueryEngineTool, ToolMetadata
 from llama_index.core.agent import ReActAgent
+from llama_index.core import Settings
 
 from setup_llm import groq_llm
+from llm_core.conversation_memory import ConversationMemory
 from engines_factory.excel_note_engine import excel_note_engine
 from prompts import new_prompt, instruction_str, context
 from pdf import canada_engine
@@ -39,35 +41,13 @@ tools = [
 
 agent = ReActAgent.from_tools(tools, llm=groq_llm, verbose=True, context=context)
 
-# Initialize history as a list of dictionaries
-history = []
-
-
-def add_to_history(prompt, response):
-    # Add a new entry to the history
-    history.append({"prompt": prompt, "response": response})
-    # Limit history to the last 5 interactions
-    if len(history) > 5:
-        history.pop(0)
-
-
-def get_relevant_history():
-    # Optionally, filter or summarize history here
-    return "\n".join(
-        [
-            f"Prompt: {entry['prompt']}\nResponse: {entry['response']}"
-            for entry in history
-        ]
-    )
+# Keep the conversation within a token budget per turn
+memory = ConversationMemory(llm=groq_llm, embed_model=Settings.embed_model)
 
 
 while (prompt := input("Enter a prompt (q to quit): ")) != "q":
-    # Get relevant history
-    relevant_history = get_relevant_history()
-    # Query the agent with the current prompt and relevant history
-    result = agent.query(
-        f"Here is the relevant history:\n{relevant_history}\n\nNew prompt: {prompt}"
-    )
-    # Add the current interaction to history
-    add_to_history(prompt, result)
+    # Query the agent with the current prompt and the history relevant to it
+    result = agent.query(memory.build_prompt(prompt))
     print(result)
+    # Add the current interaction to the memory
+    memory.add(prompt, result)